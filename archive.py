@@ -0,0 +1,183 @@
+"""أرشفة التوزيعات المسددة القديمة ودفعاتها إلى distribution_archive.db
+
+الملف الحي يبقى صغيراً (الأرصدة المفتوحة والأيام الأخيرة)، والتقارير وسجل العميل
+تضيف الأرشيف (ATTACH + UNION ALL) فقط عندما تشمل الفترة المطلوبة تواريخ مؤرشفة
+(انظر Database.source).
+
+    python -m cli archive --days 365 --vacuum
+
+ينقل توزيعاً إذا كان مسدداً بالكامل وأقدم من المدة، ودفعة إذا كانت أقدم من المدة
+وكل أسطر توزيعها على توزيعات منقولة (فلا تنفصل دفعة عن توزيعاتها).
+الأرشيف يحمل إجمالياته اليومية الخاصة فتجمع تقارير الفترات الجزأين.
+مع WAL لا يكون الحفظ ذرياً بين ملفين، فالنقل معاملتان: النسخ إلى الأرشيف ثم الحذف من
+الملف الحي لما وصل إلى الأرشيف فقط. النسخ يستبدل الصفوف بنفس المعرف، فإعادة التشغيل
+بعد انقطاع بين المعاملتين تكمل النقل.
+الصفوف التي لها تغييرات لم ترسل بعد إلى جهاز مزامنة (انظر sync.py) لا تنقل حتى ترسل.
+"""
+from datetime import datetime, timedelta
+
+DEFAULT_AGE_DAYS = 365
+
+# نفس ترتيب أعمدة الجداول الحية (تجمع معها بـ SELECT *)
+ARCHIVE_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS archive.distributions (
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER,
+        distribution_date DATE,
+        quantity_kg REAL,
+        price_per_kg REAL,
+        total_amount REAL,
+        paid_amount REAL,
+        remaining_amount REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.payments (
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER,
+        payment_date DATE,
+        amount REAL,
+        payment_method TEXT,
+        description TEXT,
+        distribution_id INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.payment_allocations (
+        payment_id INTEGER NOT NULL,
+        distribution_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY (payment_id, distribution_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.daily_client_totals (
+        day DATE NOT NULL,
+        client_id INTEGER NOT NULL,
+        distribution_count INTEGER NOT NULL DEFAULT 0,
+        total_kg REAL NOT NULL DEFAULT 0,
+        total_amount REAL NOT NULL DEFAULT 0,
+        total_paid REAL NOT NULL DEFAULT 0,
+        total_remaining REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, client_id)
+    ) WITHOUT ROWID
+    ''',
+    """CREATE INDEX IF NOT EXISTS archive.idx_distributions_client_date
+       ON distributions (client_id, distribution_date)""",
+    """CREATE INDEX IF NOT EXISTS archive.idx_distributions_date_id
+       ON distributions (distribution_date, id)""",
+    """CREATE INDEX IF NOT EXISTS archive.idx_payments_client_date
+       ON payments (client_id, payment_date)""",
+)
+
+# الصفوف المرشحة للنقل (جداول مؤقتة في اتصال المهمة)
+SELECT_CANDIDATES = (
+    "CREATE TEMP TABLE IF NOT EXISTS archive_d (id INTEGER PRIMARY KEY)",
+    "CREATE TEMP TABLE IF NOT EXISTS archive_p (id INTEGER PRIMARY KEY)",
+    "DELETE FROM temp.archive_d",
+    "DELETE FROM temp.archive_p",
+    """INSERT INTO temp.archive_d
+       SELECT id FROM distributions INDEXED BY idx_distributions_date_id
+       WHERE distribution_date < :cutoff AND remaining_amount <= 0.005
+         AND id NOT IN (SELECT row_id FROM sync_journal
+                        WHERE seq > :synced AND tbl = 'distributions')""",
+)
+# دفعات قديمة كل أسطر توزيعها على توزيعات مرشحة
+SELECT_PAYMENTS = (
+    "DELETE FROM temp.archive_p",
+    """INSERT INTO temp.archive_p
+       SELECT DISTINCT a.payment_id
+       FROM payment_allocations a INDEXED BY idx_payment_allocations_distribution
+       JOIN payments p ON p.id = a.payment_id
+       WHERE a.distribution_id IN temp.archive_d AND p.payment_date < :cutoff
+         AND p.id NOT IN (SELECT row_id FROM sync_journal WHERE seq > :synced AND tbl = 'payments')
+         AND NOT EXISTS (SELECT 1 FROM payment_allocations o
+                         WHERE o.payment_id = a.payment_id
+                           AND o.distribution_id NOT IN temp.archive_d)""",
+)
+# توزيعات لها دفعة لن تنقل تبقى في الملف الحي
+DROP_LINKED = """
+    DELETE FROM temp.archive_d WHERE id IN (
+        SELECT a.distribution_id FROM payment_allocations a INDEXED BY idx_payment_allocations_distribution
+        WHERE a.distribution_id IN temp.archive_d AND a.payment_id NOT IN temp.archive_p
+    )
+"""
+# المعاملة الأولى: النسخ إلى الأرشيف
+COPY = (
+    "INSERT OR REPLACE INTO archive.distributions SELECT * FROM main.distributions WHERE id IN temp.archive_d",
+    "INSERT OR REPLACE INTO archive.payments SELECT * FROM main.payments WHERE id IN temp.archive_p",
+    """INSERT OR REPLACE INTO archive.payment_allocations
+       SELECT * FROM main.payment_allocations WHERE payment_id IN temp.archive_p""",
+    # إجماليات الأيام المتأثرة تعاد من توزيعات الأرشيف (لا تتكرر عند إعادة التشغيل)
+    """INSERT OR REPLACE INTO archive.daily_client_totals
+       SELECT distribution_date, client_id, COUNT(*),
+              COALESCE(SUM(quantity_kg), 0), COALESCE(SUM(total_amount), 0),
+              COALESCE(SUM(paid_amount), 0), COALESCE(SUM(remaining_amount), 0)
+       FROM archive.distributions
+       WHERE (distribution_date, client_id) IN (
+           SELECT distribution_date, client_id FROM main.distributions WHERE id IN temp.archive_d
+       )
+       GROUP BY distribution_date, client_id""",
+)
+# المعاملة الثانية: حذف ما وصل إلى الأرشيف من الملف الحي
+DELETE_MOVED = (
+    # أسطر التوزيع تحذف معها (ON DELETE CASCADE)، والأرصدة والإجماليات عبر المشغلات؛
+    # الأسماء بدون بادئة تعني الملف الحي (وتسجل كتعديل لجداوله)
+    "DELETE FROM payments WHERE id IN temp.archive_p AND id IN (SELECT id FROM archive.payments)",
+    "DELETE FROM distributions WHERE id IN temp.archive_d AND id IN (SELECT id FROM archive.distributions)",
+    # النقل ليس حذفاً: لا يرسل إلى الأجهزة الأخرى عند المزامنة (تغييراتها السابقة أرسلت كلها)
+    """DELETE FROM sync_journal
+       WHERE (tbl = 'distributions' AND row_id IN temp.archive_d)
+          OR (tbl = 'payments' AND row_id IN temp.archive_p)""",
+)
+
+
+def archive_settled(db, older_than_days=DEFAULT_AGE_DAYS, today=None, vacuum=False):
+    """نقل التوزيعات المسددة الأقدم من older_than_days يوماً ودفعاتها إلى الأرشيف
+    (نسخ ثم حذف في معاملتين). يرجع (عدد التوزيعات، عدد الدفعات)"""
+    if older_than_days < 0:
+        raise ValueError("مدة الأرشفة يجب أن تكون موجبة")
+    cutoff = str((today or datetime.now().date()) - timedelta(days=older_than_days))
+    params = {"cutoff": cutoff}
+
+    # الربط قبل بدء المعاملة (ATTACH غير مسموح داخلها)
+    db.attach_archive(create=True)
+    with db.transaction() as tx:
+        for statement in ARCHIVE_SCHEMA:
+            tx.execute(statement)
+        # آخر تغيير وصل إلى كل الأجهزة المعروفة (بدون أجهزة: لا شيء ينتظر الإرسال)
+        params["synced"] = tx.fetch_one("""
+            SELECT COALESCE(MIN(sent_seq), (SELECT COALESCE(MAX(seq), 0) FROM sync_journal))
+            FROM sync_peers
+        """)[0]
+        for statement in SELECT_CANDIDATES:
+            tx.execute(statement, params)
+        while True:
+            for statement in SELECT_PAYMENTS:
+                tx.execute(statement, params)
+            if not tx.execute(DROP_LINKED).rowcount:
+                break
+
+        distributions, payments, newest = tx.fetch_one("""
+            SELECT (SELECT COUNT(*) FROM temp.archive_d), (SELECT COUNT(*) FROM temp.archive_p),
+                   MAX((SELECT MAX(distribution_date) FROM distributions WHERE id IN temp.archive_d),
+                       COALESCE((SELECT MAX(payment_date) FROM payments WHERE id IN temp.archive_p), ''))
+        """)
+        if distributions or payments:
+            for statement in COPY:
+                tx.execute(statement)
+
+    if distributions or payments:
+        with db.transaction() as tx:
+            for statement in DELETE_MOVED:
+                tx.execute(statement)
+            tx.execute("""
+                INSERT INTO archive_state (key, value) VALUES ('archived_through', ?)
+                ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)
+            """, (newest,))
+
+    if vacuum and (distributions or payments):
+        # استرجاع المساحة المحررة من الملف الحي
+        db.get_connection().execute("VACUUM main")
+    return distributions, payments
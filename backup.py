@@ -0,0 +1,297 @@
+"""النسخ الاحتياطي والاستعادة أثناء عمل البرنامج بواجهة النسخ في SQLite
+
+النسخ يتم على خطوات (عدد محدود من الصفحات في كل خطوة) من لقطة قراءة ثابتة:
+مع WAL لا تنتظر الكتابات انتهاء النسخ، ولا يعاد النسخ من البداية إذا تغيرت القاعدة
+أثناءه. النسخة تكتب في ملف مؤقت ويتحقق من سلامتها قبل اعتمادها.
+ملف الأرشيف (distribution_archive.db، انظر archive.py) ينسخ مع القاعدة في نفس المجموعة
+(distribution-<الوقت>.db و distribution-<الوقت>_archive.db) ويستعادان معاً.
+
+    python -m cli backup                      نسخة في مجلد النسخ مع حذف الأقدم
+    python -m cli backup --if-due             حسب الجدولة المحفوظة (للمهام المجدولة)
+    python -m cli backup copy.db.gz           نسخة واحدة (مضغوطة حسب الامتداد)
+    python -m cli restore backups/distribution-20240101-120000.db.gz
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from archive import ARCHIVE_SCHEMA
+
+BACKUP_PAGES = 256
+DEFAULT_KEEP = 7
+CHUNK_SIZE = 1024 * 1024
+
+
+class BackupError(Exception):
+    """فشل التحقق من سلامة النسخة"""
+
+
+class BackupCancelled(Exception):
+    """أوقف المستخدم النسخ قبل اكتماله"""
+
+
+def check_integrity(conn):
+    """التحقق من سلامة قاعدة بيانات (PRAGMA integrity_check)"""
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"النسخة تالفة: {e}") from e
+    if problems != ["ok"]:
+        raise BackupError("النسخة تالفة: " + "; ".join(problems[:5]))
+
+
+def compress_file(source, target, cancelled=None):
+    with open(source, "rb") as src, gzip.open(target, "wb", compresslevel=6) as dst:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            dst.write(chunk)
+            if cancelled and cancelled():
+                raise BackupCancelled()
+
+
+def archive_companion(path):
+    """ملف الأرشيف المرافق لنسخة بنفس قاعدة Database.archive_path
+    (distribution-X.db.gz -> distribution-X_archive.db.gz)"""
+    for suffix in (".db.gz", ".db"):
+        if path.endswith(suffix):
+            return path[:-len(suffix)] + "_archive" + suffix
+    root, ext = os.path.splitext(path)
+    return root + "_archive" + ext
+
+
+def is_archive_companion(path):
+    return path.endswith(("_archive.db", "_archive.db.gz"))
+
+
+def empty_archive():
+    """أرشيف فارغ بجداوله (يستبدل به أرشيف لا يوجد في النسخة)"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("ATTACH DATABASE ':memory:' AS archive")
+    for statement in ARCHIVE_SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+def page_count(db_name):
+    conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+    try:
+        return conn.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def online_backup(db_name, target, pages=BACKUP_PAGES, compress=None, progress=None, cancelled=None):
+    """نسخ قاعدة البيانات db_name إلى target على خطوات من pages صفحة.
+    progress(الصفحات المنسوخة، الإجمالي) بعد كل خطوة و cancelled() توقف النسخ.
+    تضغط النسخة (gzip) إذا كان compress صحيحاً أو انتهى target بـ .gz. يرجع مسار النسخة"""
+    if compress is None:
+        compress = target.endswith(".gz")
+    part = target + ".part"
+    source = sqlite3.connect(db_name)
+    try:
+        # لقطة قراءة تبقى مفتوحة طوال النسخ فتكون النسخة متسقة
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        def on_step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            if cancelled and cancelled():
+                raise BackupCancelled()
+
+        dest = sqlite3.connect(part)
+        try:
+            source.backup(dest, pages=pages, progress=on_step)
+            # النسخة ملف واحد مستقل (بدون ملف WAL)
+            dest.execute("PRAGMA journal_mode = DELETE")
+            check_integrity(dest)
+        finally:
+            dest.close()
+        source.rollback()
+
+        if compress:
+            compress_file(part, target + ".tmp", cancelled)
+            os.replace(target + ".tmp", target)
+            os.remove(part)
+        else:
+            os.replace(part, target)
+    except BaseException:
+        for leftover in (part, target + ".tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    finally:
+        source.close()
+    return target
+
+
+def backup_set(db, target, pages=BACKUP_PAGES, compress=None, progress=None, cancelled=None):
+    """نسخ القاعدة وملف أرشيفها (إن وجد) إلى target و archive_companion(target).
+    القاعدة تنسخ أولاً: إذا نقلت الأرشفة صفوفاً بين النسختين ظهرت في الملفين (تكملها
+    الأرشفة التالية) ولا تضيع. progress بعدد صفحات الملفين معاً. يرجع مسار النسخة"""
+    archive = db.archive_path if os.path.exists(db.archive_path) else None
+    main_pages = page_count(db.db_name)
+    archive_pages = page_count(archive) if archive else 0
+
+    def main_progress(copied, total):
+        if progress:
+            progress(copied, total + archive_pages)
+
+    def archive_progress(copied, total):
+        if progress:
+            progress(main_pages + copied, main_pages + total)
+
+    online_backup(db.db_name, target, pages, compress, main_progress, cancelled)
+    companion = archive_companion(target)
+    try:
+        if archive:
+            online_backup(archive, companion, pages, compress, archive_progress, cancelled)
+        elif os.path.exists(companion):
+            os.remove(companion)
+    except BaseException:
+        os.remove(target)
+        raise
+    return target
+
+
+def restore_backup(db, path, before_replace=None, progress=None):
+    """استبدال محتوى قاعدة البيانات وملف أرشيفها بمجموعة نسخة (مضغوطة أو لا) بعد التحقق
+    من سلامة الملفين. نسخة بدون أرشيف تفرغ الأرشيف الحالي (صفوفه في النسخة نفسها).
+    يتم عبر SQLite نفسها فتبقى الاتصالات المفتوحة صالحة وترى المحتوى الجديد.
+    before_replace() تستدعى بعد التحقق وقبل الاستبدال، و progress(الصفحات، الإجمالي) أثناءه"""
+    if is_archive_companion(path):
+        raise BackupError("هذا ملف الأرشيف المرافق لنسخة؛ اختر ملف النسخة نفسه")
+    archive = archive_companion(path)
+    pairs = [(path, db.db_name)]
+    if os.path.exists(archive):
+        pairs.append((archive, db.archive_path))
+    elif os.path.exists(db.archive_path):
+        pairs.append((None, db.archive_path))
+
+    temporaries = []
+    sources = []
+    try:
+        for source, target in pairs:
+            if source and source.endswith(".gz"):
+                fd, temporary = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(target)))
+                temporaries.append(temporary)
+                with os.fdopen(fd, "wb") as dst, gzip.open(source, "rb") as src:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                source = temporary
+            if source:
+                conn, name = sqlite3.connect(f"file:{source}?mode=ro", uri=True), "main"
+            else:
+                conn, name = empty_archive(), "archive"
+            sources.append((conn, name, target))
+            check_integrity(conn)
+        if before_replace:
+            before_replace()
+        total = sum(conn.execute(f"PRAGMA {name}.page_count").fetchone()[0] for conn, name, _ in sources)
+        done = 0
+        for conn, name, target in sources:
+            def on_step(status, remaining, pages):
+                if progress:
+                    progress(done + pages - remaining, total)
+
+            dest = sqlite3.connect(target, timeout=30)
+            try:
+                conn.backup(dest, pages=BACKUP_PAGES, progress=on_step, name=name)
+            finally:
+                dest.close()
+            done += conn.execute(f"PRAGMA {name}.page_count").fetchone()[0]
+    finally:
+        for conn, _, _ in sources:
+            conn.close()
+        for temporary in temporaries:
+            os.remove(temporary)
+    # نسخة أقدم قد تحتاج ترحيلات المخطط؛ والشاشات تعيد القراءة
+    db.migrate()
+    db.mark_changed(*(row[0] for row in db.fetch_all(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+    )))
+
+
+class BackupManager:
+    """نسخ دورية في مجلد مع الاحتفاظ بآخر keep نسخة؛ الإعدادات محفوظة في القاعدة"""
+    SETTINGS = {
+        "backup.directory": "",
+        "backup.keep": str(DEFAULT_KEEP),
+        "backup.interval_hours": "24",
+        "backup.compress": "0",
+    }
+
+    def __init__(self, db, directory=None, keep=DEFAULT_KEEP, interval_hours=24, compress=False):
+        self.db = db
+        base = os.path.abspath(db.db_name)
+        self.directory = directory or os.path.join(os.path.dirname(base), "backups")
+        self.prefix = os.path.splitext(os.path.basename(base))[0] + "-"
+        self.keep = keep
+        self.interval_hours = interval_hours
+        self.compress = compress
+
+    @classmethod
+    def load(cls, db):
+        """مدير النسخ بالإعدادات المحفوظة"""
+        settings = dict(cls.SETTINGS, **db.get_settings("backup."))
+        return cls(db, settings["backup.directory"] or None, int(settings["backup.keep"]),
+                   float(settings["backup.interval_hours"]), settings["backup.compress"] == "1")
+
+    def save(self):
+        self.db.set_settings({
+            "backup.directory": self.directory,
+            "backup.keep": self.keep,
+            "backup.interval_hours": self.interval_hours,
+            "backup.compress": int(self.compress),
+        })
+
+    def backups(self):
+        """النسخ الموجودة من الأحدث إلى الأقدم"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(self.prefix) and name.endswith((".db", ".db.gz"))
+                 and not is_archive_companion(name)]
+        return [os.path.join(self.directory, name) for name in sorted(names, reverse=True)]
+
+    def last_backup_time(self):
+        backups = self.backups()
+        return datetime.fromtimestamp(os.path.getmtime(backups[0])) if backups else None
+
+    def due(self):
+        """هل حان موعد النسخة التالية حسب الجدولة (interval_hours = 0 يعطلها)"""
+        if not self.interval_hours:
+            return False
+        last = self.last_backup_time()
+        return last is None or (datetime.now() - last).total_seconds() >= self.interval_hours * 3600
+
+    def run(self, progress=None, cancelled=None):
+        """نسخة جديدة ثم حذف ما زاد عن keep. يرجع مسار النسخة"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.prefix}{datetime.now():%Y%m%d-%H%M%S}.db" + (".gz" if self.compress else "")
+        path = backup_set(self.db, os.path.join(self.directory, name),
+                          compress=self.compress, progress=progress, cancelled=cancelled)
+        self.prune()
+        return path
+
+    def prune(self):
+        for path in self.backups()[max(self.keep, 1):]:
+            os.remove(path)
+            if os.path.exists(archive_companion(path)):
+                os.remove(archive_companion(path))
+
+    def restore(self, path, progress=None):
+        """استعادة نسخة بعد حفظ نسخة من الوضع الحالي. يرجع مسار نسخة الأمان.
+        progress تستدعى لكل من الخطوتين (نسخة الأمان ثم الاستبدال)"""
+        safety = os.path.join(self.directory, f"before-restore-{datetime.now():%Y%m%d-%H%M%S}.db")
+
+        def save_current():
+            os.makedirs(self.directory, exist_ok=True)
+            backup_set(self.db, safety, progress=progress)
+
+        restore_backup(self.db, path, save_current, progress)
+        return safety
@@ -0,0 +1,425 @@
+"""مولد بيانات تجريبية وقياس أداء طبقة النماذج
+
+أمثلة:
+    python -m benchmark generate --clients 2000 --days 365 --distributions 100000 --payments 20000
+    python -m benchmark run --sizes 1000,100000,1000000 --output results.json
+    python -m benchmark writes --count 2000 --batches 1,10,100
+    python -m benchmark compare old.json new.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+from models import Database, ClientModel, DistributionModel, PaymentModel
+
+FIRST_NAMES = ("محمد", "أحمد", "علي", "يوسف", "إبراهيم", "خالد", "عمر", "سعيد", "عبد الله",
+               "مصطفى", "حسين", "فاطمة", "عائشة", "خديجة", "مريم", "زينب", "سارة", "أمينة")
+LAST_NAMES = ("بن علي", "بوزيد", "حمدي", "بلقاسم", "مزيان", "سعدي", "عمراني", "بن يوسف",
+              "قاسمي", "شريف", "بوعلام", "رحماني", "زروقي", "بن عمر", "مسعودي", "حداد")
+DISTRICTS = ("حي النصر", "حي السلام", "وسط المدينة", "حي الأمل", "حي الفتح", "الحي الجديد",
+             "حي البساتين", "حي الشهداء")
+PAYMENT_METHODS = ("نقدي", "نقدي", "نقدي", "تحويل", "شيك")
+
+
+def generate_clients(rnd, count):
+    for _ in range(count):
+        name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+        phone = f"0{rnd.choice('567')}{rnd.randrange(10**8):08d}"
+        address = f"{rnd.choice(DISTRICTS)} {rnd.randint(1, 200)}"
+        created = date(2020, 1, 1) + timedelta(days=rnd.randrange(365))
+        yield name, address, phone, str(created), True
+
+
+def generate_prices(rnd, days, end_date):
+    """سعر يومي يتغير تدريجياً حول 100 د.ج/كغ"""
+    price = 100.0
+    start = end_date - timedelta(days=days - 1)
+    for offset in range(days):
+        price = min(max(price + rnd.gauss(0, 1.5), 60.0), 160.0)
+        yield str(start + timedelta(days=offset)), round(price, 2)
+
+
+def client_weights(count):
+    """قلة من العملاء تأخذ معظم الكميات (توزيع Zipf تقريبي)"""
+    return list(accumulate(1 / (rank + 1) ** 0.8 for rank in range(count)))
+
+
+def generate_distributions(rnd, count, client_ids, prices):
+    cum_weights = client_weights(len(client_ids))
+    for _ in range(count):
+        client_id = rnd.choices(client_ids, cum_weights=cum_weights)[0]
+        day, price = rnd.choice(prices)
+        # الكميات بتوزيع لوغاريتمي طبيعي: غالبها بين 5 و 60 كغ
+        quantity = round(min(rnd.lognormvariate(3.0, 0.6), 500.0), 1)
+        total = round(quantity * price, 2)
+        paid_kind = rnd.random()
+        if paid_kind < 0.4:
+            paid = total
+        elif paid_kind < 0.7:
+            paid = round(total * rnd.uniform(0.2, 0.9), 2)
+        else:
+            paid = 0.0
+        yield client_id, day, quantity, price, total, paid, round(total - paid, 2)
+
+
+def generate_payments(rnd, count, client_ids, days):
+    cum_weights = client_weights(len(client_ids))
+    for _ in range(count):
+        client_id = rnd.choices(client_ids, cum_weights=cum_weights)[0]
+        amount = round(rnd.lognormvariate(7.5, 0.8), 2)
+        yield client_id, rnd.choice(days), amount, rnd.choice(PAYMENT_METHODS), "دفعة", None
+
+
+def generate(db, clients, days, distributions, payments, seed=0, end_date=None):
+    """تعبئة قاعدة البيانات ببيانات تجريبية قابلة للتكرار (نفس البذرة = نفس البيانات)"""
+    rnd = random.Random(seed)
+    end_date = end_date or datetime.now().date()
+
+    db.execute_many(
+        "INSERT INTO clients (name, address, phone, created_date, is_active) VALUES (?, ?, ?, ?, ?)",
+        generate_clients(rnd, clients)
+    )
+    client_ids = [row[0] for row in db.fetch_all("SELECT id FROM clients ORDER BY id")]
+
+    prices = list(generate_prices(rnd, days, end_date))
+    db.execute_many(
+        "INSERT OR REPLACE INTO product_prices (price_date, price_per_kg) VALUES (?, ?)", prices
+    )
+    db.execute_many(
+        """INSERT INTO distributions
+           (client_id, distribution_date, quantity_kg, price_per_kg,
+            total_amount, paid_amount, remaining_amount)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        generate_distributions(rnd, distributions, client_ids, prices)
+    )
+    # الدفعات بالترتيب الزمني وبنفس توزيع PaymentModel على التوزيعات المفتوحة (الأقدم أولاً)
+    generated = sorted(generate_payments(rnd, payments, client_ids, [day for day, _ in prices]),
+                       key=lambda payment: payment[1])
+    with db.transaction() as tx:
+        for payment in generated:
+            payment_id = tx.execute(
+                """INSERT INTO payments
+                   (client_id, payment_date, amount, payment_method, description, distribution_id)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                payment
+            ).lastrowid
+            tx.execute(PaymentModel.ALLOCATE, {
+                "payment_id": payment_id, "client_id": payment[0],
+                "amount": payment[2], "distribution_id": payment[5],
+            })
+            tx.execute(PaymentModel.APPLY_ALLOCATIONS, (payment_id,))
+    db.execute_query("ANALYZE")
+
+
+def dataset_shape(distributions):
+    """أحجام الجداول المرافقة لعدد التوزيعات المطلوب"""
+    return {
+        "clients": max(50, min(distributions // 50, 20000)),
+        "days": max(30, min(distributions // 100, 3 * 365)),
+        "distributions": distributions,
+        "payments": distributions // 5,
+    }
+
+
+def benchmark_calls(db, workdir):
+    """الاستدعاءات المقاسة لكل دالة عامة في النماذج: {الاسم: (دالة، هل تكتب)}"""
+    clients = ClientModel(db)
+    distributions = DistributionModel(db)
+    payments = PaymentModel(db)
+
+    client_id = db.fetch_one(
+        "SELECT client_id FROM daily_client_totals GROUP BY client_id ORDER BY SUM(distribution_count) DESC LIMIT 1"
+    )[0]
+    last_day = db.fetch_one("SELECT MAX(price_date) FROM product_prices")[0]
+    end = datetime.strptime(last_day, "%Y-%m-%d").date()
+    month_start, year_start = str(end - timedelta(days=30)), str(end - timedelta(days=365))
+    newest_id = db.fetch_one("SELECT MAX(id) FROM distributions")[0]
+    payment_id = db.fetch_one("SELECT MAX(payment_id) FROM payment_allocations")[0]
+
+    csv_path = os.path.join(workdir, "import.csv")
+    client_ids = [row[0] for row in db.fetch_all("SELECT id FROM clients LIMIT 100")]
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for i in range(1000):
+            writer.writerow([client_ids[i % len(client_ids)], 10 + i % 40, 0, last_day])
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        csv_lines = f.read().splitlines()
+
+    def add_then_delete():
+        distributions.delete_distribution(distributions.add_distribution(client_id, 12.5, 0, last_day))
+
+    new_client = clients.add_client("عميل القياس", "حي القياس", "0500000000")
+
+    def uncached_summary():
+        distributions._summary_cache = None
+        return distributions.dashboard_summary(last_day)
+
+    return {
+        "ClientModel.add_client": (lambda: clients.add_client("عميل جديد", "حي النصر", "0555000000"), True),
+        "ClientModel.get_all_clients": (clients.get_all_clients, False),
+        "ClientModel.get_client_by_id": (lambda: clients.get_client_by_id(client_id), False),
+        "ClientModel.update_client": (
+            lambda: clients.update_client(new_client, "عميل القياس", "حي القياس", "0500000001"), True),
+        "ClientModel.delete_client": (lambda: clients.delete_client(new_client), True),
+        "ClientModel.load_search_index": (clients.load_search_index, False),
+        "ClientModel.search_clients": (lambda: clients.search_clients("محمد ب"), False),
+        "ClientModel.get_client_balance": (lambda: clients.get_client_balance(client_id), False),
+        "ClientModel.get_clients_with_balances": (clients.get_clients_with_balances, False),
+        "ClientModel.get_client_with_balance": (lambda: clients.get_client_with_balance(client_id), False),
+        "ClientModel.get_clients_page": (lambda: clients.get_clients_page(("", 0)), False),
+        "ClientModel.get_opening_balance": (lambda: clients.get_opening_balance(client_id, month_start), False),
+        "ClientModel.get_client_statement": (lambda: clients.get_client_statement(client_id, month_start), False),
+        "ClientModel.verify_balances": (clients.verify_balances, False),
+        "DistributionModel.set_today_price": (lambda: distributions.set_today_price(100.0), True),
+        "DistributionModel.set_price": (lambda: distributions.set_price(101.0, last_day), True),
+        "DistributionModel.get_price_history": (distributions.get_price_history, False),
+        "DistributionModel.load_prices": (distributions.load_prices, False),
+        "DistributionModel.get_today_price": (distributions.get_today_price, False),
+        "DistributionModel.get_price_on": (lambda: distributions.get_price_on(month_start), False),
+        "DistributionModel.add_distribution": (
+            lambda: distributions.add_distribution(client_id, 12.5, 0, last_day), True),
+        "DistributionModel.delete_distribution": (add_then_delete, True),
+        "DistributionModel.get_distribution_with_client": (
+            lambda: distributions.get_distribution_with_client(newest_id), False),
+        "DistributionModel.import_distributions_csv": (
+            lambda: distributions.import_distributions_csv(csv_path), True),
+        "DistributionModel.import_distributions_lines": (
+            lambda: distributions.import_distributions_lines(csv_lines), True),
+        "DistributionModel.get_daily_distributions": (
+            lambda: distributions.get_daily_distributions(last_day), False),
+        "DistributionModel.get_daily_distributions_page": (
+            lambda: distributions.get_daily_distributions_page(last_day), False),
+        "DistributionModel.get_client_distributions": (
+            lambda: distributions.get_client_distributions(client_id), False),
+        "DistributionModel.get_total_distributions": (
+            lambda: distributions.get_total_distributions(year_start, last_day), False),
+        "DistributionModel.get_total_distributions_page": (
+            lambda: distributions.get_total_distributions_page(month_start, last_day), False),
+        "DistributionModel.get_distribution_totals": (
+            lambda: distributions.get_distribution_totals(year_start, last_day), False),
+        "DistributionModel.verify_daily_totals": (distributions.verify_daily_totals, False),
+        # بدون التخزين المؤقت: كل استدعاء يقيس الاستعلام التجميعي نفسه
+        "DistributionModel.dashboard_summary": (uncached_summary, False),
+        "PaymentModel.add_payment": (
+            lambda: payments.add_payment(client_id, 500.0, "نقدي", "دفعة قياس"), True),
+        "PaymentModel.get_payment_allocations": (lambda: payments.get_payment_allocations(payment_id), False),
+        "PaymentModel.get_client_payments": (lambda: payments.get_client_payments(client_id), False),
+        "PaymentModel.get_pending_payments": (payments.get_pending_payments, False),
+        "PaymentModel.aging_params": (lambda: payments.aging_params(last_day), False),
+        "PaymentModel.get_aging_page": (lambda: payments.get_aging_page(as_of=last_day), False),
+    }
+
+
+def public_methods():
+    for model in (ClientModel, DistributionModel, PaymentModel):
+        for name in vars(model):
+            if not name.startswith("_") and callable(getattr(model, name)):
+                yield f"{model.__name__}.{name}"
+
+
+def time_call(call, repeat):
+    timings = []
+    rows = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - start) * 1000)
+        if isinstance(result, list):
+            rows = len(result)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(timings), 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "rows": rows,
+    }
+
+
+def prepare_dataset(workdir, distributions, seed, regenerate=False):
+    """قاعدة بيانات مولدة بالحجم المطلوب (يعاد استخدامها إن وجدت)"""
+    path = os.path.join(workdir, f"bench_{distributions}_{seed}.db")
+    if regenerate and os.path.exists(path):
+        os.remove(path)
+    if not os.path.exists(path):
+        db = Database(path)
+        started = time.perf_counter()
+        generate(db, seed=seed, end_date=date(2024, 12, 31), **dataset_shape(distributions))
+        print(f"generated {distributions} distributions in {time.perf_counter() - started:.1f}s",
+              file=sys.stderr)
+        db.close()
+    return path
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat=5, seed=0, workdir=None, regenerate=False):
+    """قياس كل الدوال العامة على كل حجم، يرجع نتائج قابلة للتحويل إلى JSON"""
+    workdir = workdir or os.path.join(tempfile.gettempdir(), "distribution_benchmark")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    for size in sizes:
+        source = prepare_dataset(workdir, size, seed, regenerate)
+        # الكتابات تجري على نسخة حتى تبقى البيانات المولدة ثابتة بين التشغيلات
+        path = os.path.join(workdir, f"run_{size}.db")
+        source_db = Database(source)
+        source_db.backup(path)
+        source_db.close()
+
+        db = Database(path)
+        calls = benchmark_calls(db, workdir)
+        missing = sorted(set(public_methods()) - set(calls))
+        if missing:
+            print(f"not benchmarked: {', '.join(missing)}", file=sys.stderr)
+
+        for name, (call, writes) in calls.items():
+            call()  # تسخين الذاكرة المؤقتة
+            result = time_call(call, repeat)
+            results.append({"size": size, "method": name, "writes": writes, **result})
+            print(f"{size:>9} {name:<48} {result['median_ms']:>10.3f} ms", file=sys.stderr)
+        db.close()
+        os.remove(path)
+
+    return {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def write_throughput(workdir, count=2000, batch_sizes=(1, 10, 100), synchronous=("NORMAL", "FULL")):
+    """عدد الكتابات في الثانية (add_distribution) مع وبدون تجميعها في معاملة واحدة (WAL)"""
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    for sync in synchronous:
+        for batch in batch_sizes:
+            path = os.path.join(workdir, f"writes_{sync}_{batch}.db")
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            db = Database(path)
+            db.get_connection().execute(f"PRAGMA synchronous = {sync}")
+            model = DistributionModel(db)
+            model.set_price(100.0, "2024-01-01")
+            client_id = ClientModel(db).add_client("عميل القياس", "حي القياس", "0500000000")
+
+            started = time.perf_counter()
+            for offset in range(0, count, batch):
+                with db.transaction():
+                    for _ in range(min(batch, count - offset)):
+                        model.add_distribution(client_id, 10.0, 0, "2024-01-02")
+            elapsed = time.perf_counter() - started
+            db.close()
+
+            results.append({
+                "journal_mode": "WAL", "synchronous": sync, "batch": batch, "writes": count,
+                "seconds": round(elapsed, 4), "writes_per_sec": round(count / elapsed, 1),
+            })
+            print(f"synchronous={sync:<7} batch={batch:<5} {count / elapsed:>10.0f} writes/s",
+                  file=sys.stderr)
+    return results
+
+
+def compare(old, new, threshold=0.1):
+    """مقارنة نتيجتي قياس: يرجع [(الحجم، الدالة، قبل، بعد، النسبة)] للتغيرات الأكبر من العتبة"""
+    before = {(r["size"], r["method"]): r["median_ms"] for r in old["results"]}
+    changes = []
+    for r in new["results"]:
+        key = (r["size"], r["method"])
+        if key in before and before[key] > 0:
+            ratio = r["median_ms"] / before[key]
+            if abs(ratio - 1) > threshold:
+                changes.append((*key, before[key], r["median_ms"], ratio))
+    return sorted(changes, key=lambda change: -change[4])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="بيانات تجريبية وقياس الأداء")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="تعبئة قاعدة بيانات ببيانات تجريبية")
+    gen.add_argument("--db", default="distribution.db")
+    gen.add_argument("--clients", type=int, default=1000)
+    gen.add_argument("--days", type=int, default=365)
+    gen.add_argument("--distributions", type=int, default=50000)
+    gen.add_argument("--payments", type=int, default=10000)
+    gen.add_argument("--seed", type=int, default=0)
+
+    bench = commands.add_parser("run", help="قياس دوال النماذج على أحجام مختلفة")
+    bench.add_argument("--sizes", default="1000,100000,1000000",
+                       type=lambda value: [int(size) for size in value.split(",")])
+    bench.add_argument("--repeat", type=int, default=5)
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--workdir", help="مجلد قواعد البيانات المولدة (يعاد استخدامها)")
+    bench.add_argument("--regenerate", action="store_true")
+    bench.add_argument("--output", help="ملف JSON للنتائج (المخرج القياسي افتراضياً)")
+
+    writes = commands.add_parser("writes", help="الكتابات في الثانية مع وبدون التجميع في معاملة")
+    writes.add_argument("--count", type=int, default=2000)
+    writes.add_argument("--batches", default="1,10,100",
+                        type=lambda value: [int(size) for size in value.split(",")])
+    writes.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "distribution_benchmark"))
+    writes.add_argument("--output", help="ملف JSON للنتائج (المخرج القياسي افتراضياً)")
+
+    cmp_ = commands.add_parser("compare", help="مقارنة نتيجتي قياس")
+    cmp_.add_argument("old")
+    cmp_.add_argument("new")
+    cmp_.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        db = Database(args.db)
+        generate(db, args.clients, args.days, args.distributions, args.payments, args.seed)
+        db.close()
+    elif args.command in ("run", "writes"):
+        if args.command == "run":
+            report = run(args.sizes, args.repeat, args.seed, args.workdir, args.regenerate)
+        else:
+            report = {
+                "revision": git_revision(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "sqlite": sqlite3.sqlite_version,
+                "results": write_throughput(args.workdir, args.count, args.batches),
+            }
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        else:
+            json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    else:
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        changes = compare(old, new, args.threshold)
+        for size, method, before, after, ratio in changes:
+            print(f"{size:>9} {method:<48} {before:>10.3f} -> {after:>10.3f} ms  x{ratio:.2f}")
+        return 1 if any(change[4] > 1 + args.threshold for change in changes) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
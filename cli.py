@@ -0,0 +1,279 @@
+"""واجهة سطر الأوامر (بدون واجهة رسومية) للمهام المجدولة والسكربتات
+
+أمثلة:
+    python -m cli report --start 2024-01-01 --end 2024-01-31
+    python -m cli pending
+    python -m cli aging --sort days_over_90
+    python -m cli set-price 120.5
+    python -m cli import distributions.csv
+    python -m cli export report.csv --start 2024-01-01
+    python -m cli export all.xlsx --kind distributions --start 2020-01-01
+    python -m cli backup distribution-backup.db
+    python -m cli backup --keep 14 --if-due
+    python -m cli --db driver.db sync depot.db
+    python -m cli archive --days 365
+"""
+import argparse
+import csv
+import sqlite3
+import sys
+from datetime import datetime
+
+from backup import BackupError, BackupManager, backup_set
+from models import (Database, ClientModel, DistributionModel, PaymentModel,
+                    Validators)
+from query_plans import QueryPlanError, check_query_plans
+
+
+def date_arg(value):
+    if not Validators.validate_date(value):
+        raise argparse.ArgumentTypeError(f"تاريخ غير صحيح: {value} (YYYY-MM-DD)")
+    return value
+
+
+def positive_number(value):
+    if not Validators.validate_number(value) or float(value) < 0:
+        raise argparse.ArgumentTypeError(f"رقم غير صحيح: {value}")
+    return float(value)
+
+
+def period(args):
+    """الفترة المطلوبة (بداية الشهر الحالي حتى اليوم افتراضياً)"""
+    today = datetime.now().date()
+    return args.start or str(today.replace(day=1)), args.end or str(today)
+
+
+def write_rows(header, rows, out, as_csv=False):
+    if as_csv:
+        writer = csv.writer(out)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return
+    print("\t".join(header), file=out)
+    for row in rows:
+        print("\t".join(f"{v:,.2f}" if isinstance(v, float) else str(v) for v in row), file=out)
+
+
+REPORT_HEADER = ("العميل", "الكمية (كغ)", "الإجمالي", "المدفوع", "المتبقي")
+
+
+def cmd_report(db, args):
+    start, end = period(args)
+    model = DistributionModel(db)
+    write_rows(REPORT_HEADER, model.get_total_distributions(start, end), sys.stdout, args.csv)
+    if not args.csv:
+        kg, amount, paid, remaining = model.get_distribution_totals(start, end)
+        print(f"المجموع ({start} - {end}): {kg:,.2f} كغ | {amount:,.2f} | "
+              f"مدفوع {paid:,.2f} | متبقي {remaining:,.2f}")
+
+
+def cmd_pending(db, args):
+    rows = PaymentModel(db).get_pending_payments()
+    write_rows(("العميل", "الهاتف", "المستحق"), rows, sys.stdout, args.csv)
+
+
+AGING_HEADER = ("العميل", "الهاتف", "0-30", "31-60", "61-90", "+90", "الإجمالي", "أقدم توزيع")
+
+
+def cmd_aging(db, args):
+    model = PaymentModel(db)
+    column = model.AGING_SORTS[args.sort]
+    totals = []
+
+    def rows():
+        after = None
+        while True:
+            descending = args.sort not in ("name", "oldest_date")
+            page = model.get_aging_page(args.sort, descending, after, 500, args.date)
+            if page and not totals:
+                totals.extend(page[0][9:])
+            for row in page:
+                yield row[1:9]
+            if len(page) < 500:
+                return
+            after = (page[-1][column], page[-1][0])
+
+    write_rows(AGING_HEADER, rows(), sys.stdout, args.csv)
+    if totals and not args.csv:
+        clients, *buckets, total = totals
+        print(f"المجموع ({clients} عميل): " + " | ".join(
+            f"{name} {amount:,.2f}" for name, amount in zip(AGING_HEADER[2:6], buckets)
+        ) + f" | الإجمالي {total:,.2f}")
+
+
+def cmd_set_price(db, args):
+    DistributionModel(db).set_price(args.price, args.date)
+    print(f"السعر {args.price:,.2f} د.ج/كغ بتاريخ {args.date or datetime.now().date()}")
+
+
+def cmd_import(db, args):
+    imported, rejected = DistributionModel(db).import_distributions_csv(args.file, args.date)
+    print(f"تم استيراد {imported} توزيع")
+    for line_number, row, reason in rejected:
+        print(f"السطر {line_number}: {reason}: {','.join(row)}", file=sys.stderr)
+    return 1 if rejected else 0
+
+
+def cmd_export(db, args):
+    from export import export_report
+    start, end = period(args)
+    if args.kind != "period" and not args.start:
+        start = None  # التوزيعات وكشف الحساب: كل السجل افتراضياً
+    written = export_report(db, args.kind, args.file, start, end, client_id=args.client)
+    print(f"تم تصدير {written} سطر إلى {args.file}")
+
+
+def cmd_backup(db, args):
+    if args.file:
+        path = backup_set(db, args.file, compress=args.compress or None)
+    else:
+        manager = BackupManager.load(db)
+        manager.directory = args.dir or manager.directory
+        manager.keep = args.keep or manager.keep
+        manager.compress = args.compress or manager.compress
+        if args.if_due and not manager.due():
+            return 0
+        path = manager.run()
+    print(f"تم حفظ نسخة احتياطية في {path}")
+
+
+def cmd_restore(db, args):
+    safety = BackupManager.load(db).restore(args.file)
+    print(f"تمت الاستعادة من {args.file} (النسخة السابقة محفوظة في {safety})")
+
+
+def cmd_sync(db, args):
+    from sync import DeltaSync, sync_databases
+    if args.new_device:
+        print(f"معرف الجهاز الجديد: {DeltaSync(db).reset_device_id()}")
+    other = Database(args.other)
+    try:
+        for direction, (result, size) in zip(("←", "→"), sync_databases(db, other)):
+            print(f"{args.other} {direction} {args.db}: {result['applied']} صف، "
+                  f"{result['deleted']} محذوف، {size:,} بايت")
+            for table, uid in result["conflicts"]:
+                print(f"تعارض: {table} {uid}", file=sys.stderr)
+    finally:
+        other.close()
+
+
+def cmd_archive(db, args):
+    from archive import archive_settled
+    distributions, payments = archive_settled(db, args.days, vacuum=args.vacuum)
+    print(f"تم نقل {distributions} توزيع و {payments} دفعة إلى {db.archive_path}")
+
+
+def cmd_verify_balances(db, args):
+    drift = ClientModel(db).verify_balances(rebuild=args.rebuild)
+    drift += DistributionModel(db).verify_daily_totals(rebuild=args.rebuild)
+    for item in drift:
+        print("\t".join(str(v) for v in item))
+    if drift and not args.rebuild:
+        return 1
+    return 0
+
+
+def cmd_check_plans(db, args):
+    try:
+        check_query_plans(db)
+    except QueryPlanError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print("جميع الاستعلامات تستخدم الفهارس")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="إدارة التوزيع من سطر الأوامر")
+    parser.add_argument("--db", default="distribution.db", help="ملف قاعدة البيانات")
+    parser.add_argument("--stats", action="store_true", help="طباعة إحصاءات الاستعلامات في النهاية")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_period(command):
+        command.add_argument("--start", type=date_arg, help="بداية الفترة (بداية الشهر افتراضياً)")
+        command.add_argument("--end", type=date_arg, help="نهاية الفترة (اليوم افتراضياً)")
+
+    report = commands.add_parser("report", help="تقرير التوزيعات لفترة")
+    add_period(report)
+    report.add_argument("--csv", action="store_true", help="إخراج بصيغة CSV")
+    report.set_defaults(handler=cmd_report)
+
+    pending = commands.add_parser("pending", help="العملاء أصحاب الأرصدة المستحقة")
+    pending.add_argument("--csv", action="store_true", help="إخراج بصيغة CSV")
+    pending.set_defaults(handler=cmd_pending)
+
+    aging = commands.add_parser("aging", help="أعمار المستحقات لكل عميل (0-30، 31-60، 61-90، +90 يوم)")
+    aging.add_argument("--sort", choices=list(PaymentModel.AGING_SORTS), default="total",
+                       help="عمود الترتيب (المبالغ تنازلياً، الاسم والتاريخ تصاعدياً)")
+    aging.add_argument("--date", type=date_arg, help="حساب الأعمار بتاريخ (اليوم افتراضياً)")
+    aging.add_argument("--csv", action="store_true", help="إخراج بصيغة CSV")
+    aging.set_defaults(handler=cmd_aging)
+
+    set_price = commands.add_parser("set-price", help="تعيين سعر الكيلوغرام")
+    set_price.add_argument("price", type=positive_number)
+    set_price.add_argument("--date", type=date_arg, help="تاريخ السعر (اليوم افتراضياً)")
+    set_price.set_defaults(handler=cmd_set_price)
+
+    import_ = commands.add_parser("import", help="استيراد توزيعات من ملف CSV")
+    import_.add_argument("file")
+    import_.add_argument("--date", type=date_arg, help="تاريخ الأسطر التي لا تحدد تاريخاً")
+    import_.set_defaults(handler=cmd_import)
+
+    export = commands.add_parser("export", help="تصدير تقرير إلى CSV أو XLSX (حسب امتداد الملف)")
+    export.add_argument("file")
+    export.add_argument("--kind", choices=("period", "distributions", "statement", "aging"), default="period",
+                        help="تقرير الفترة، التوزيعات التفصيلية، كشف حساب عميل، أو أعمار المستحقات (بتاريخ --end)")
+    export.add_argument("--client", type=int, help="رقم العميل (لكشف الحساب)")
+    add_period(export)
+    export.set_defaults(handler=cmd_export)
+
+    backup = commands.add_parser("backup", help="نسخة احتياطية أثناء العمل (في مجلد النسخ إذا لم يحدد ملف)")
+    backup.add_argument("file", nargs="?", help="ملف النسخة (.db أو .db.gz)")
+    backup.add_argument("--dir", help="مجلد النسخ (المحفوظ في الإعدادات افتراضياً)")
+    backup.add_argument("--keep", type=int, help="عدد النسخ المحتفظ بها في المجلد")
+    backup.add_argument("--compress", action="store_true", help="ضغط النسخة (gzip)")
+    backup.add_argument("--if-due", action="store_true", help="فقط إذا حان موعد النسخة حسب الجدولة")
+    backup.set_defaults(handler=cmd_backup)
+
+    restore = commands.add_parser("restore", help="استعادة قاعدة البيانات من نسخة احتياطية")
+    restore.add_argument("file")
+    restore.set_defaults(handler=cmd_restore)
+
+    sync = commands.add_parser("sync", help="مزامنة التغييرات في الاتجاهين مع قاعدة بيانات أخرى")
+    sync.add_argument("other", help="ملف القاعدة الأخرى (مثل قاعدة المستودع)")
+    sync.add_argument("--new-device", action="store_true",
+                      help="معرف جهاز جديد لـ --db قبل المزامنة (إذا كانت نسخة من القاعدة الأخرى)")
+    sync.set_defaults(handler=cmd_sync)
+
+    archive = commands.add_parser("archive", help="نقل التوزيعات المسددة القديمة ودفعاتها إلى ملف الأرشيف")
+    archive.add_argument("--days", type=int, default=365, help="عمر السجلات المنقولة بالأيام (365 افتراضياً)")
+    archive.add_argument("--vacuum", action="store_true", help="تصغير الملف الحي بعد النقل")
+    archive.set_defaults(handler=cmd_archive)
+
+    verify = commands.add_parser("verify-balances", help="التحقق من الأرصدة والإجماليات اليومية")
+    verify.add_argument("--rebuild", action="store_true", help="إعادة البناء عند وجود فروقات")
+    verify.set_defaults(handler=cmd_verify_balances)
+
+    plans = commands.add_parser("check-plans", help="التأكد من استخدام الاستعلامات للفهارس")
+    plans.set_defaults(handler=cmd_check_plans)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = Database(args.db)
+    if args.stats:
+        db.enable_stats(dump_at_exit=False)
+    try:
+        return args.handler(db, args) or 0
+    except (OSError, ValueError, sqlite3.Error, BackupError) as e:
+        print(f"خطأ: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.stats:
+            db.stats.dump()
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
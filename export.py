@@ -0,0 +1,237 @@
+"""تصدير التقارير إلى CSV و XLSX كتدفق: تقرأ الصفوف على دفعات وتكتب مباشرة
+إلى الملف، فيبقى استهلاك الذاكرة ثابتاً مهما كان عدد الصفوف"""
+import csv
+import os
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from models import ClientModel, PaymentModel
+
+# التقارير القابلة للتصدير: (العناوين، استعلام العد، استعلام البيانات)
+# المعاملات المسماة: start, end, client_id؛ أسماء الجداول بين {} تشمل الأرشيف عند الحاجة
+# (أعمار المستحقات تحسب بتاريخ end)
+EXPORTS = {
+    "period": (
+        ("العميل", "عدد التوزيعات", "الكمية (كغ)", "الإجمالي", "المدفوع", "المتبقي"),
+        "SELECT COUNT(DISTINCT client_id) FROM {daily_client_totals} WHERE day BETWEEN :start AND :end",
+        """
+            SELECT c.name, SUM(t.distribution_count), SUM(t.total_kg), SUM(t.total_amount),
+                   SUM(t.total_paid), SUM(t.total_remaining)
+            FROM {daily_client_totals} t
+            JOIN clients c ON c.id = t.client_id
+            WHERE t.day BETWEEN :start AND :end
+            GROUP BY t.client_id, c.name
+            ORDER BY c.name
+        """,
+    ),
+    "distributions": (
+        ("ID", "التاريخ", "رقم العميل", "العميل", "الكمية (كغ)", "السعر", "الإجمالي", "المدفوع", "المتبقي"),
+        "SELECT COUNT(*) FROM {distributions} WHERE distribution_date BETWEEN :start AND :end",
+        """
+            SELECT d.id, d.distribution_date, d.client_id, c.name, d.quantity_kg, d.price_per_kg,
+                   d.total_amount, d.paid_amount, d.remaining_amount
+            FROM {distributions_by_date}
+            JOIN clients c ON c.id = d.client_id
+            WHERE d.distribution_date BETWEEN :start AND :end
+            ORDER BY d.distribution_date, d.id
+        """,
+    ),
+    "statement": (
+        ("التاريخ", "النوع", "المرجع", "الكمية (كغ)", "مدين", "دائن", "الرصيد", "السعر / الوصف"),
+        """
+            SELECT (SELECT COUNT(*) FROM {distributions}
+                    WHERE client_id = :client_id AND distribution_date BETWEEN :start AND :end)
+                 + (SELECT COUNT(*) FROM {payments}
+                    WHERE client_id = :client_id AND payment_date BETWEEN :start AND :end)
+        """,
+        # نفس سجل كشف الحساب في الشاشة مع الرصيد الجاري من رصيد بداية الفترة
+        """
+            SELECT entry_date, CASE kind WHEN 0 THEN 'توزيع' ELSE 'دفعة' END, id, quantity_kg,
+                   debit, credit,
+                   :opening + SUM(debit - credit) OVER (
+                       ORDER BY entry_date, kind, id ROWS UNBOUNDED PRECEDING
+                   ),
+                   detail
+            FROM (""" + ClientModel.STATEMENT_ENTRIES.replace(
+                "{distribution_range}", "AND d.distribution_date BETWEEN :start AND :end"
+            ).replace(
+                "{payment_range}", "AND p.payment_date BETWEEN :start AND :end"
+            ) + """)
+            ORDER BY entry_date, kind, id
+        """,
+    ),
+    "aging": (
+        ("العميل", "الهاتف", "0-30 يوم", "31-60 يوم", "61-90 يوم", "أكثر من 90 يوم", "الإجمالي", "أقدم توزيع"),
+        """
+            SELECT COUNT(DISTINCT client_id)
+            FROM distributions INDEXED BY idx_distributions_open_aging
+            WHERE remaining_amount > 0
+        """,
+        PaymentModel.AGING + """
+            SELECT c.name, c.phone, days_0_30, days_31_60, days_61_90, days_over_90, total, oldest_date
+            FROM aging JOIN clients c ON c.id = aging.client_id
+            ORDER BY total DESC, aging.client_id
+        """,
+    ),
+}
+
+BATCH_SIZE = 1000
+
+
+class ExportCancelled(Exception):
+    """أوقف المستخدم التصدير قبل اكتماله"""
+
+
+def xlsx_cell(value):
+    """خلية XLSX بدون مرجع (الخلايا متتالية في الصف فيكفي ترتيبها)"""
+    if value is None:
+        return "<c/>"
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f"<c><v>{value!r}</v></c>"
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def write_csv(path, header, batches, on_batch):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for rows in batches:
+            writer.writerows(rows)
+            on_batch(len(rows))
+
+
+def write_xlsx(path, header, batches, on_batch, sheet="تقرير"):
+    """كتابة ملف XLSX بأقل الأجزاء اللازمة؛ ورقة العمل تكتب كتدفق داخل ملف ZIP
+    والنصوص مضمنة في الخلايا (inlineStr) فلا يحتفظ بجدول نصوص مشترك في الذاكرة"""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content.replace("{sheet}", escape(sheet)))
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as raw:
+            def write(text):
+                raw.write(text.encode("utf-8"))
+
+            write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                  '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                  '<sheetViews><sheetView rightToLeft="1" workbookViewId="0"/></sheetViews>'
+                  '<sheetData>')
+            write('<row r="1">' + "".join(map(xlsx_cell, header)) + "</row>")
+            row_number = 1
+            for rows in batches:
+                chunk = []
+                for row in rows:
+                    row_number += 1
+                    chunk.append(f'<row r="{row_number}">' + "".join(map(xlsx_cell, row)) + "</row>")
+                write("".join(chunk))
+                on_batch(len(rows))
+            write("</sheetData></worksheet>")
+
+
+WRITERS = {".csv": write_csv, ".xlsx": write_xlsx}
+
+
+def report_batches(db, kind, start=None, end=None, client_id=None,
+                   batch_size=BATCH_SIZE, count=True):
+    """(العناوين، عدد الصفوف، مولد الدفعات) لتقرير؛ يستخدمه التصدير والخادم"""
+    if kind not in EXPORTS:
+        raise ValueError(f"نوع تقرير غير معروف: {kind}")
+    if kind == "statement" and client_id is None:
+        raise ValueError("كشف الحساب يحتاج رقم العميل")
+
+    header, count_query, query = EXPORTS[kind]
+    params = {
+        "start": str(start or "0000-01-01"),
+        "end": str(end or datetime.now().date()),
+        "client_id": client_id,
+    }
+    if kind == "aging":
+        params.update(PaymentModel.aging_params(params["end"]))
+    if kind == "statement":
+        params["opening"] = ClientModel(db).get_opening_balance(client_id, params["start"])
+    tables = {
+        "allocations": db.source("payment_allocations", params["start"]),
+        "daily_client_totals": db.source("daily_client_totals", params["start"]),
+        "distributions": db.source("distributions", params["start"]),
+        "distributions_by_date": db.source("distributions", params["start"], "idx_distributions_date_id", "d"),
+        "payments": db.source("payments", params["start"]),
+    }
+    total = db.fetch_one(count_query.format(**tables), params)[0] if count else None
+    return header, total, db.iter_batches(query.format(**tables), params, batch_size)
+
+
+def export_report(db, kind, path, start=None, end=None, client_id=None,
+                  progress=None, cancelled=None, batch_size=BATCH_SIZE):
+    """تصدير تقرير (period أو distributions أو statement) إلى ملف CSV/XLSX حسب امتداده.
+    progress(المكتوب، الإجمالي) تستدعى بعد كل دفعة، و cancelled() توقف التصدير إذا أرجعت True.
+    مع قاعدة بيانات بعيدة تقرأ الصفوف من الخادم كتدفق. يرجع عدد الصفوف المكتوبة"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"صيغة غير مدعومة: {extension or path} (CSV أو XLSX)")
+
+    source = getattr(db, "report_batches", None)
+    if source is None:
+        header, total, batches = report_batches(db, kind, start, end, client_id,
+                                                batch_size, count=bool(progress))
+    else:
+        header, total, batches = source(kind, start, end, client_id)
+    written = 0
+
+    def on_batch(count):
+        nonlocal written
+        written += count
+        if progress:
+            progress(written, total)
+        if cancelled and cancelled():
+            raise ExportCancelled()
+
+    try:
+        WRITERS[extension](path, header, batches, on_batch)
+    except BaseException:
+        close = getattr(batches, "close", None)
+        if close:
+            close()
+        # لا يترك ملف ناقص عند الإلغاء أو الخطأ
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return written
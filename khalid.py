@@ -1,333 +1,561 @@
-import sqlite3
 import os
+import sys
+import csv
+import bisect
+import queue
+import collections
+import threading
 from datetime import datetime, timedelta
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 import customtkinter as ctk
 
+# النماذج معرفة في models.py (تستورد بدون واجهة رسومية) وتبقى متاحة من هنا
+from models import (  # noqa: F401
+    Database, Auth, ClientIndex, ClientModel, PriceCalendar,
+    DistributionModel, PaymentModel, Validators,
+)
+
+from export import export_report, ExportCancelled
+from backup import BackupManager, BackupCancelled
+from remote import (RemoteDatabase, RemoteAuth, RemoteClientModel,
+                    RemoteDistributionModel, RemotePaymentModel)
+
 # إعداد المظهر
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
 
-class Database:
-    def __init__(self):
-        self.db_name = "distribution.db"
-        self.init_database()
-    
-    def init_database(self):
-        """تهيئة قاعدة البيانات والجداول"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
-        # جدول العملاء
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS clients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                address TEXT,
-                phone TEXT,
-                created_date DATE,
-                is_active BOOLEAN DEFAULT TRUE
-            )
-        ''')
-        
-        # جدول أسعار المنتج
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS product_prices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                price_date DATE UNIQUE,
-                price_per_kg REAL NOT NULL
-            )
-        ''')
-        
-        # جدول التوزيعات
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS distributions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_id INTEGER,
-                distribution_date DATE,
-                quantity_kg REAL,
-                price_per_kg REAL,
-                total_amount REAL,
-                paid_amount REAL,
-                remaining_amount REAL,
-                FOREIGN KEY (client_id) REFERENCES clients(id)
-            )
-        ''')
-        
-        # جدول المدفوعات
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_id INTEGER,
-                payment_date DATE,
-                amount REAL,
-                payment_method TEXT,
-                description TEXT,
-                distribution_id INTEGER,
-                FOREIGN KEY (client_id) REFERENCES clients(id)
-            )
-        ''')
-        
-        # إضافة مستخدم افتراضي
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE,
-                password TEXT
-            )
-        ''')
-        
-        # إضافة المستخدم الافتراضي إذا لم يكن موجوداً
-        cursor.execute("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)", 
-                      ('admin', 'admin123'))
-        
-        conn.commit()
-        conn.close()
-    
-    def execute_query(self, query, params=()):
-        """تنفيذ استعلام مع معاملات"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        conn.commit()
-        conn.close()
-    
-    def fetch_all(self, query, params=()):
-        """جلب جميع النتائج"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        conn.close()
-        return results
-    
-    def fetch_one(self, query, params=()):
-        """جلب نتيجة واحدة"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        result = cursor.fetchone()
-        conn.close()
-        return result
+class DbTask:
+    """مهمة قاعدة بيانات مرسلة إلى BackgroundExecutor"""
+    
+    def __init__(self, fn, args, kwargs, callback, errback, write=False):
+        self.fn = fn
+        self.write = write
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback
+        self.errback = errback
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.done = False
+    
+    def cancel(self):
+        """تجاهل نتيجة المهمة (ولا تنفذ إن لم تبدأ بعد)"""
+        self.cancelled = True
 
-class Auth:
-    def __init__(self):
-        self.db = Database()
-        self.current_user = None
-    
-    def login(self, username, password):
-        """تسجيل الدخول"""
-        query = "SELECT * FROM users WHERE username = ? AND password = ?"
-        user = self.db.fetch_one(query, (username, password))
-        
-        if user:
-            self.current_user = user
-            return True
-        return False
-    
-    def change_password(self, new_password):
-        """تغيير كلمة المرور"""
-        if self.current_user:
-            query = "UPDATE users SET password = ? WHERE id = ?"
-            self.db.execute_query(query, (new_password, self.current_user[0]))
-            return True
-        return False
+class BackgroundExecutor:
+    """تنفيذ استدعاءات النماذج في خيط عامل وتسليم النتائج
+    إلى حلقة Tk عبر after حتى لا تتجمد الواجهة.
+    الكتابات المتتالية المنتظرة تنفذ في معاملة واحدة (group commit)"""
+    
+    def __init__(self, widget, poll_ms=25, db=None, max_batch=100):
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self.db = db
+        self.max_batch = max_batch
+        self._jobs = queue.Queue()
+        self._done = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, name="db-worker", daemon=True)
+        self._thread.start()
+        self._poll_id = widget.after(poll_ms, self._poll)
+    
+    def submit(self, fn, *args, callback=None, errback=None, write=False, **kwargs):
+        """إرسال استدعاء للتنفيذ في الخلفية؛ callback(result) تستدعى في خيط الواجهة"""
+        task = DbTask(fn, args, kwargs, callback, errback, write)
+        self._jobs.put(task)
+        return task
+    
+    def _run(self, task):
+        try:
+            task.result = task.fn(*task.args, **task.kwargs)
+        except Exception as e:
+            task.error = e
+    
+    def _run_writes(self, batch):
+        """تنفيذ دفعة كتابات في معاملة واحدة، كل مهمة في نقطة حفظ خاصة بها
+        حتى لا يلغي فشل إحداها بقية الدفعة"""
+        try:
+            with self.db.transaction():
+                for task in batch:
+                    try:
+                        with self.db.transaction():
+                            task.result = task.fn(*task.args, **task.kwargs)
+                    except Exception as e:
+                        task.error = e
+        except Exception as e:
+            # فشل الحفظ نفسه: لم يحفظ شيء من الدفعة
+            for task in batch:
+                task.error = task.error or e
+    
+    def _worker(self):
+        backlog = collections.deque()
+        while True:
+            task = backlog.popleft() if backlog else self._jobs.get()
+            if task is None:
+                break
+            if task.cancelled:
+                continue
+            if not task.write or self.db is None:
+                self._run(task)
+                self._done.put(task)
+                continue
+            
+            # جمع الكتابات المنتظرة خلف هذه المهمة
+            batch = [task]
+            while len(batch) < self.max_batch:
+                try:
+                    following = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if following is None or not following.write:
+                    backlog.append(following)
+                    break
+                batch.append(following)
+            
+            if len(batch) == 1:
+                self._run(task)
+            else:
+                self._run_writes(batch)
+            for done in batch:
+                self._done.put(done)
+    
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    task = self._done.get_nowait()
+                except queue.Empty:
+                    break
+                task.done = True
+                if task.cancelled:
+                    continue
+                if task.error is not None:
+                    if task.errback:
+                        task.errback(task.error)
+                elif task.callback:
+                    task.callback(task.result)
+        finally:
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)
+    
+    def shutdown(self):
+        """إيقاف الخيط العامل"""
+        self.widget.after_cancel(self._poll_id)
+        self._jobs.put(None)
+        self._thread.join(timeout=2)
 
-class ClientModel:
-    def __init__(self):
-        self.db = Database()
-    
-    def add_client(self, name, address, phone):
-        """إضافة عميل جديد"""
-        query = """INSERT INTO clients (name, address, phone, created_date) 
-                   VALUES (?, ?, ?, ?)"""
-        self.db.execute_query(query, (name, address, phone, datetime.now().date()))
-    
-    def get_all_clients(self):
-        """جلب جميع العملاء"""
-        query = "SELECT * FROM clients WHERE is_active = TRUE ORDER BY name"
-        return self.db.fetch_all(query)
-    
-    def get_client_by_id(self, client_id):
-        """جلب عميل بواسطة المعرف"""
-        query = "SELECT * FROM clients WHERE id = ?"
-        return self.db.fetch_one(query, (client_id,))
-    
-    def update_client(self, client_id, name, address, phone):
-        """تحديث بيانات العميل"""
-        query = """UPDATE clients SET name = ?, address = ?, phone = ? 
-                   WHERE id = ?"""
-        self.db.execute_query(query, (name, address, phone, client_id))
-    
-    def delete_client(self, client_id):
-        """حذف عميل (تعطيل)"""
-        query = "UPDATE clients SET is_active = FALSE WHERE id = ?"
-        self.db.execute_query(query, (client_id,))
-    
-    def get_client_balance(self, client_id):
-        """حساب رصيد العميل"""
-        query = """
-            SELECT 
-                COALESCE(SUM(d.remaining_amount), 0) as total_balance
-            FROM distributions d
-            WHERE d.client_id = ? AND d.remaining_amount > 0
-        """
-        result = self.db.fetch_one(query, (client_id,))
-        return result[0] if result else 0
+class BackgroundJob:
+    """مهمة طويلة في خيط مستقل مع متابعة التقدم والإلغاء من الواجهة.
+    الفئات الفرعية تعرف work(progress, cancelled)"""
+    name = "job"
+    
+    def __init__(self, widget, on_progress, on_done, poll_ms=100):
+        self.widget = widget
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.poll_ms = poll_ms
+        self.written = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.finished = False
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        widget.after(poll_ms, self._poll)
+    
+    def work(self, progress, cancelled):
+        raise NotImplementedError
+    
+    def cleanup(self):
+        pass
+    
+    def _run(self):
+        try:
+            self.result = self.work(self._progress, self._cancel.is_set)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.cleanup()
+            self.finished = True
+    
+    def _progress(self, written, total):
+        self.written, self.total = written, total
+    
+    def _poll(self):
+        if not self.widget.winfo_exists():
+            self._cancel.set()
+            return
+        self.on_progress(self.written, self.total)
+        if self.finished:
+            self.on_done(self.result, self.error)
+        else:
+            self.widget.after(self.poll_ms, self._poll)
+    
+    def cancel(self):
+        """إيقاف المهمة بعد الخطوة الحالية (ويحذف الملف الناقص)"""
+        self._cancel.set()
 
-class DistributionModel:
-    def __init__(self):
-        self.db = Database()
-    
-    def set_today_price(self, price):
-        """تعيين سعر اليوم"""
-        today = datetime.now().date()
-        query = """INSERT OR REPLACE INTO product_prices (price_date, price_per_kg) 
-                   VALUES (?, ?)"""
-        self.db.execute_query(query, (today, price))
-    
-    def get_today_price(self):
-        """جلب سعر اليوم"""
-        today = datetime.now().date()
-        query = "SELECT price_per_kg FROM product_prices WHERE price_date = ?"
-        result = self.db.fetch_one(query, (today,))
-        return result[0] if result else 0.0
-    
-    def add_distribution(self, client_id, quantity_kg, paid_amount=0):
-        """إضافة توزيع جديد"""
-        price_per_kg = self.get_today_price()
-        total_amount = quantity_kg * price_per_kg
-        remaining_amount = total_amount - paid_amount
-        
-        query = """INSERT INTO distributions 
-                   (client_id, distribution_date, quantity_kg, price_per_kg, 
-                    total_amount, paid_amount, remaining_amount) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?)"""
-        
-        self.db.execute_query(query, (
-            client_id, datetime.now().date(), quantity_kg, price_per_kg,
-            total_amount, paid_amount, remaining_amount
-        ))
+class ExportJob(BackgroundJob):
+    """تصدير تقرير باتصال خاص بالخيط حتى لا يعطل استعلامات الشاشات"""
+    name = "export"
+    
+    def __init__(self, widget, db, kind, path, on_progress, on_done, poll_ms=100, **params):
+        self.db = db
+        self.kind = kind
+        self.path = path
+        self.params = params
+        super().__init__(widget, on_progress, on_done, poll_ms)
+    
+    def work(self, progress, cancelled):
+        return export_report(self.db, self.kind, self.path, progress=progress,
+                             cancelled=cancelled, **self.params)
     
-    def get_daily_distributions(self, date=None):
-        """جلب التوزيعات اليومية"""
-        if date is None:
-            date = datetime.now().date()
-        
-        query = """
-            SELECT d.*, c.name as client_name 
-            FROM distributions d
-            JOIN clients c ON d.client_id = c.id
-            WHERE d.distribution_date = ?
-            ORDER BY d.id DESC
-        """
-        return self.db.fetch_all(query, (date,))
-    
-    def get_client_distributions(self, client_id):
-        """جلب توزيعات عميل معين"""
-        query = """
-            SELECT * FROM distributions 
-            WHERE client_id = ? 
-            ORDER BY distribution_date DESC
-        """
-        return self.db.fetch_all(query, (client_id,))
-    
-    def get_total_distributions(self, start_date, end_date):
-        """إجمالي التوزيعات في فترة محددة"""
-        query = """
-            SELECT 
-                c.name,
-                SUM(d.quantity_kg) as total_kg,
-                SUM(d.total_amount) as total_amount,
-                SUM(d.paid_amount) as total_paid,
-                SUM(d.remaining_amount) as total_remaining
-            FROM distributions d
-            JOIN clients c ON d.client_id = c.id
-            WHERE d.distribution_date BETWEEN ? AND ?
-            GROUP BY c.id, c.name
-        """
-        return self.db.fetch_all(query, (start_date, end_date))
+    def cleanup(self):
+        self.db.release_connection()
 
-class PaymentModel:
-    def __init__(self):
-        self.db = Database()
-    
-    def add_payment(self, client_id, amount, payment_method, description, distribution_id=None):
-        """إضافة دفعة جديدة"""
-        query = """INSERT INTO payments 
-                   (client_id, payment_date, amount, payment_method, description, distribution_id) 
-                   VALUES (?, ?, ?, ?, ?, ?)"""
-        
-        self.db.execute_query(query, (
-            client_id, datetime.now().date(), amount, 
-            payment_method, description, distribution_id
-        ))
+class BackupJob(BackgroundJob):
+    """نسخة احتياطية على خطوات؛ التقدم بعدد الصفحات المنسوخة"""
+    name = "backup"
+    
+    def __init__(self, widget, manager, on_progress, on_done, poll_ms=200):
+        self.manager = manager
+        super().__init__(widget, on_progress, on_done, poll_ms)
+    
+    def work(self, progress, cancelled):
+        return self.manager.run(progress, cancelled)
+
+class RestoreJob(BackgroundJob):
+    """استعادة نسخة احتياطية بعد نسخة أمان من الوضع الحالي؛ لا تلغى (الاستبدال لا يتوقف
+    في منتصفه). النتيجة مسار نسخة الأمان"""
+    name = "restore"
+    
+    def __init__(self, widget, manager, path, on_progress, on_done, poll_ms=200):
+        self.manager = manager
+        self.path = path
+        super().__init__(widget, on_progress, on_done, poll_ms)
+    
+    def work(self, progress, cancelled):
+        return self.manager.restore(self.path, progress)
+    
+    def cleanup(self):
+        self.manager.db.release_connection()
+
+class Screen:
+    """شاشة محفوظة في MainApp مع دالة تحديث بياناتها"""
+    
+    def __init__(self, frame, version):
+        self.frame = frame
+        self.version = version
+        self.refresh = None
+
+class VirtualTable(ctk.CTkFrame):
+    """جدول Treeview يجلب البيانات صفحة بصفحة (keyset) عند التمرير
+    
+    fetch_page(cursor, limit): يرجع صفوف الصفحة التالية بعد cursor (None للأولى)
+    page_cursor(row): المؤشر الذي تبدأ بعده الصفحة التالية
+    format_row(row): القيم المعروضة في الأعمدة
+    runner(fn, *args, callback): اختياري لجلب الصفحات في الخلفية (MainApp.run_async)
+    row_id(row): معرف الصف للتحديث الجزئي (الافتراضي العمود الأول)
+    sort_key(row): مفتاح الترتيب التصاعدي للصفوف (الافتراضي page_cursor)
+    max_rows: أقصى عدد صفوف يحمل (التحميل للأمام فقط، فلا تحذف الصفوف البعيدة عن المعروض)؛
+    بعده يتوقف التمرير اللانهائي مع تنبيه لتضييق البحث أو الفترة
+    """
+    
+    def __init__(self, master, columns, fetch_page, page_cursor, format_row,
+                 page_size=100, height=12, column_width=120, empty_text="لا توجد بيانات",
+                 runner=None, row_id=None, sort_key=None, max_rows=5000):
+        super().__init__(master)
+        self.fetch_page = fetch_page
+        self.page_cursor = page_cursor
+        self.format_row = format_row
+        self.row_id = row_id or (lambda row: row[0])
+        self.sort_key = sort_key or page_cursor
+        self._keys = {}
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.runner = runner
+        self.empty_text = empty_text
+        self._cursor = None
+        self._exhausted = False
+        self._capped = False
+        self._loading = False
+        self._generation = 0
+        
+        self.empty_label = ctk.CTkLabel(self, text=empty_text)
+        # سطر حالة أسفل الجدول: خطأ تحميل مع إعادة المحاولة، أو بلوغ max_rows
+        self.status_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.status_label = ctk.CTkLabel(self.status_frame, text="")
+        self.status_label.pack(side="right", padx=5)
+        self.retry_button = ctk.CTkButton(self.status_frame, text="إعادة المحاولة", width=100,
+                                          command=self._retry)
+        
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=height)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=column_width)
+        
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+    
+    def _show_status(self, text, retry=False):
+        self.status_label.configure(text=text)
+        if retry:
+            self.retry_button.pack(side="right", padx=5)
+        else:
+            self.retry_button.pack_forget()
+        self.status_frame.pack(side="bottom", fill="x", before=self.scrollbar)
+    
+    def _hide_status(self):
+        self.status_frame.pack_forget()
+    
+    def _retry(self):
+        self._hide_status()
+        self.load_more()
+    
+    def _on_scroll(self, first, last):
+        """تحميل الصفحة التالية عند الاقتراب من نهاية المعروض"""
+        self.scrollbar.set(first, last)
+        if float(last) >= 0.9 and not self._exhausted and not self._loading:
+            self._loading = True
+            self.after_idle(self.load_more)
+    
+    def load_more(self):
+        """جلب الصفحة التالية وإضافتها إلى الجدول"""
+        if self._exhausted:
+            self._loading = False
+            return
         
-        # تحديث الرصيد المتبقي في التوزيعات إذا كان الدفع مرتبطاً بتوزيع معين
-        if distribution_id:
-            self._update_distribution_balance(distribution_id, amount)
-    
-    def _update_distribution_balance(self, distribution_id, payment_amount):
-        """تحديث رصيد التوزيع"""
-        query = "SELECT remaining_amount FROM distributions WHERE id = ?"
-        result = self.db.fetch_one(query, (distribution_id,))
-        if result:
-            current_balance = result[0]
-            new_balance = max(0, current_balance - payment_amount)
-            update_query = "UPDATE distributions SET remaining_amount = ? WHERE id = ?"
-            self.db.execute_query(update_query, (new_balance, distribution_id))
-    
-    def get_client_payments(self, client_id):
-        """جلب مدفوعات عميل معين"""
-        query = """
-            SELECT * FROM payments 
-            WHERE client_id = ? 
-            ORDER BY payment_date DESC
-        """
-        return self.db.fetch_all(query, (client_id,))
-    
-    def get_pending_payments(self):
-        """جلب المدفوعات المستحقة"""
-        query = """
-            SELECT c.name, c.phone, SUM(d.remaining_amount) as pending_amount
-            FROM clients c
-            JOIN distributions d ON c.id = d.client_id
-            WHERE d.remaining_amount > 0
-            GROUP BY c.id, c.name
-            HAVING SUM(d.remaining_amount) > 0
-        """
-        return self.db.fetch_all(query)
+        self._loading = True
+        generation = self._generation
+        if self.runner is None:
+            try:
+                rows = self.fetch_page(self._cursor, self.page_size)
+            except Exception as e:
+                self._page_failed(generation, e)
+                return
+            self._append_page(generation, rows)
+            return
+        
+        if not self.tree.get_children():
+            self.empty_label.configure(text="جاري التحميل...")
+            self.empty_label.pack(pady=20)
+        self.runner(self.fetch_page, self._cursor, self.page_size,
+                    callback=lambda rows: self._append_page(generation, rows),
+                    errback=lambda error: self._page_failed(generation, error))
+    
+    def _page_failed(self, generation, error):
+        """فشل جلب صفحة: يسمح بالمحاولة من جديد (بالتمرير أو الزر) بدل توقف التحميل"""
+        if generation != self._generation or not self.winfo_exists():
+            return
+        self._loading = False
+        self._update_empty_state()
+        self._show_status(f"تعذر تحميل الصفوف: {error}", retry=True)
+    
+    def _append_page(self, generation, rows):
+        # تجاهل الصفحات القديمة بعد إعادة التحميل أو إغلاق الجدول
+        if generation != self._generation or not self.winfo_exists():
+            return
+        self._loading = False
+        
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        if rows:
+            self._cursor = self.page_cursor(rows[-1])
+            for row in rows:
+                iid = str(self.row_id(row))
+                if self.tree.exists(iid):
+                    continue
+                self._keys[iid] = self.sort_key(row)
+                self.tree.insert("", "end", iid=iid, values=self.format_row(row))
+        
+        if not self._exhausted and len(self._keys) >= self.max_rows:
+            self._exhausted = self._capped = True
+            self._show_status(f"تم عرض أول {len(self._keys):,} صف؛ ضيق البحث أو الفترة لعرض البقية")
+        self._update_empty_state()
+    
+    def _update_empty_state(self):
+        if not self.tree.get_children():
+            self.empty_label.configure(text=self.empty_text)
+            self.empty_label.pack(pady=20)
+        else:
+            self.empty_label.pack_forget()
+    
+    def upsert_row(self, row):
+        """إضافة صف جديد أو تحديث صف موجود في موضعه دون إعادة بناء الجدول"""
+        iid = str(self.row_id(row))
+        key = self.sort_key(row)
+        values = self.format_row(row)
+        
+        if self.tree.exists(iid):
+            if self._keys[iid] == key:
+                self.tree.item(iid, values=values)
+                return
+            was_selected = iid in self.tree.selection()
+            self.tree.delete(iid)
+            del self._keys[iid]
+        else:
+            was_selected = False
+        
+        children = self.tree.get_children()
+        index = bisect.bisect_right([self._keys[child] for child in children], key)
+        # الصف يقع بعد آخر صفحة محملة: سيظهر عند تحميلها
+        if index == len(children) and (not self._exhausted or self._capped):
+            return
+        
+        self._keys[iid] = key
+        self.tree.insert("", index, iid=iid, values=values)
+        if was_selected:
+            self.tree.selection_add(iid)
+        self._update_empty_state()
+    
+    def remove_row(self, row_id):
+        """حذف صف من الجدول"""
+        iid = str(row_id)
+        if self.tree.exists(iid):
+            self.tree.delete(iid)
+            del self._keys[iid]
+        self._update_empty_state()
+    
+    def reload(self):
+        """إعادة التحميل من الصفحة الأولى"""
+        self._generation += 1
+        self.tree.delete(*self.tree.get_children())
+        self._keys = {}
+        self._cursor = None
+        self._exhausted = self._capped = False
+        self._hide_status()
+        self.load_more()
+    
+    def selected_values(self):
+        """قيم الصف المحدد (أو None)"""
+        selection = self.tree.selection()
+        if not selection:
+            return None
+        return self.tree.item(selection[0])['values']
 
-class Validators:
-    @staticmethod
-    def validate_phone(phone):
-        """التحقق من صحة رقم الهاتف"""
-        if not phone:
-            return True
-        import re
-        pattern = r'^[\d\s\-\+\(\)]{8,}$'
-        return bool(re.match(pattern, phone))
+class ClientSearchBox(ctk.CTkFrame):
+    """حقل بحث عن العملاء أثناء الكتابة مع قائمة بأفضل النتائج
+    (يعيد معرف العميل المختار بدلاً من اسمه).
+    البحث يبدأ بعد توقف الكتابة delay_ms وينفذ في الخلفية عبر run (مثل MainApp.run_async)
+    فلا ينتظر خيط الواجهة الخادم أو تحميل الفهرس"""
     
-    @staticmethod
-    def validate_number(value):
-        """التحقق من أن القيمة رقمية"""
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
+    def __init__(self, master, search, run, width=200, limit=8, on_select=None, delay_ms=150):
+        super().__init__(master, fg_color="transparent")
+        self.search = search
+        self.run = run
+        self.limit = limit
+        self.on_select = on_select
+        self.delay_ms = delay_ms
+        self.selected = None
+        self.matches = []
+        self._after_id = None
+        self._task = None
+        
+        self.entry = ctk.CTkEntry(self, width=width, placeholder_text="ابحث بالاسم أو الهاتف")
+        self.entry.pack(fill="x")
+        self.listbox = tk.Listbox(self, height=limit, activestyle="none", exportselection=False)
+        
+        self.entry.bind("<KeyRelease>", self._on_key)
+        self.entry.bind("<Down>", self._focus_list)
+        self.entry.bind("<Return>", lambda e: self._choose(0))
+        self.entry.bind("<Escape>", lambda e: self._hide())
+        self.listbox.bind("<ButtonRelease-1>", lambda e: self._choose_active())
+        self.listbox.bind("<Return>", lambda e: self._choose_active())
+        self.listbox.bind("<Escape>", lambda e: self._hide())
     
     @staticmethod
-    def validate_required(value):
-        """التحقق من أن الحقل مطلوب"""
-        return bool(value and str(value).strip())
+    def label(client):
+        client_id, name, _, phone = client
+        return f"{name} - {phone}  (#{client_id})" if phone else f"{name}  (#{client_id})"
+    
+    @property
+    def selected_id(self):
+        return self.selected[0] if self.selected else None
+    
+    def _on_key(self, event):
+        if event.keysym in ("Down", "Return", "Escape", "Up"):
+            return
+        self.selected = None
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        self._after_id = self.after(self.delay_ms, self._search)
+    
+    def _search(self):
+        self._after_id = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        text = self.entry.get().strip()
+        if not text:
+            self._show(text, [])
+            return
+        self._task = self.run(self.search, text, self.limit,
+                              callback=lambda matches: self._show(text, matches))
+    
+    def _show(self, text, matches):
+        # نتيجة نص تغير بعد إرسالها
+        if text != self.entry.get().strip():
+            return
+        self._task = None
+        self.matches = matches
+        self.listbox.delete(0, tk.END)
+        for client in self.matches:
+            self.listbox.insert(tk.END, self.label(client))
+        if self.matches:
+            self.listbox.configure(height=len(self.matches))
+            self.listbox.pack(fill="x")
+        else:
+            self._hide()
+    
+    def _focus_list(self, _):
+        if self.matches:
+            self.listbox.focus_set()
+            self.listbox.selection_clear(0, tk.END)
+            self.listbox.selection_set(0)
+            self.listbox.activate(0)
+    
+    def _choose_active(self):
+        selection = self.listbox.curselection()
+        self._choose(selection[0] if selection else self.listbox.index(tk.ACTIVE))
+    
+    def _choose(self, index):
+        if index >= len(self.matches):
+            return
+        self.select(self.matches[index])
+        if self.on_select:
+            self.on_select(self.selected)
+    
+    def _hide(self):
+        self.listbox.pack_forget()
+    
+    def select(self, client):
+        """تعيين العميل المختار وعرضه في الحقل"""
+        self.selected = client
+        self.entry.delete(0, tk.END)
+        self.entry.insert(0, client[1])
+        self._hide()
+    
+    def clear(self):
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+            self._after_id = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.selected = None
+        self.matches = []
+        self.entry.delete(0, tk.END)
+        self._hide()
 
 class LoginWindow(ctk.CTk):
-    def __init__(self):
+    def __init__(self, server=None):
         super().__init__()
         
-        self.auth = Auth()
+        # ملف محلي أو خادم مشترك على الشبكة (server.py)
+        self.auth = RemoteAuth(RemoteDatabase(server)) if server else Auth()
         self.setup_ui()
     
     def setup_ui(self):
@@ -387,7 +615,13 @@ class LoginWindow(ctk.CTk):
             messagebox.showerror("خطأ", "يرجى إدخال اسم المستخدم وكلمة المرور")
             return
         
-        if self.auth.login(username, password):
+        try:
+            logged_in = self.auth.login(username, password)
+        except Exception as e:
+            messagebox.showerror("خطأ", f"تعذر الاتصال بقاعدة البيانات:\n{e}")
+            return
+        
+        if logged_in:
             self.destroy()
             app = MainApp(self.auth)
             app.mainloop()
@@ -395,16 +629,100 @@ class LoginWindow(ctk.CTk):
             messagebox.showerror("خطأ", "اسم المستخدم أو كلمة المرور غير صحيحة")
 
 class MainApp(ctk.CTk):
+    BACKUP_CHECK_MS = 10 * 60 * 1000
+    
     def __init__(self, auth):
         super().__init__()
         
         self.auth = auth
-        self.client_model = ClientModel()
-        self.distribution_model = DistributionModel()
-        self.payment_model = PaymentModel()
+        # اتصال واحد مشترك بين جميع النماذج
+        self.db = auth.db
+        if self.db.is_remote:
+            self.client_model = RemoteClientModel(self.db)
+            self.distribution_model = RemoteDistributionModel(self.db)
+            self.payment_model = RemotePaymentModel(self.db)
+        else:
+            self.client_model = ClientModel(self.db)
+            self.distribution_model = DistributionModel(self.db)
+            self.payment_model = PaymentModel(self.db)
+        
+        # تنفيذ الاستعلامات في الخلفية؛ قراءات الشاشة الحالية تلغى عند التنقل
+        # (مع الخادم تجمع الكتابات هناك فلا حاجة لتجميعها هنا)
+        self.executor = BackgroundExecutor(self, db=None if self.db.is_remote else self.db)
+        self._screen_tasks = []
+        
+        # النسخ الاحتياطي المجدول (على جهاز الخادم عند العمل مع خادم مشترك)
+        self.backups = None if self.db.is_remote else BackupManager.load(self.db)
+        self.backup_job = None
         
         self.setup_ui()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.show_dashboard()
+        if self.backups:
+            self.after(self.BACKUP_CHECK_MS, self.check_backup)
+    
+    def on_close(self):
+        """إغلاق قاعدة البيانات عند الخروج"""
+        if self.backup_job:
+            self.backup_job.cancel()
+        self.executor.shutdown()
+        self.db.close()
+        self.destroy()
+    
+    def _tagged(self, fn):
+        """وسم استعلامات المهمة باسم الشاشة الحالية عند تفعيل إحصاءات قاعدة البيانات"""
+        if self.db.stats is None:
+            return fn
+        tag = f"screen:{self.current_screen}"
+        
+        def run(*args, **kwargs):
+            with self.db.tag(tag):
+                return fn(*args, **kwargs)
+        return run
+    
+    def run_write(self, fn, *args, callback=None, errback=None, **kwargs):
+        """تنفيذ عملية كتابة في الخلفية (لا تلغى عند التنقل بين الشاشات)"""
+        return self.executor.submit(
+            self._tagged(fn), *args, callback=callback, errback=errback or self.show_db_error,
+            write=True, **kwargs
+        )
+    
+    def run_async(self, fn, *args, callback=None, errback=None, **kwargs):
+        """تنفيذ استعلام في الخلفية وربطه بالشاشة الحالية"""
+        task = self.executor.submit(
+            self._tagged(fn), *args, callback=callback, errback=errback or self.show_db_error, **kwargs
+        )
+        self._screen_tasks = [t for t in self._screen_tasks if not t.done]
+        self._screen_tasks.append(task)
+        return task
+    
+    def check_backup(self):
+        """بدء نسخة احتياطية في الخلفية إذا حان موعدها"""
+        if self.backup_job is None and self.backups.due():
+            self.start_backup()
+        self.after(self.BACKUP_CHECK_MS, self.check_backup)
+    
+    def start_backup(self, on_progress=None, on_done=None):
+        """نسخة احتياطية على خطوات في خيط مستقل (واحدة في كل مرة)"""
+        def done(path, error):
+            self.backup_job = None
+            if on_done:
+                on_done(path, error)
+            elif error is not None and not isinstance(error, BackupCancelled):
+                messagebox.showerror("خطأ", f"فشل النسخ الاحتياطي: {error}")
+        
+        self.backup_job = BackupJob(self, self.backups, on_progress or (lambda copied, total: None), done)
+        return self.backup_job
+    
+    def show_db_error(self, error):
+        """عرض خطأ قاعدة البيانات"""
+        messagebox.showerror("خطأ", f"خطأ في قاعدة البيانات: {error}")
+    
+    def show_loading(self, parent):
+        """مؤشر تحميل يزال عند وصول النتائج"""
+        label = ctk.CTkLabel(parent, text="جاري التحميل...", text_color="gray")
+        label.pack(pady=20)
+        return label
     
     def setup_ui(self):
         """إعداد الواجهة الرئيسية"""
@@ -450,7 +768,9 @@ class MainApp(ctk.CTk):
             ("إدارة العملاء", self.show_clients),
             ("التوزيع اليومي", self.show_distributions),
             ("إدارة المدفوعات", self.show_payments),
+            ("كشف الحساب", self.show_statement),
             ("التقارير", self.show_reports),
+            ("أعمار المستحقات", self.show_aging),
             ("إعدادات", self.show_settings)
         ]
         
@@ -463,56 +783,123 @@ class MainApp(ctk.CTk):
         """إنشاء منطقة المحتوى"""
         self.content_frame = ctk.CTkFrame(self.main_frame)
         self.content_frame.pack(side="left", fill="both", expand=True, padx=(0, 5))
+        self.screens = {}
+        self.current_screen = None
     
-    def clear_content(self):
-        """مسح محتوى المنطقة"""
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
+    def show_screen(self, name, build, tables=()):
+        """عرض شاشة محفوظة: تبنى مرة واحدة ثم تخفى وتظهر عند التنقل،
+        وتحدث بياناتها فقط إذا تغيرت جداولها منذ آخر عرض"""
+        previous = self.screens.get(self.current_screen)
+        if previous is not None and self.current_screen != name:
+            # نتائج الشاشة السابقة لم تعد مطلوبة؛ تحدث عند العودة إليها
+            pending = [task for task in self._screen_tasks if not task.done]
+            for task in pending:
+                task.cancel()
+            if pending:
+                previous.version = None
+            self._screen_tasks = []
+            previous.frame.pack_forget()
+        
+        self.current_screen = name
+        version = self.db.data_version(*tables)
+        screen = self.screens.get(name)
+        if screen is None:
+            screen = Screen(ctk.CTkFrame(self.content_frame, fg_color="transparent"), version)
+            self.screens[name] = screen
+            screen.refresh = build(screen.frame)
+        elif screen.version != version:
+            screen.version = version
+            if screen.refresh:
+                screen.refresh()
+        
+        screen.frame.pack(fill="both", expand=True)
     
     def show_dashboard(self):
         """عرض لوحة التحكم"""
-        self.clear_content()
-        
-        title_label = ctk.CTkLabel(self.content_frame, text="لوحة التحكم", 
+        self.show_screen("dashboard", self.build_dashboard, DistributionModel.SUMMARY_TABLES)
+    
+    def show_clients(self):
+        """عرض إدارة العملاء"""
+        self.show_screen("clients", self.build_clients, ("clients", "distributions", "payments"))
+    
+    def show_distributions(self):
+        """عرض التوزيع اليومي"""
+        self.show_screen("distributions", self.build_distributions,
+                         ("clients", "distributions", "product_prices"))
+    
+    def show_payments(self):
+        """عرض إدارة المدفوعات"""
+        self.show_screen("payments", self.build_payments, ("clients", "distributions", "payments"))
+    
+    def show_statement(self, client=None):
+        """عرض كشف حساب عميل (client: (المعرف، الاسم، العنوان، الهاتف) لفتحه مباشرة)"""
+        self.show_screen("statement", self.build_statement, ("clients", "distributions", "payments"))
+        if client is not None:
+            self.load_statement(client)
+    
+    def show_reports(self):
+        """عرض التقارير"""
+        self.show_screen("reports", self.build_reports, ("clients", "distributions", "payments"))
+    
+    def show_aging(self):
+        """عرض أعمار المستحقات"""
+        self.show_screen("aging", self.build_aging, ("clients", "distributions", "payments"))
+    
+    def show_settings(self):
+        """عرض الإعدادات"""
+        self.show_screen("settings", self.build_settings)
+    
+    def build_dashboard(self, frame):
+        """بناء لوحة التحكم"""
+        title_label = ctk.CTkLabel(frame, text="لوحة التحكم", 
                                  font=("Arial", 16, "bold"))
         title_label.pack(pady=10)
         
         # بطاقات الإحصائيات
-        stats_frame = ctk.CTkFrame(self.content_frame)
+        stats_frame = ctk.CTkFrame(frame)
         stats_frame.pack(fill="x", padx=20, pady=10)
         
-        # إحصائيات سريعة
-        clients_count = len(self.client_model.get_all_clients())
-        today_distributions = self.distribution_model.get_daily_distributions()
-        total_today = sum(dist[5] for dist in today_distributions)  # total_amount
-        
-        stats_data = [
-            ("إجمالي العملاء", f"{clients_count}", "blue"),
-            ("التوزيع اليومي", f"{total_today:,.2f} د.ج", "green"),
-            ("سعر اليوم", f"{self.distribution_model.get_today_price():,.2f} د.ج/كغ", "orange")
-        ]
+        def refresh():
+            for widget in stats_frame.winfo_children():
+                widget.destroy()
+            self.show_loading(stats_frame)
+            self.run_async(self.distribution_model.dashboard_summary, callback=show_stats)
         
-        for i, (title, value, color) in enumerate(stats_data):
-            stat_card = ctk.CTkFrame(stats_frame, width=200, height=100)
-            stat_card.grid(row=0, column=i, padx=10, pady=10)
-            stat_card.pack_propagate(False)
-            
-            title_label = ctk.CTkLabel(stat_card, text=title, font=("Arial", 14))
-            title_label.pack(pady=(15, 5))
+        def show_stats(summary):
+            for widget in stats_frame.winfo_children():
+                widget.destroy()
+            stats_data = [
+                ("إجمالي العملاء", f"{summary['clients']}", "blue"),
+                ("التوزيع اليومي", f"{summary['total_amount']:,.2f} د.ج", "green"),
+                ("سعر اليوم", f"{summary['price']:,.2f} د.ج/كغ", "orange"),
+                ("كمية اليوم", f"{summary['total_kg']:,.2f} كغ", "green"),
+                ("مدفوع / متبقي اليوم",
+                 f"{summary['total_paid']:,.0f} / {summary['total_remaining']:,.0f}", "green"),
+                ("المستحقات", f"{summary['receivables']:,.2f} د.ج", "red"),
+            ]
             
-            value_label = ctk.CTkLabel(stat_card, text=value, font=("Arial", 18, "bold"))
-            value_label.pack(pady=5)
-    
-    def show_clients(self):
-        """عرض إدارة العملاء"""
-        self.clear_content()
+            for i, (title, value, color) in enumerate(stats_data):
+                stat_card = ctk.CTkFrame(stats_frame, width=200, height=100)
+                stat_card.grid(row=i // 3, column=i % 3, padx=10, pady=10)
+                stat_card.pack_propagate(False)
+                
+                title_label = ctk.CTkLabel(stat_card, text=title, font=("Arial", 14))
+                title_label.pack(pady=(15, 5))
+                
+                value_label = ctk.CTkLabel(stat_card, text=value, font=("Arial", 18, "bold"))
+                value_label.pack(pady=5)
         
-        title_label = ctk.CTkLabel(self.content_frame, text="إدارة العملاء", 
+        refresh()
+        return refresh
+    
+    def build_clients(self, frame):
+        """بناء شاشة إدارة العملاء"""
+        title_label = ctk.CTkLabel(frame, text="إدارة العملاء", 
                                  font=("Arial", 16, "bold"))
         title_label.pack(pady=10)
         
         # إطار الإضافة
-        add_frame = ctk.CTkFrame(self.content_frame)
+        add_frame = ctk.CTkFrame(frame)
         add_frame.pack(fill="x", padx=20, pady=10)
         
         # حقول الإدخال - محاذاة لليسار
@@ -544,75 +931,81 @@ class MainApp(ctk.CTk):
         button_frame = ctk.CTkFrame(input_frame)
         button_frame.grid(row=1, column=1, padx=5, pady=5, sticky="w")
         add_btn = ctk.CTkButton(button_frame, text="إضافة عميل", command=lambda: self.add_client_handler(
-            name_entry, address_entry, phone_entry, show_clients_list
+            name_entry, address_entry, phone_entry, refresh_client
         ))
         add_btn.pack(side="right", padx=(5, 0))
         
         # قائمة العملاء
-        list_frame = ctk.CTkFrame(self.content_frame)
+        list_frame = ctk.CTkFrame(frame)
         list_frame.pack(fill="both", expand=True, padx=20, pady=10)
         
-        def show_clients_list():
-            # مسح القائمة الحالية
-            for widget in list_frame.winfo_children():
-                widget.destroy()
-            
-            clients = self.client_model.get_all_clients()
+        # جدول يجلب العملاء صفحة بصفحة عند التمرير ويبقى حياً بين التحديثات
+        columns = ("ID", "الاسم", "العنوان", "الهاتف", "الرصيد", "الإجراءات")
+        table = VirtualTable(
+            list_frame, columns,
+            fetch_page=lambda after, limit: self.client_model.get_clients_page(after, limit),
+            page_cursor=lambda client: (client[1], client[0]),
+            format_row=lambda client: (
+                client[0], client[1], client[2] or "", client[3] or "",
+                f"{client[6]:,.2f} د.ج", "تعديل / حذف"
+            ),
+            empty_text="لا يوجد عملاء",
+            runner=self.run_async
+        )
+        table.pack(fill="both", expand=True, padx=10, pady=10)
+        table.load_more()
+        
+        def refresh_client(client_id):
+            """تحديث صف عميل واحد بعد الإضافة أو التعديل أو الحذف"""
+            def apply(client):
+                if client and client[5]:
+                    table.upsert_row(client)
+                else:
+                    table.remove_row(client_id)
             
-            if not clients:
-                ctk.CTkLabel(list_frame, text="لا يوجد عملاء").pack(pady=20)
+            self.run_async(self.client_model.get_client_with_balance, client_id, callback=apply)
+        
+        # إطار أزرار الإجراءات
+        action_frame = ctk.CTkFrame(list_frame)
+        action_frame.pack(fill="x", padx=10, pady=5)
+        
+        def edit_client():
+            values = table.selected_values()
+            if not values:
+                messagebox.showwarning("تحذير", "يرجى اختيار عميل للتعديل")
                 return
             
-            # إنشاء Treeview مع أزرار الإجراءات
-            columns = ("ID", "الاسم", "العنوان", "الهاتف", "الرصيد", "الإجراءات")
-            tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=12)
-            
-            # عناوين الأعمدة
-            for col in columns:
-                tree.heading(col, text=col)
-                tree.column(col, width=120)
-            
-            # إضافة البيانات
-            for client in clients:
-                balance = self.client_model.get_client_balance(client[0])
-                tree.insert("", "end", values=(
-                    client[0], client[1], client[2] or "", client[3] or "",
-                    f"{balance:,.2f} د.ج", "تعديل / حذف"
-                ))
-            
-            tree.pack(fill="both", expand=True, padx=10, pady=10)
+            client_id = values[0]
+            self.edit_client_dialog(client_id, refresh_client)
+        
+        def delete_client():
+            values = table.selected_values()
+            if not values:
+                messagebox.showwarning("تحذير", "يرجى اختيار عميل للحذف")
+                return
             
-            # إطار أزرار الإجراءات
-            action_frame = ctk.CTkFrame(list_frame)
-            action_frame.pack(fill="x", padx=10, pady=5)
+            client_id = values[0]
+            client_name = values[1]
             
-            def edit_client():
-                selection = tree.selection()
-                if not selection:
-                    messagebox.showwarning("تحذير", "يرجى اختيار عميل للتعديل")
-                    return
-                
-                client_id = tree.item(selection[0])['values'][0]
-                self.edit_client_dialog(client_id, show_clients_list)
+            def on_deleted(_):
+                messagebox.showinfo("نجاح", "تم حذف العميل بنجاح")
+                table.remove_row(client_id)
             
-            def delete_client():
-                selection = tree.selection()
-                if not selection:
-                    messagebox.showwarning("تحذير", "يرجى اختيار عميل للحذف")
-                    return
-                
-                client_id = tree.item(selection[0])['values'][0]
-                client_name = tree.item(selection[0])['values'][1]
-                
-                if messagebox.askyesno("تأكيد", f"هل أنت متأكد من حذف العميل {client_name}؟"):
-                    self.client_model.delete_client(client_id)
-                    messagebox.showinfo("نجاح", "تم حذف العميل بنجاح")
-                    show_clients_list()
-            
-            ctk.CTkButton(action_frame, text="تعديل العميل المحدد", command=edit_client).pack(side="right", padx=5)
-            ctk.CTkButton(action_frame, text="حذف العميل المحدد", command=delete_client, fg_color="red").pack(side="right", padx=5)
+            if messagebox.askyesno("تأكيد", f"هل أنت متأكد من حذف العميل {client_name}؟"):
+                self.run_write(self.client_model.delete_client, client_id, callback=on_deleted)
+        
+        def open_statement():
+            values = table.selected_values()
+            if not values:
+                messagebox.showwarning("تحذير", "يرجى اختيار عميل لعرض كشف حسابه")
+                return
+            self.show_statement(tuple(values[:4]))
+        
+        ctk.CTkButton(action_frame, text="تعديل العميل المحدد", command=edit_client).pack(side="right", padx=5)
+        ctk.CTkButton(action_frame, text="حذف العميل المحدد", command=delete_client, fg_color="red").pack(side="right", padx=5)
+        ctk.CTkButton(action_frame, text="كشف الحساب", command=open_statement).pack(side="right", padx=5)
         
-        show_clients_list()
+        return table.reload
 
     def add_client_handler(self, name_entry, address_entry, phone_entry, callback):
         """معالجة إضافة عميل جديد"""
@@ -624,16 +1017,23 @@ class MainApp(ctk.CTk):
             messagebox.showerror("خطأ", "يرجى إدخال اسم العميل")
             return
         
-        self.client_model.add_client(name, address, phone)
-        messagebox.showinfo("نجاح", "تم إضافة العميل بنجاح")
-        name_entry.delete(0, tk.END)
-        address_entry.delete(0, tk.END)
-        phone_entry.delete(0, tk.END)
-        callback()
+        def on_added(client_id):
+            messagebox.showinfo("نجاح", "تم إضافة العميل بنجاح")
+            name_entry.delete(0, tk.END)
+            address_entry.delete(0, tk.END)
+            phone_entry.delete(0, tk.END)
+            callback(client_id)
+        
+        self.run_write(self.client_model.add_client, name, address, phone, callback=on_added)
 
     def edit_client_dialog(self, client_id, callback):
         """نافذة تعديل العميل"""
-        client = self.client_model.get_client_by_id(client_id)
+        self.run_async(
+            self.client_model.get_client_by_id, client_id,
+            callback=lambda client: self._open_edit_client_dialog(client_id, client, callback)
+        )
+    
+    def _open_edit_client_dialog(self, client_id, client, callback):
         if not client:
             messagebox.showerror("خطأ", "لم يتم العثور على العميل")
             return
@@ -689,10 +1089,15 @@ class MainApp(ctk.CTk):
                 messagebox.showerror("خطأ", "يرجى إدخال اسم العميل")
                 return
             
-            self.client_model.update_client(client_id, new_name, new_address, new_phone)
-            messagebox.showinfo("نجاح", "تم تعديل بيانات العميل بنجاح")
-            dialog.destroy()
-            callback()
+            def on_saved(_):
+                messagebox.showinfo("نجاح", "تم تعديل بيانات العميل بنجاح")
+                dialog.destroy()
+                callback(client_id)
+            
+            self.run_write(
+                self.client_model.update_client, client_id, new_name, new_address, new_phone,
+                callback=on_saved
+            )
         
         button_frame = ctk.CTkFrame(dialog)
         button_frame.pack(fill="x", padx=20, pady=10)
@@ -700,22 +1105,30 @@ class MainApp(ctk.CTk):
         ctk.CTkButton(button_frame, text="حفظ التعديلات", command=save_changes).pack(side="left", padx=5)
         ctk.CTkButton(button_frame, text="إلغاء", command=dialog.destroy).pack(side="left", padx=5)
     
-    def show_distributions(self):
-        """عرض التوزيع اليومي"""
-        self.clear_content()
-        
-        title_label = ctk.CTkLabel(self.content_frame, text="التوزيع اليومي", 
+    def build_distributions(self, frame):
+        """بناء شاشة التوزيع اليومي"""
+        title_label = ctk.CTkLabel(frame, text="التوزيع اليومي", 
                                  font=("Arial", 16, "bold"))
         title_label.pack(pady=10)
         
         # إطار سعر اليوم
-        price_frame = ctk.CTkFrame(self.content_frame)
+        price_frame = ctk.CTkFrame(frame)
         price_frame.pack(fill="x", padx=20, pady=10)
         
-        current_price = self.distribution_model.get_today_price()
-        price_label = ctk.CTkLabel(price_frame, text=f"سعر اليوم: {current_price:,.2f} د.ج/كغ", 
+        price_label = ctk.CTkLabel(price_frame, text="سعر اليوم: جاري التحميل...", 
                     font=("Arial", 14))
         price_label.pack(side="left", padx=10, pady=5)
+        prices_loaded = False
+        
+        def on_prices_loaded(_):
+            nonlocal prices_loaded
+            prices_loaded = True
+            current_price = self.distribution_model.get_today_price()
+            price_label.configure(text=f"سعر اليوم: {current_price:,.2f} د.ج/كغ")
+            calculate_totals()
+        
+        # تحميل تقويم الأسعار في الخلفية
+        self.run_async(self.distribution_model.load_prices, callback=on_prices_loaded)
         
         ctk.CTkLabel(price_frame, text="تحديث السعر:").pack(side="left", padx=5)
         price_entry = ctk.CTkEntry(price_frame, width=100)
@@ -724,20 +1137,21 @@ class MainApp(ctk.CTk):
         def update_price():
             new_price = price_entry.get().strip()
             if Validators.validate_number(new_price):
-                self.distribution_model.set_today_price(float(new_price))
-                messagebox.showinfo("نجاح", "تم تحديث السعر بنجاح")
-                # تحديث عرض السعر
-                current_price = self.distribution_model.get_today_price()
-                price_label.configure(text=f"سعر اليوم: {current_price:,.2f} د.ج/كغ")
-                price_entry.delete(0, tk.END)
-                calculate_totals()  # إعادة حساب التوزيعات
+                def on_updated(_):
+                    messagebox.showinfo("نجاح", "تم تحديث السعر بنجاح")
+                    # تحديث عرض السعر
+                    on_prices_loaded(None)
+                    price_entry.delete(0, tk.END)
+                
+                self.run_write(self.distribution_model.set_today_price, float(new_price),
+                               callback=on_updated)
             else:
                 messagebox.showerror("خطأ", "يرجى إدخال سعر صحيح")
         
         ctk.CTkButton(price_frame, text="تحديث", command=update_price).pack(side="left", padx=5)
         
         # إطار التوزيع الجديد
-        dist_frame = ctk.CTkFrame(self.content_frame)
+        dist_frame = ctk.CTkFrame(frame)
         dist_frame.pack(fill="x", padx=20, pady=10)
         
         ctk.CTkLabel(dist_frame, text="تسجيل توزيع جديد", font=("Arial", 14)).pack(pady=5)
@@ -748,11 +1162,12 @@ class MainApp(ctk.CTk):
         # الصف الأول
         client_frame = ctk.CTkFrame(input_frame)
         client_frame.grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        clients = self.client_model.get_all_clients()
-        client_names = [client[1] for client in clients]
-        client_combo = ctk.CTkComboBox(client_frame, values=client_names, width=200)
-        client_combo.pack(side="right", padx=(5, 0))
-        ctk.CTkLabel(client_frame, text="العميل:").pack(side="right")
+        client_box = ClientSearchBox(client_frame, self.client_model.search_clients, self.run_async, width=200)
+        client_box.pack(side="right", padx=(5, 0))
+        ctk.CTkLabel(client_frame, text="العميل:").pack(side="right", anchor="n")
+        
+        # بناء فهرس البحث عن العملاء في الخلفية (يحدث تلقائياً مع كل تعديل)
+        self.run_async(self.client_model.load_search_index)
         
         quantity_frame = ctk.CTkFrame(input_frame)
         quantity_frame.grid(row=0, column=1, padx=5, pady=5, sticky="w")
@@ -760,6 +1175,13 @@ class MainApp(ctk.CTk):
         quantity_entry.pack(side="right", padx=(5, 0))
         ctk.CTkLabel(quantity_frame, text="الكمية (كغ):").pack(side="right")
         
+        date_frame = ctk.CTkFrame(input_frame)
+        date_frame.grid(row=0, column=2, padx=5, pady=5, sticky="w")
+        date_entry = ctk.CTkEntry(date_frame, width=110)
+        date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
+        date_entry.pack(side="right", padx=(5, 0))
+        ctk.CTkLabel(date_frame, text="التاريخ:").pack(side="right")
+        
         # الصف الثاني
         paid_frame = ctk.CTkFrame(input_frame)
         paid_frame.grid(row=1, column=0, padx=5, pady=5, sticky="w")
@@ -775,7 +1197,12 @@ class MainApp(ctk.CTk):
         def calculate_totals():
             try:
                 quantity = float(quantity_entry.get() or 0)
-                price = self.distribution_model.get_today_price()
+                # السعر من تقويم الأسعار في الذاكرة (بدون استعلام)
+                distribution_date = date_entry.get().strip()
+                if prices_loaded and Validators.validate_date(distribution_date):
+                    price = self.distribution_model.get_price_on(distribution_date)
+                else:
+                    price = 0.0
                 paid = float(paid_entry.get() or 0)
                 
                 total = quantity * price
@@ -794,16 +1221,17 @@ class MainApp(ctk.CTk):
         # ربط الحقول بالحساب التلقائي
         quantity_entry.bind("<KeyRelease>", lambda e: calculate_totals())
         paid_entry.bind("<KeyRelease>", lambda e: calculate_totals())
+        date_entry.bind("<KeyRelease>", lambda e: calculate_totals())
         
         button_frame = ctk.CTkFrame(input_frame)
         button_frame.grid(row=1, column=2, padx=5, pady=5, sticky="w")
         
         def add_distribution():
-            client_name = client_combo.get()
+            client_id = client_box.selected_id
             quantity = quantity_entry.get().strip()
             paid = paid_entry.get().strip()
             
-            if not client_name or not quantity:
+            if not client_id or not quantity:
                 messagebox.showerror("خطأ", "يرجى اختيار العميل وإدخال الكمية")
                 return
             
@@ -815,111 +1243,394 @@ class MainApp(ctk.CTk):
                 messagebox.showerror("خطأ", "يرجى إدخال مبلغ مدفوع صحيح")
                 return
             
-            # البحث عن معرف العميل
-            client_id = None
-            for client in clients:
-                if client[1] == client_name:
-                    client_id = client[0]
-                    break
+            distribution_date = date_entry.get().strip()
+            if not Validators.validate_date(distribution_date):
+                messagebox.showerror("خطأ", "يرجى إدخال تاريخ صحيح (YYYY-MM-DD)")
+                return
             
-            if client_id:
-                self.distribution_model.add_distribution(
-                    client_id, float(quantity), float(paid)
-                )
+            def on_added(distribution_id):
                 messagebox.showinfo("نجاح", "تم تسجيل التوزيع بنجاح")
                 quantity_entry.delete(0, tk.END)
                 paid_entry.delete(0, tk.END)
                 paid_entry.insert(0, "0")
                 calculate_totals()
-                show_daily_distributions()
-            else:
-                messagebox.showerror("خطأ", "لم يتم العثور على العميل")
+                refresh_distribution(distribution_id)
+            
+            self.run_write(
+                self.distribution_model.add_distribution,
+                client_id, float(quantity), float(paid), distribution_date,
+                callback=on_added
+            )
         
         add_btn = ctk.CTkButton(button_frame, text="تسجيل التوزيع", command=add_distribution)
         add_btn.pack(side="right", padx=(5, 0))
         
+        def import_distributions():
+            path = filedialog.askopenfilename(
+                title="استيراد توزيعات", filetypes=[("CSV", "*.csv")]
+            )
+            if not path:
+                return
+            
+            import_btn.configure(state="disabled", text="جاري الاستيراد...")
+            
+            def on_failed(error):
+                import_btn.configure(state="normal", text="استيراد من CSV")
+                messagebox.showerror("خطأ", f"فشل الاستيراد: {error}")
+            
+            self.run_write(
+                self.distribution_model.import_distributions_csv, path,
+                callback=lambda result: on_imported(*result), errback=on_failed
+            )
+        
+        def on_imported(imported, rejected):
+            import_btn.configure(state="normal", text="استيراد من CSV")
+            if imported:
+                table.reload()
+            if not rejected:
+                messagebox.showinfo("نجاح", f"تم استيراد {imported} توزيع بنجاح")
+                return
+            
+            if messagebox.askyesno("تحذير", f"تم استيراد {imported} توزيع ورفض {len(rejected)} سطر.\nحفظ تقرير الأسطر المرفوضة؟"):
+                report_path = filedialog.asksaveasfilename(
+                    defaultextension=".csv", filetypes=[("CSV", "*.csv")]
+                )
+                if report_path:
+                    with open(report_path, "w", newline="", encoding="utf-8-sig") as f:
+                        writer = csv.writer(f)
+                        writer.writerow(["السطر", "السبب", "البيانات"])
+                        for line_number, row, reason in rejected:
+                            writer.writerow([line_number, reason, *row])
+        
+        import_btn = ctk.CTkButton(button_frame, text="استيراد من CSV", command=import_distributions)
+        import_btn.pack(side="right", padx=(5, 0))
+        
         # قائمة التوزيعات اليومية
-        list_frame = ctk.CTkFrame(self.content_frame)
+        list_frame = ctk.CTkFrame(frame)
         list_frame.pack(fill="both", expand=True, padx=20, pady=10)
         
-        def show_daily_distributions():
-            for widget in list_frame.winfo_children():
-                widget.destroy()
+        columns = ("ID", "العميل", "الكمية (كغ)", "السعر", "الإجمالي", "المدفوع", "المتبقي", "التاريخ", "الإجراءات")
+        table = VirtualTable(
+            list_frame, columns,
+            fetch_page=lambda before_id, limit: self.distribution_model.get_daily_distributions_page(
+                before_id=before_id, limit=limit
+            ),
+            page_cursor=lambda dist: dist[0],
+            sort_key=lambda dist: -dist[0],  # الأحدث أولاً
+            format_row=lambda dist: (
+                dist[0],  # ID
+                dist[8],  # client_name
+                f"{dist[3]:.2f}",
+                f"{dist[4]:,.2f}",
+                f"{dist[5]:,.2f}",
+                f"{dist[6]:,.2f}",
+                f"{dist[7]:,.2f}",
+                dist[2],
+                "تعديل / حذف"
+            ),
+            height=10, column_width=90,
+            empty_text="لا توجد توزيعات لهذا اليوم",
+            runner=self.run_async
+        )
+        table.pack(fill="both", expand=True, padx=10, pady=10)
+        table.load_more()
+        
+        def refresh_distribution(distribution_id):
+            """إضافة أو تحديث صف توزيع واحد دون إعادة بناء القائمة"""
+            today = str(datetime.now().date())
             
-            distributions = self.distribution_model.get_daily_distributions()
+            def apply(dist):
+                if dist and str(dist[2]) == today:
+                    table.upsert_row(dist)
+                else:
+                    table.remove_row(distribution_id)
             
-            if not distributions:
-                ctk.CTkLabel(list_frame, text="لا توجد توزيعات لهذا اليوم").pack(pady=20)
+            self.run_async(self.distribution_model.get_distribution_with_client, distribution_id,
+                           callback=apply)
+        
+        # أزرار الإجراءات للتوزيعات
+        action_frame = ctk.CTkFrame(list_frame)
+        action_frame.pack(fill="x", padx=10, pady=5)
+        
+        def delete_distribution():
+            values = table.selected_values()
+            if not values:
+                messagebox.showwarning("تحذير", "يرجى اختيار توزيع للحذف")
                 return
             
-            columns = ("ID", "العميل", "الكمية (كغ)", "السعر", "الإجمالي", "المدفوع", "المتبقي", "التاريخ", "الإجراءات")
-            tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=10)
+            dist_id = values[0]
+            client_name = values[1]
+            
+            def on_deleted(_):
+                table.remove_row(dist_id)
+                messagebox.showinfo("نجاح", "تم حذف التوزيع بنجاح")
             
+            if messagebox.askyesno("تأكيد", f"هل أنت متأكد من حذف توزيع {client_name}؟"):
+                self.run_write(self.distribution_model.delete_distribution, dist_id,
+                               callback=on_deleted)
+        
+        ctk.CTkButton(action_frame, text="حذف التوزيع المحدد", command=delete_distribution, 
+                     fg_color="red").pack(side="right", padx=5)
+        
+        calculate_totals()  # حساب أولي
+        
+        def refresh():
+            self.run_async(self.distribution_model.load_prices, callback=on_prices_loaded)
+            table.reload()
+        
+        return refresh
+    
+    def build_payments(self, frame):
+        """بناء شاشة إدارة المدفوعات"""
+        title_label = ctk.CTkLabel(frame, text="إدارة المدفوعات", 
+                                 font=("Arial", 16, "bold"))
+        title_label.pack(pady=10)
+        
+        # إطار تسجيل دفعة جديدة
+        form_frame = ctk.CTkFrame(frame)
+        form_frame.pack(fill="x", padx=20, pady=10)
+        
+        ctk.CTkLabel(form_frame, text="تسجيل دفعة (تسدد التوزيعات الأقدم أولاً)",
+                     font=("Arial", 14)).pack(pady=5)
+        
+        input_frame = ctk.CTkFrame(form_frame)
+        input_frame.pack(fill="x", padx=10, pady=5)
+        
+        client_frame = ctk.CTkFrame(input_frame)
+        client_frame.grid(row=0, column=0, rowspan=2, padx=5, pady=5, sticky="nw")
+        client_box = ClientSearchBox(client_frame, self.client_model.search_clients, self.run_async, width=220,
+                                     on_select=lambda client: load_client(client[0]))
+        client_box.pack(side="right", padx=(5, 0))
+        ctk.CTkLabel(client_frame, text="العميل:").pack(side="right", anchor="n")
+        
+        self.run_async(self.client_model.load_search_index)
+        
+        amount_frame = ctk.CTkFrame(input_frame)
+        amount_frame.grid(row=0, column=1, padx=5, pady=5, sticky="w")
+        amount_entry = ctk.CTkEntry(amount_frame, width=120, placeholder_text="المبلغ")
+        amount_entry.pack(side="right", padx=(5, 0))
+        ctk.CTkLabel(amount_frame, text="المبلغ:").pack(side="right")
+        
+        method_frame = ctk.CTkFrame(input_frame)
+        method_frame.grid(row=0, column=2, padx=5, pady=5, sticky="w")
+        method_combo = ctk.CTkComboBox(method_frame, values=["نقدي", "تحويل", "شيك"], width=100)
+        method_combo.set("نقدي")
+        method_combo.pack(side="right", padx=(5, 0))
+        ctk.CTkLabel(method_frame, text="الطريقة:").pack(side="right")
+        
+        description_frame = ctk.CTkFrame(input_frame)
+        description_frame.grid(row=1, column=1, padx=5, pady=5, sticky="w")
+        description_entry = ctk.CTkEntry(description_frame, width=200, placeholder_text="ملاحظة")
+        description_entry.pack(side="right", padx=(5, 0))
+        ctk.CTkLabel(description_frame, text="الوصف:").pack(side="right")
+        
+        balance_label = ctk.CTkLabel(input_frame, text="الرصيد المستحق: -",
+                                     font=("Arial", 12, "bold"))
+        balance_label.grid(row=1, column=2, padx=5, pady=5, sticky="w")
+        
+        def make_tree(parent, columns, height):
+            tree_frame = ctk.CTkFrame(parent)
+            tree_frame.pack(fill="both", expand=True, padx=10, pady=5)
+            tree = ttk.Treeview(tree_frame, columns=columns, show="headings", height=height)
             for col in columns:
                 tree.heading(col, text=col)
-                tree.column(col, width=90)
+                tree.column(col, width=110)
+            scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side="right", fill="y")
+            tree.pack(side="left", fill="both", expand=True)
+            return tree
+        
+        # تفاصيل توزيع آخر دفعة
+        allocation_frame = ctk.CTkFrame(frame)
+        allocation_frame.pack(fill="both", expand=True, padx=20, pady=5)
+        allocation_label = ctk.CTkLabel(allocation_frame, text="توزيع الدفعة على التوزيعات")
+        allocation_label.pack(pady=5)
+        allocation_tree = make_tree(allocation_frame, ("التوزيع", "التاريخ", "المبلغ المسدد", "المتبقي"), 6)
+        
+        # مدفوعات العميل المختار
+        history_frame = ctk.CTkFrame(frame)
+        history_frame.pack(fill="both", expand=True, padx=20, pady=5)
+        ctk.CTkLabel(history_frame, text="مدفوعات العميل").pack(pady=5)
+        history_tree = make_tree(history_frame, ("ID", "التاريخ", "المبلغ", "الطريقة", "الوصف"), 6)
+        
+        def load_client(client_id):
+            def on_loaded(result):
+                balance, payments = result
+                balance_label.configure(text=f"الرصيد المستحق: {balance:,.2f}")
+                history_tree.delete(*history_tree.get_children())
+                for payment in payments:
+                    history_tree.insert("", "end", values=(
+                        payment[0], payment[2], f"{payment[3]:,.2f}", payment[4], payment[5] or ""
+                    ))
             
-            for dist in distributions:
-                tree.insert("", "end", values=(
-                    dist[0],  # ID
-                    dist[8],  # client_name
-                    f"{dist[3]:.2f}",
-                    f"{dist[4]:,.2f}",
-                    f"{dist[5]:,.2f}",
-                    f"{dist[6]:,.2f}",
-                    f"{dist[7]:,.2f}",
-                    dist[2],
-                    "تعديل / حذف"
-                ))
+            self.run_async(
+                lambda: (self.client_model.get_client_balance(client_id),
+                         self.payment_model.get_client_payments(client_id)),
+                callback=on_loaded
+            )
+        
+        def add_payment():
+            client_id = client_box.selected_id
+            amount = amount_entry.get().strip()
             
-            tree.pack(fill="both", expand=True, padx=10, pady=10)
+            if not client_id:
+                messagebox.showerror("خطأ", "يرجى اختيار العميل")
+                return
             
-            # أزرار الإجراءات للتوزيعات
-            action_frame = ctk.CTkFrame(list_frame)
-            action_frame.pack(fill="x", padx=10, pady=5)
+            if not Validators.validate_number(amount) or float(amount) <= 0:
+                messagebox.showerror("خطأ", "يرجى إدخال مبلغ صحيح")
+                return
             
-            def delete_distribution():
-                selection = tree.selection()
-                if not selection:
-                    messagebox.showwarning("تحذير", "يرجى اختيار توزيع للحذف")
-                    return
-                
-                dist_id = tree.item(selection[0])['values'][0]
-                client_name = tree.item(selection[0])['values'][1]
-                
-                if messagebox.askyesno("تأكيد", f"هل أنت متأكد من حذف توزيع {client_name}؟"):
-                    # سيتم إضافة دالة الحذف في النموذج لاحقاً
-                    messagebox.showinfo("معلومة", "سيتم تطوير دالة الحذف في النسخة القادمة")
-                    # show_daily_distributions()
+            def on_added(result):
+                allocation_tree.delete(*allocation_tree.get_children())
+                for distribution_id, distribution_date, allocated, remaining in result["allocations"]:
+                    allocation_tree.insert("", "end", values=(
+                        distribution_id, distribution_date, f"{allocated:,.2f}", f"{remaining:,.2f}"
+                    ))
+                text = f"الدفعة #{result['payment_id']}: سددت {len(result['allocations'])} توزيع"
+                if result["unallocated"]:
+                    text += f" | مبلغ زائد غير موزع: {result['unallocated']:,.2f}"
+                allocation_label.configure(text=text)
+                amount_entry.delete(0, tk.END)
+                description_entry.delete(0, tk.END)
+                load_client(client_id)
             
-            ctk.CTkButton(action_frame, text="حذف التوزيع المحدد", command=delete_distribution, 
-                         fg_color="red").pack(side="right", padx=5)
+            self.run_write(
+                self.payment_model.add_payment,
+                client_id, float(amount), method_combo.get(), description_entry.get().strip(),
+                callback=on_added
+            )
         
-        show_daily_distributions()
-        calculate_totals()  # حساب أولي
-    
-    def show_payments(self):
-        """عرض إدارة المدفوعات"""
-        self.clear_content()
+        ctk.CTkButton(input_frame, text="تسجيل الدفعة", command=add_payment).grid(
+            row=0, column=3, padx=5, pady=5, sticky="w"
+        )
+        
+        def refresh():
+            if client_box.selected_id:
+                load_client(client_box.selected_id)
         
-        title_label = ctk.CTkLabel(self.content_frame, text="إدارة المدفوعات", 
+        return refresh
+    
+    def build_statement(self, frame):
+        """بناء شاشة كشف الحساب: توزيعات العميل ودفعاته بالترتيب الزمني مع الرصيد الجاري،
+        تجلب صفحة بصفحة ويحمل رصيد آخر صف إلى الصفحة التالية"""
+        title_label = ctk.CTkLabel(frame, text="كشف الحساب", 
                                  font=("Arial", 16, "bold"))
         title_label.pack(pady=10)
         
-        # سيتم تطوير هذه الواجهة بشكل كامل
-        ctk.CTkLabel(self.content_frame, text="واجهة إدارة المدفوعات - قيد التطوير",
-                    font=("Arial", 14)).pack(pady=50)
-    
-    def show_reports(self):
-        """عرض التقارير"""
-        self.clear_content()
+        state = {"client": None, "start": None}
+        
+        select_frame = ctk.CTkFrame(frame)
+        select_frame.pack(fill="x", padx=20, pady=10)
+        
+        client_box = ClientSearchBox(select_frame, self.client_model.search_clients, self.run_async, width=220,
+                                     on_select=lambda client: load_client(client))
+        client_box.pack(side="right", padx=(5, 0))
+        ctk.CTkLabel(select_frame, text="العميل:").pack(side="right", anchor="n", padx=5)
+        
+        ctk.CTkLabel(select_frame, text="من:").pack(side="left", anchor="n", padx=5)
+        start_entry = ctk.CTkEntry(select_frame, width=100, placeholder_text="كل السجل")
+        start_entry.pack(side="left", anchor="n", padx=5)
+        start_entry.insert(0, datetime.now().strftime("%Y-01-01"))
+        
+        def apply_start():
+            if state["client"] is not None:
+                load_client(state["client"])
         
-        title_label = ctk.CTkLabel(self.content_frame, text="التقارير", 
+        ctk.CTkButton(select_frame, text="عرض", width=80, command=apply_start).pack(side="left", anchor="n", padx=5)
+        
+        export_status = ctk.CTkLabel(select_frame, text="")
+        
+        def on_export_done(written, error):
+            export_btn.configure(state="normal")
+            if error is not None:
+                export_status.configure(text="")
+                messagebox.showerror("خطأ", f"فشل التصدير: {error}")
+            else:
+                export_status.configure(text=f"تم تصدير {written:,} سطر")
+        
+        def start_export():
+            if state["client"] is None:
+                messagebox.showwarning("تحذير", "يرجى اختيار عميل")
+                return
+            path = filedialog.asksaveasfilename(
+                defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx"), ("CSV", "*.csv")]
+            )
+            if not path:
+                return
+            export_btn.configure(state="disabled")
+            export_status.configure(text="جاري التصدير...")
+            ExportJob(frame, self.db, "statement", path,
+                      on_progress=lambda written, total: None, on_done=on_export_done,
+                      start=state["start"], client_id=state["client"][0])
+        
+        export_btn = ctk.CTkButton(select_frame, text="تصدير...", width=80, command=start_export)
+        export_btn.pack(side="left", anchor="n", padx=5)
+        export_status.pack(side="left", anchor="n", padx=5)
+        
+        opening_label = ctk.CTkLabel(frame, text="", font=("Arial", 12, "bold"))
+        opening_label.pack(fill="x", padx=20)
+        
+        columns = ("التاريخ", "البيان", "الكمية (كغ)", "مدين", "دائن", "الرصيد", "السعر / الوصف")
+        table = VirtualTable(
+            frame, columns,
+            fetch_page=lambda after, limit: self.client_model.get_client_statement(
+                state["client"][0], state["start"], after, limit
+            ) if state["client"] else [],
+            page_cursor=lambda row: (row[0], row[1], row[2], row[6]),
+            format_row=lambda row: (
+                row[0],
+                f"توزيع #{row[2]}" if row[1] == 0 else f"دفعة #{row[2]}",
+                f"{row[3]:.2f}" if row[3] is not None else "",
+                f"{row[4]:,.2f}" if row[4] else "",
+                f"{row[5]:,.2f}" if row[5] else "",
+                f"{row[6]:,.2f}",
+                (f"{row[7]:,.2f} د.ج/كغ" if row[7] is not None else "") if row[1] == 0 else row[7]
+            ),
+            row_id=lambda row: f"{row[1]}-{row[2]}",
+            height=18, column_width=110,
+            empty_text="اختر عميلاً لعرض كشف حسابه",
+            runner=self.run_async
+        )
+        table.pack(fill="both", expand=True, padx=20, pady=10)
+        
+        def show_opening(balance):
+            if opening_label.winfo_exists():
+                opening_label.configure(text=f"الرصيد في بداية {state['start']}: {balance:,.2f} د.ج"
+                                        if state["start"] else "")
+        
+        def load_client(client):
+            start = start_entry.get().strip() or None
+            if start and not Validators.validate_date(start):
+                messagebox.showerror("خطأ", "يرجى إدخال تاريخ صحيح (YYYY-MM-DD)")
+                return
+            state["client"], state["start"] = client, start
+            if client_box.selected != client:
+                client_box.select(client)
+            table.empty_text = "لا توجد حركات في الفترة المحددة"
+            opening_label.configure(text="")
+            if start:
+                self.run_async(self.client_model.get_opening_balance, client[0], start,
+                               callback=show_opening)
+            table.reload()
+        
+        self.load_statement = load_client
+        
+        def refresh():
+            if state["client"] is not None:
+                load_client(state["client"])
+        
+        return refresh
+    
+    def build_reports(self, frame):
+        """بناء شاشة التقارير"""
+        title_label = ctk.CTkLabel(frame, text="التقارير", 
                                  font=("Arial", 16, "bold"))
         title_label.pack(pady=10)
         
         # إطار اختيار الفترة
-        period_frame = ctk.CTkFrame(self.content_frame)
+        period_frame = ctk.CTkFrame(frame)
         period_frame.pack(fill="x", padx=20, pady=10)
         
         ctk.CTkLabel(period_frame, text="من:").pack(side="left", padx=5)
@@ -943,82 +1654,253 @@ class MainApp(ctk.CTk):
                 messagebox.showerror("خطأ", "يرجى إدخال تاريخ صحيح (YYYY-MM-DD)")
                 return
             
-            results = self.distribution_model.get_total_distributions(start_date, end_date)
-            show_report_results(results, start_date, end_date)
+            show_report_results(start_date, end_date)
         
         ctk.CTkButton(period_frame, text="عرض التقرير", command=generate_report).pack(side="left", padx=10)
         
-        # إطار النتائج
-        self.results_frame = ctk.CTkFrame(self.content_frame)
-        self.results_frame.pack(fill="both", expand=True, padx=20, pady=10)
+        # تصدير الفترة المدخلة إلى CSV/XLSX مع شريط تقدم وإمكانية الإلغاء
+        export_frame = ctk.CTkFrame(frame)
+        export_frame.pack(fill="x", padx=20, pady=(0, 10))
+        
+        export_kinds = {"تقرير الفترة": "period", "التوزيعات التفصيلية": "distributions"}
+        kind_combo = ctk.CTkComboBox(export_frame, values=list(export_kinds), width=170)
+        kind_combo.set("تقرير الفترة")
+        kind_combo.pack(side="left", padx=5, pady=5)
+        
+        export_progress = ctk.CTkProgressBar(export_frame, width=200)
+        export_progress.set(0)
+        export_status = ctk.CTkLabel(export_frame, text="")
+        export_job = []
+        
+        def on_export_progress(written, total):
+            if total:
+                export_progress.set(min(written / total, 1))
+            export_status.configure(text=f"{written:,} / {total:,}" if total else f"{written:,}")
+        
+        def on_export_done(written, error):
+            export_job.clear()
+            export_btn.configure(state="normal")
+            cancel_btn.configure(state="disabled")
+            if isinstance(error, ExportCancelled):
+                export_status.configure(text="تم إلغاء التصدير")
+            elif error is not None:
+                export_status.configure(text="")
+                messagebox.showerror("خطأ", f"فشل التصدير: {error}")
+            else:
+                export_progress.set(1)
+                export_status.configure(text=f"تم تصدير {written:,} سطر")
         
-        def show_report_results(results, start_date, end_date):
-            for widget in self.results_frame.winfo_children():
-                widget.destroy()
+        def start_export():
+            start_date = start_entry.get().strip()
+            end_date = end_entry.get().strip()
+            if not (Validators.validate_date(start_date) and Validators.validate_date(end_date)):
+                messagebox.showerror("خطأ", "يرجى إدخال تاريخ صحيح (YYYY-MM-DD)")
+                return
             
-            if not results:
-                ctk.CTkLabel(self.results_frame, text="لا توجد بيانات في الفترة المحددة").pack(pady=20)
+            path = filedialog.asksaveasfilename(
+                defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx"), ("CSV", "*.csv")]
+            )
+            if not path:
                 return
             
-            title = ctk.CTkLabel(self.results_frame, 
+            export_btn.configure(state="disabled")
+            cancel_btn.configure(state="normal")
+            export_progress.set(0)
+            export_status.configure(text="جاري التصدير...")
+            export_job.append(ExportJob(
+                frame, self.db, export_kinds[kind_combo.get()], path,
+                on_progress=on_export_progress, on_done=on_export_done,
+                start=start_date, end=end_date
+            ))
+        
+        def cancel_export():
+            if export_job:
+                export_job[0].cancel()
+        
+        export_btn = ctk.CTkButton(export_frame, text="تصدير...", command=start_export)
+        export_btn.pack(side="left", padx=5)
+        cancel_btn = ctk.CTkButton(export_frame, text="إلغاء", command=cancel_export,
+                                   state="disabled", fg_color="gray")
+        cancel_btn.pack(side="left", padx=5)
+        export_progress.pack(side="left", padx=10)
+        export_status.pack(side="left", padx=5)
+        
+        # إطار النتائج
+        results_frame = ctk.CTkFrame(frame)
+        results_frame.pack(fill="both", expand=True, padx=20, pady=10)
+        
+        shown_period = []
+        
+        def show_report_results(start_date, end_date):
+            shown_period[:] = [start_date, end_date]
+            for widget in results_frame.winfo_children():
+                widget.destroy()
+            
+            title = ctk.CTkLabel(results_frame, 
                                text=f"تقرير التوزيعات من {start_date} إلى {end_date}",
                                font=("Arial", 14, "bold"))
             title.pack(pady=10)
             
-            columns = ("العميل", "إجمالي الكمية (كغ)", "إجمالي المبلغ", "المدفوع", "المتبقي")
-            tree = ttk.Treeview(self.results_frame, columns=columns, show="headings", height=15)
+            # إجماليات الفترة من استعلام تجميعي واحد
+            totals_label = ctk.CTkLabel(
+                results_frame, text="جاري التحميل...",
+                font=("Arial", 12, "bold"), fg_color="lightblue", corner_radius=6
+            )
+            totals_label.pack(side="bottom", fill="x", padx=10, pady=(0, 10))
             
-            for col in columns:
-                tree.heading(col, text=col)
-                tree.column(col, width=150)
+            def show_totals(totals):
+                total_kg, total_amount, total_paid, total_remaining = totals
+                if totals_label.winfo_exists():
+                    totals_label.configure(
+                        text=(f"الإجمالي: {total_kg:.2f} كغ | المبلغ: {total_amount:,.2f} | "
+                              f"المدفوع: {total_paid:,.2f} | المتبقي: {total_remaining:,.2f}")
+                    )
             
-            total_kg = 0
-            total_amount = 0
-            total_paid = 0
-            total_remaining = 0
+            self.run_async(self.distribution_model.get_distribution_totals, start_date, end_date,
+                           callback=show_totals)
             
-            for row in results:
-                tree.insert("", "end", values=(
-                    row[0],  # client name
-                    f"{row[1]:.2f}",
-                    f"{row[2]:,.2f}",
+            columns = ("العميل", "إجمالي الكمية (كغ)", "إجمالي المبلغ", "المدفوع", "المتبقي")
+            table = VirtualTable(
+                results_frame, columns,
+                fetch_page=lambda after, limit: self.distribution_model.get_total_distributions_page(
+                    start_date, end_date, after, limit
+                ),
+                page_cursor=lambda row: (row[1], row[0]),
+                format_row=lambda row: (
+                    row[1],  # client name
+                    f"{row[2]:.2f}",
                     f"{row[3]:,.2f}",
-                    f"{row[4]:,.2f}"
-                ))
-                total_kg += row[1]
-                total_amount += row[2]
-                total_paid += row[3]
-                total_remaining += row[4]
-            
-            # إجماليات
-            tree.insert("", "end", values=(
-                "الإجمالي",
-                f"{total_kg:.2f}",
-                f"{total_amount:,.2f}",
-                f"{total_paid:,.2f}",
-                f"{total_remaining:,.2f}"
-            ), tags=("total",))
-            
-            tree.tag_configure("total", background="lightblue")
-            
-            tree.pack(fill="both", expand=True, padx=10, pady=10)
+                    f"{row[4]:,.2f}",
+                    f"{row[5]:,.2f}"
+                ),
+                height=15, column_width=150,
+                empty_text="لا توجد بيانات في الفترة المحددة",
+                runner=self.run_async
+            )
+            table.pack(fill="both", expand=True, padx=10, pady=10)
+            table.load_more()
         
         # عرض تقرير افتراضي
         default_start = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
         default_end = datetime.now().strftime("%Y-%m-%d")
-        results = self.distribution_model.get_total_distributions(default_start, default_end)
-        show_report_results(results, default_start, default_end)
+        show_report_results(default_start, default_end)
+        
+        return lambda: show_report_results(*shown_period)
     
-    def show_settings(self):
-        """عرض الإعدادات"""
-        self.clear_content()
+    def build_aging(self, frame):
+        """بناء شاشة أعمار المستحقات: شرائح 0-30، 31-60، 61-90، +90 يوم لكل عميل
+        مرتبة حسب العمود المختار (بالضغط على عنوانه) مع إجماليات كل العملاء"""
+        title_label = ctk.CTkLabel(frame, text="أعمار المستحقات", 
+                                 font=("Arial", 16, "bold"))
+        title_label.pack(pady=10)
         
-        title_label = ctk.CTkLabel(self.content_frame, text="الإعدادات", 
+        columns = ("العميل", "الهاتف", "0-30 يوم", "31-60 يوم", "61-90 يوم", "أكثر من 90 يوم",
+                   "الإجمالي", "أقدم توزيع")
+        sorts = ("name", None, "days_0_30", "days_31_60", "days_61_90", "days_over_90",
+                 "total", "oldest_date")
+        state = {"sort": "total", "descending": True}
+        
+        # تصدير التقرير كاملاً بنفس ترتيب الإجمالي
+        export_frame = ctk.CTkFrame(frame)
+        export_frame.pack(fill="x", padx=20, pady=(0, 10))
+        export_status = ctk.CTkLabel(export_frame, text="")
+        
+        def on_export_done(written, error):
+            export_btn.configure(state="normal")
+            if error is not None:
+                export_status.configure(text="")
+                messagebox.showerror("خطأ", f"فشل التصدير: {error}")
+            else:
+                export_status.configure(text=f"تم تصدير {written:,} عميل")
+        
+        def start_export():
+            path = filedialog.asksaveasfilename(
+                defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx"), ("CSV", "*.csv")]
+            )
+            if not path:
+                return
+            export_btn.configure(state="disabled")
+            export_status.configure(text="جاري التصدير...")
+            ExportJob(frame, self.db, "aging", path,
+                      on_progress=lambda written, total: None, on_done=on_export_done)
+        
+        export_btn = ctk.CTkButton(export_frame, text="تصدير...", command=start_export)
+        export_btn.pack(side="left", padx=5, pady=5)
+        export_status.pack(side="left", padx=5)
+        
+        totals_label = ctk.CTkLabel(frame, text="", font=("Arial", 12, "bold"),
+                                    fg_color="lightblue", corner_radius=6)
+        totals_label.pack(side="bottom", fill="x", padx=20, pady=(0, 10))
+        
+        def show_totals(rows):
+            if not rows:
+                totals_label.configure(text="لا توجد مستحقات")
+                return
+            clients, *buckets, total = rows[0][9:]
+            totals_label.configure(text=f"{clients} عميل | " + " | ".join(
+                f"{name}: {amount:,.2f}" for name, amount in zip(columns[2:6], buckets)
+            ) + f" | الإجمالي: {total:,.2f}")
+        
+        def runner(fn, after, limit, callback):
+            # إجماليات كل العملاء تأتي مع كل صف؛ تحدث من الصفحة الأولى
+            def loaded(rows):
+                if after is None and totals_label.winfo_exists():
+                    show_totals(rows)
+                callback(rows)
+            self.run_async(fn, after, limit, callback=loaded)
+        
+        def page_cursor(row):
+            return (row[PaymentModel.AGING_SORTS[state["sort"]]], row[0])
+        
+        table = VirtualTable(
+            frame, columns,
+            fetch_page=lambda after, limit: self.payment_model.get_aging_page(
+                state["sort"], state["descending"], after, limit
+            ),
+            page_cursor=page_cursor,
+            format_row=lambda row: (
+                row[1], row[2],
+                f"{row[3]:,.2f}", f"{row[4]:,.2f}", f"{row[5]:,.2f}", f"{row[6]:,.2f}",
+                f"{row[7]:,.2f}", row[8]
+            ),
+            height=18, column_width=110,
+            empty_text="لا توجد مستحقات",
+            runner=runner
+        )
+        table.pack(fill="both", expand=True, padx=20, pady=10)
+        
+        def show_headings():
+            for column, sort in zip(columns, sorts):
+                arrow = ""
+                if sort == state["sort"]:
+                    arrow = " ▼" if state["descending"] else " ▲"
+                table.tree.heading(column, text=column + arrow)
+        
+        def sort_by(sort):
+            if sort == state["sort"]:
+                state["descending"] = not state["descending"]
+            else:
+                # المبالغ من الأكبر، والأسماء أبجدياً، والتواريخ من الأقدم
+                state["sort"], state["descending"] = sort, sort not in ("name", "oldest_date")
+            show_headings()
+            table.reload()
+        
+        for column, sort in zip(columns, sorts):
+            if sort:
+                table.tree.heading(column, command=lambda sort=sort: sort_by(sort))
+        show_headings()
+        table.load_more()
+        
+        return table.reload
+    
+    def build_settings(self, frame):
+        """بناء شاشة الإعدادات"""
+        title_label = ctk.CTkLabel(frame, text="الإعدادات", 
                                  font=("Arial", 16, "bold"))
         title_label.pack(pady=10)
         
         # تغيير كلمة المرور
-        pass_frame = ctk.CTkFrame(self.content_frame)
+        pass_frame = ctk.CTkFrame(frame)
         pass_frame.pack(fill="x", padx=20, pady=10)
         
         ctk.CTkLabel(pass_frame, text="تغيير كلمة المرور", font=("Arial", 14)).pack(pady=5)
@@ -1046,18 +1928,212 @@ class MainApp(ctk.CTk):
                 messagebox.showerror("خطأ", "كلمتا المرور غير متطابقتين")
                 return
             
-            if self.auth.change_password(new_pass):
-                messagebox.showinfo("نجاح", "تم تغيير كلمة المرور بنجاح")
-                new_pass_entry.delete(0, tk.END)
-                confirm_pass_entry.delete(0, tk.END)
-            else:
-                messagebox.showerror("خطأ", "فشل في تغيير كلمة المرور")
+            def on_changed(changed):
+                if changed:
+                    messagebox.showinfo("نجاح", "تم تغيير كلمة المرور بنجاح")
+                    new_pass_entry.delete(0, tk.END)
+                    confirm_pass_entry.delete(0, tk.END)
+                else:
+                    messagebox.showerror("خطأ", "فشل في تغيير كلمة المرور")
+            
+            self.run_write(self.auth.change_password, new_pass, callback=on_changed)
         
         ctk.CTkButton(input_frame, text="تغيير كلمة المرور", command=change_password).grid(row=1, column=2, padx=5, pady=5)
+        
+        # التحقق من دفتر الأرصدة
+        balances_frame = ctk.CTkFrame(frame)
+        balances_frame.pack(fill="x", padx=20, pady=10)
+        
+        ctk.CTkLabel(balances_frame, text="أرصدة العملاء", font=("Arial", 14)).pack(pady=5)
+        
+        def verify_balances():
+            self.run_async(self.client_model.verify_balances, callback=on_verified)
+        
+        def on_verified(drift):
+            if not drift:
+                messagebox.showinfo("نجاح", "دفتر الأرصدة مطابق للتوزيعات")
+                return
+            
+            details = "\n".join(
+                f"#{client_id}: {stored:,.2f} ← {actual:,.2f}"
+                for client_id, stored, actual in drift[:20]
+            )
+            if messagebox.askyesno("تحذير", f"تم العثور على {len(drift)} فرق في الأرصدة:\n{details}\n\nإعادة بناء الدفتر؟"):
+                self.run_write(
+                    self.client_model.verify_balances, rebuild=True,
+                    callback=lambda _: messagebox.showinfo("نجاح", "تمت إعادة بناء دفتر الأرصدة")
+                )
+        
+        ctk.CTkButton(balances_frame, text="التحقق من الأرصدة", command=verify_balances).pack(pady=5)
+        
+        def verify_daily_totals():
+            self.run_async(self.distribution_model.verify_daily_totals, callback=on_totals_verified)
+        
+        def on_totals_verified(drift):
+            if not drift:
+                messagebox.showinfo("نجاح", "الإجماليات اليومية مطابقة للتوزيعات")
+                return
+            
+            if messagebox.askyesno("تحذير", f"تم العثور على {len(drift)} يوم/عميل مختلف في الإجماليات اليومية.\n\nإعادة بناء الإجماليات؟"):
+                self.run_write(
+                    self.distribution_model.verify_daily_totals, rebuild=True,
+                    callback=lambda _: messagebox.showinfo("نجاح", "تمت إعادة بناء الإجماليات اليومية")
+                )
+        
+        ctk.CTkButton(balances_frame, text="التحقق من الإجماليات اليومية", command=verify_daily_totals).pack(pady=5)
+        
+        self.build_backup_settings(frame)
+    
+    def build_backup_settings(self, frame):
+        """قسم النسخ الاحتياطي في شاشة الإعدادات"""
+        backup_frame = ctk.CTkFrame(frame)
+        backup_frame.pack(fill="x", padx=20, pady=10)
+        
+        ctk.CTkLabel(backup_frame, text="النسخ الاحتياطي", font=("Arial", 14)).pack(pady=5)
+        
+        if self.backups is None:
+            ctk.CTkLabel(backup_frame, text="النسخ الاحتياطي يتم على جهاز الخادم (python -m cli backup)",
+                         text_color="gray").pack(pady=5)
+            return
+        
+        manager = self.backups
+        options_frame = ctk.CTkFrame(backup_frame)
+        options_frame.pack(fill="x", padx=10, pady=5)
+        
+        ctk.CTkLabel(options_frame, text="المجلد:").grid(row=0, column=0, padx=5, pady=5)
+        directory_entry = ctk.CTkEntry(options_frame, width=300)
+        directory_entry.insert(0, manager.directory)
+        directory_entry.grid(row=0, column=1, columnspan=3, padx=5, pady=5)
+        
+        def browse():
+            directory = filedialog.askdirectory(initialdir=directory_entry.get())
+            if directory:
+                directory_entry.delete(0, tk.END)
+                directory_entry.insert(0, directory)
+        
+        ctk.CTkButton(options_frame, text="استعراض...", width=80, command=browse).grid(row=0, column=4, padx=5, pady=5)
+        
+        ctk.CTkLabel(options_frame, text="عدد النسخ المحفوظة:").grid(row=1, column=0, padx=5, pady=5)
+        keep_entry = ctk.CTkEntry(options_frame, width=60)
+        keep_entry.insert(0, str(manager.keep))
+        keep_entry.grid(row=1, column=1, padx=5, pady=5)
+        
+        ctk.CTkLabel(options_frame, text="كل (ساعة، 0 للإيقاف):").grid(row=1, column=2, padx=5, pady=5)
+        interval_entry = ctk.CTkEntry(options_frame, width=60)
+        interval_entry.insert(0, f"{manager.interval_hours:g}")
+        interval_entry.grid(row=1, column=3, padx=5, pady=5)
+        
+        compress_var = tk.BooleanVar(value=manager.compress)
+        ctk.CTkCheckBox(options_frame, text="ضغط (gzip)", variable=compress_var).grid(row=1, column=4, padx=5, pady=5)
+        
+        def save_backup_settings():
+            directory = directory_entry.get().strip()
+            try:
+                keep = int(keep_entry.get())
+                interval = float(interval_entry.get())
+            except ValueError:
+                messagebox.showerror("خطأ", "يرجى إدخال أرقام صحيحة")
+                return
+            if not directory or keep < 1 or interval < 0:
+                messagebox.showerror("خطأ", "يرجى إدخال مجلد وعدد نسخ موجب")
+                return
+            
+            manager.directory, manager.keep = directory, keep
+            manager.interval_hours, manager.compress = interval, compress_var.get()
+            self.run_write(manager.save, callback=lambda _: messagebox.showinfo("نجاح", "تم حفظ إعدادات النسخ"))
+        
+        ctk.CTkButton(options_frame, text="حفظ", width=80, command=save_backup_settings).grid(row=2, column=4, padx=5, pady=5)
+        
+        actions_frame = ctk.CTkFrame(backup_frame)
+        actions_frame.pack(fill="x", padx=10, pady=5)
+        
+        backup_progress = ctk.CTkProgressBar(actions_frame, width=200)
+        backup_progress.set(0)
+        backup_status = ctk.CTkLabel(actions_frame, text="")
+        
+        def show_last_backup():
+            last = manager.last_backup_time()
+            backup_status.configure(text=f"آخر نسخة: {last:%Y-%m-%d %H:%M}" if last else "لا توجد نسخ")
+        
+        def on_backup_progress(copied, total):
+            if total:
+                backup_progress.set(copied / total)
+        
+        def on_backup_done(path, error):
+            backup_btn.configure(state="normal")
+            cancel_btn.configure(state="disabled")
+            if isinstance(error, BackupCancelled):
+                backup_status.configure(text="تم إلغاء النسخ")
+            elif error is not None:
+                backup_status.configure(text="")
+                messagebox.showerror("خطأ", f"فشل النسخ الاحتياطي: {error}")
+            else:
+                backup_progress.set(1)
+                show_last_backup()
+        
+        def backup_now():
+            if self.backup_job is not None:
+                messagebox.showinfo("تنبيه", "يوجد نسخ احتياطي قيد التنفيذ")
+                return
+            backup_btn.configure(state="disabled")
+            cancel_btn.configure(state="normal")
+            backup_progress.set(0)
+            backup_status.configure(text="جاري النسخ...")
+            self.start_backup(on_backup_progress, on_backup_done)
+        
+        def cancel_backup():
+            if self.backup_job is not None:
+                self.backup_job.cancel()
+        
+        def restore():
+            if self.backup_job is not None:
+                messagebox.showinfo("تنبيه", "يوجد نسخ احتياطي قيد التنفيذ")
+                return
+            path = filedialog.askopenfilename(
+                initialdir=manager.directory,
+                filetypes=[("نسخ احتياطية", "*.db *.db.gz"), ("الكل", "*.*")]
+            )
+            if not path or not messagebox.askyesno(
+                "تأكيد", "سيتم استبدال جميع البيانات الحالية بمحتوى النسخة.\n"
+                         "تحفظ نسخة من الوضع الحالي أولاً. متابعة؟"
+            ):
+                return
+            backup_btn.configure(state="disabled")
+            restore_btn.configure(state="disabled")
+            backup_progress.set(0)
+            backup_status.configure(text="جاري الاستعادة...")
+            self.backup_job = RestoreJob(self, manager, path, on_backup_progress, on_restore_done)
+        
+        def on_restore_done(safety, error):
+            self.backup_job = None
+            if error is not None:
+                backup_btn.configure(state="normal")
+                restore_btn.configure(state="normal")
+                backup_status.configure(text="")
+                messagebox.showerror("خطأ", f"فشل الاستعادة: {error}")
+                return
+            backup_progress.set(1)
+            messagebox.showinfo("نجاح", f"تمت الاستعادة (نسخة الوضع السابق: {safety}).\n"
+                                        "سيتم إغلاق البرنامج، يرجى تشغيله من جديد.")
+            self.on_close()
+        
+        backup_btn = ctk.CTkButton(actions_frame, text="نسخ الآن", command=backup_now)
+        backup_btn.pack(side="left", padx=5, pady=5)
+        cancel_btn = ctk.CTkButton(actions_frame, text="إلغاء", command=cancel_backup,
+                                   state="disabled", fg_color="gray")
+        cancel_btn.pack(side="left", padx=5)
+        restore_btn = ctk.CTkButton(actions_frame, text="استعادة...", command=restore, fg_color="darkred")
+        restore_btn.pack(side="right", padx=5)
+        backup_progress.pack(side="left", padx=10)
+        backup_status.pack(side="left", padx=5)
+        show_last_backup()
 
 def main():
-    """الدالة الرئيسية لتشغيل التطبيق"""
-    login_window = LoginWindow()
+    """الدالة الرئيسية لتشغيل التطبيق (--server URL أو DISTRIBUTION_SERVER للعمل مع خادم مشترك)"""
+    server = os.environ.get("DISTRIBUTION_SERVER")
+    if "--server" in sys.argv[1:-1]:
+        server = sys.argv[sys.argv.index("--server") + 1]
+    login_window = LoginWindow(server)
     login_window.mainloop()
 
 if __name__ == "__main__":
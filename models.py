@@ -0,0 +1,1878 @@
+"""طبقة البيانات: قاعدة البيانات والنماذج بدون أي اعتماد على الواجهة الرسومية"""
+import sqlite3
+import os
+import re
+import sys
+import csv
+import json
+import math
+import time
+import atexit
+import bisect
+import heapq
+import random
+import threading
+import contextlib
+import collections
+from datetime import datetime, timedelta
+
+class QueryStats:
+    """إحصاءات الاستعلامات: العدد والزمن (المجموع، p50، p99) والصفوف لكل استعلام موحد،
+    مع سجل للاستعلامات البطيئة وخطط تنفيذها"""
+    
+    LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    MAX_SAMPLES = 10000
+    
+    def __init__(self, slow_ms=100.0, slow_log_size=200):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._normalized = {}
+        self.slow = collections.deque(maxlen=slow_log_size)
+        self.started = time.time()
+    
+    def normalize(self, query):
+        """توحيد نص الاستعلام (المسافات والقيم الحرفية) ليجمع الاستعلامات المتشابهة"""
+        normalized = self._normalized.get(query)
+        if normalized is None:
+            normalized = " ".join(self.LITERALS.sub("?", query).split())
+            normalized = self.PLACEHOLDER_LISTS.sub("(?, ...)", normalized)
+            self._normalized[query] = normalized
+        return normalized
+    
+    def record(self, query, seconds, rows=None, tag=None):
+        """تسجيل تنفيذ واحد (query قد يكون اسماً مثل <connect> أو <commit>)"""
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    "count": 0, "total": 0.0, "max": 0.0, "rows": 0,
+                    "samples": [], "tags": collections.Counter(),
+                }
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            if rows is not None and rows >= 0:
+                entry["rows"] += rows
+            if tag:
+                entry["tags"][tag] += 1
+            samples = entry["samples"]
+            if len(samples) < self.MAX_SAMPLES:
+                samples.append(seconds)
+            else:
+                # عينة عشوائية ثابتة الحجم للحفاظ على دقة النسب المئوية
+                index = random.randrange(entry["count"])
+                if index < self.MAX_SAMPLES:
+                    samples[index] = seconds
+    
+    def is_slow(self, seconds):
+        return seconds * 1000 >= self.slow_ms
+    
+    def record_slow(self, query, seconds, params, tag, plan):
+        self.slow.append({
+            "sql": self.normalize(query),
+            "ms": round(seconds * 1000, 3),
+            "params": repr(params)[:200],
+            "tag": tag,
+            "plan": plan,
+            "at": datetime.now().isoformat(timespec="seconds"),
+        })
+    
+    @staticmethod
+    def _percentile(ordered, fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    
+    def snapshot(self):
+        """الإحصاءات الحالية مرتبة حسب الزمن الكلي (بالمللي ثانية)"""
+        with self._lock:
+            entries = [(sql, dict(entry, samples=sorted(entry["samples"]), tags=entry["tags"].copy()))
+                       for sql, entry in self._entries.items()]
+        stats = []
+        for sql, entry in entries:
+            samples = entry["samples"]
+            stats.append({
+                "sql": sql,
+                "count": entry["count"],
+                "total_ms": round(entry["total"] * 1000, 3),
+                "p50_ms": round(self._percentile(samples, 0.50) * 1000, 3),
+                "p99_ms": round(self._percentile(samples, 0.99) * 1000, 3),
+                "max_ms": round(entry["max"] * 1000, 3),
+                "rows": entry["rows"],
+                "tags": dict(entry["tags"].most_common()),
+            })
+        stats.sort(key=lambda item: -item["total_ms"])
+        return stats
+    
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self.slow.clear()
+            self.started = time.time()
+    
+    def report(self, limit=30):
+        """ملخص نصي لأثقل الاستعلامات"""
+        lines = [f"{'count':>8} {'total ms':>11} {'p50':>8} {'p99':>8} {'rows':>9}  sql / tags"]
+        for item in self.snapshot()[:limit]:
+            lines.append(f"{item['count']:>8} {item['total_ms']:>11.1f} {item['p50_ms']:>8.3f} "
+                         f"{item['p99_ms']:>8.3f} {item['rows']:>9}  {item['sql'][:120]}")
+            if item["tags"]:
+                tags = ", ".join(f"{tag} x{count}" for tag, count in list(item["tags"].items())[:4])
+                lines.append(f"{'':>49}  <- {tags}")
+        if self.slow:
+            lines.append(f"\nslow queries (>= {self.slow_ms} ms):")
+            for entry in self.slow:
+                lines.append(f"  {entry['ms']:>9.1f} ms  {entry['tag'] or '-'}  {entry['sql'][:120]}")
+                lines.extend(f"               {step}" for step in entry["plan"])
+        return "\n".join(lines)
+    
+    def dump(self, path=None):
+        """كتابة الإحصاءات إلى ملف JSON أو التقرير النصي إلى stderr"""
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"queries": self.snapshot(), "slow": list(self.slow),
+                           "seconds": round(time.time() - self.started, 3)},
+                          f, ensure_ascii=False, indent=2)
+        else:
+            print(self.report(), file=sys.stderr)
+
+class Transaction:
+    """معاملة مفتوحة على اتصال الخيط الحالي (انظر Database.transaction).
+    تجمع الجداول المعدلة لتحديث عدادات التغيير بعد الحفظ"""
+    
+    def __init__(self, db, conn):
+        self.db = db
+        self.conn = conn
+        self.writes = []
+        self.depth = 0
+        self.on_commit = []
+    
+    def execute(self, query, params=()):
+        """تنفيذ استعلام داخل المعاملة، يرجع المؤشر"""
+        db = self.db
+        if db.stats is None:
+            cursor = self.conn.execute(query, params)
+        else:
+            start = time.perf_counter()
+            cursor = self.conn.execute(query, params)
+            db._record(query, params, time.perf_counter() - start, cursor.rowcount)
+        if db.WRITE_TARGET.match(query):
+            self.writes.append(query)
+        return cursor
+    
+    def execute_many(self, query, seq_of_params):
+        """تنفيذ نفس الاستعلام لعدة صفوف، يرجع المؤشر"""
+        db = self.db
+        start = time.perf_counter()
+        cursor = self.conn.executemany(query, seq_of_params)
+        if db.stats is not None:
+            db._record(query, None, time.perf_counter() - start, cursor.rowcount)
+        if db.WRITE_TARGET.match(query):
+            self.writes.append(query)
+        return cursor
+    
+    def fetch_all(self, query, params=()):
+        return self.execute(query, params).fetchall()
+    
+    def fetch_one(self, query, params=()):
+        return self.execute(query, params).fetchone()
+
+class Database:
+    # إعدادات الاتصال تطبق مرة واحدة عند فتح كل اتصال
+    PRAGMAS = (
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+        ("cache_size", -20000),        # ~20 ميغابايت
+        ("mmap_size", 268435456),      # 256 ميغابايت
+        ("temp_store", "MEMORY"),
+        ("foreign_keys", "ON"),
+    )
+    STATEMENT_CACHE_SIZE = 256
+    # قاعدة محلية (انظر RemoteDatabase في remote.py للاتصال بالخادم)
+    is_remote = False
+
+    # الجدول الذي يعدله استعلام كتابة (لتتبع تغير البيانات)
+    WRITE_TARGET = re.compile(
+        r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)",
+        re.IGNORECASE
+    )
+
+    # المشغلات التي تحافظ على جدول client_balances ضمن نفس المعاملة
+    BALANCE_TRIGGERS = (
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_balance_insert
+        AFTER INSERT ON distributions
+        BEGIN
+            INSERT INTO client_balances (client_id, balance)
+            VALUES (NEW.client_id, MAX(COALESCE(NEW.remaining_amount, 0), 0))
+            ON CONFLICT(client_id) DO UPDATE SET balance = balance + excluded.balance;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_balance_update
+        AFTER UPDATE OF client_id, remaining_amount ON distributions
+        BEGIN
+            UPDATE client_balances
+            SET balance = balance - MAX(COALESCE(OLD.remaining_amount, 0), 0)
+            WHERE client_id = OLD.client_id;
+            INSERT INTO client_balances (client_id, balance)
+            VALUES (NEW.client_id, MAX(COALESCE(NEW.remaining_amount, 0), 0))
+            ON CONFLICT(client_id) DO UPDATE SET balance = balance + excluded.balance;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_balance_delete
+        AFTER DELETE ON distributions
+        BEGIN
+            UPDATE client_balances
+            SET balance = balance - MAX(COALESCE(OLD.remaining_amount, 0), 0)
+            WHERE client_id = OLD.client_id;
+        END
+        ''',
+    )
+
+    # إعادة بناء دفتر الأرصدة من جدول التوزيعات
+    REBUILD_BALANCES = (
+        "DELETE FROM client_balances",
+        '''
+        INSERT INTO client_balances (client_id, balance)
+        SELECT client_id, SUM(remaining_amount)
+        FROM distributions
+        WHERE remaining_amount > 0
+        GROUP BY client_id
+        ''',
+    )
+
+    # المشغلات التي تحافظ على جدول الإجماليات اليومية daily_client_totals
+    DAILY_TOTALS_TRIGGERS = (
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_totals_insert
+        AFTER INSERT ON distributions
+        BEGIN
+            INSERT INTO daily_client_totals
+                (day, client_id, distribution_count, total_kg, total_amount, total_paid, total_remaining)
+            VALUES (NEW.distribution_date, NEW.client_id, 1,
+                    COALESCE(NEW.quantity_kg, 0), COALESCE(NEW.total_amount, 0),
+                    COALESCE(NEW.paid_amount, 0), COALESCE(NEW.remaining_amount, 0))
+            ON CONFLICT(day, client_id) DO UPDATE SET
+                distribution_count = distribution_count + 1,
+                total_kg = total_kg + excluded.total_kg,
+                total_amount = total_amount + excluded.total_amount,
+                total_paid = total_paid + excluded.total_paid,
+                total_remaining = total_remaining + excluded.total_remaining;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_totals_update
+        AFTER UPDATE OF client_id, distribution_date, quantity_kg, total_amount,
+                        paid_amount, remaining_amount ON distributions
+        BEGIN
+            UPDATE daily_client_totals SET
+                distribution_count = distribution_count - 1,
+                total_kg = total_kg - COALESCE(OLD.quantity_kg, 0),
+                total_amount = total_amount - COALESCE(OLD.total_amount, 0),
+                total_paid = total_paid - COALESCE(OLD.paid_amount, 0),
+                total_remaining = total_remaining - COALESCE(OLD.remaining_amount, 0)
+            WHERE day = OLD.distribution_date AND client_id = OLD.client_id;
+            INSERT INTO daily_client_totals
+                (day, client_id, distribution_count, total_kg, total_amount, total_paid, total_remaining)
+            VALUES (NEW.distribution_date, NEW.client_id, 1,
+                    COALESCE(NEW.quantity_kg, 0), COALESCE(NEW.total_amount, 0),
+                    COALESCE(NEW.paid_amount, 0), COALESCE(NEW.remaining_amount, 0))
+            ON CONFLICT(day, client_id) DO UPDATE SET
+                distribution_count = distribution_count + 1,
+                total_kg = total_kg + excluded.total_kg,
+                total_amount = total_amount + excluded.total_amount,
+                total_paid = total_paid + excluded.total_paid,
+                total_remaining = total_remaining + excluded.total_remaining;
+            DELETE FROM daily_client_totals
+            WHERE day = OLD.distribution_date AND client_id = OLD.client_id
+              AND distribution_count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_totals_delete
+        AFTER DELETE ON distributions
+        BEGIN
+            UPDATE daily_client_totals SET
+                distribution_count = distribution_count - 1,
+                total_kg = total_kg - COALESCE(OLD.quantity_kg, 0),
+                total_amount = total_amount - COALESCE(OLD.total_amount, 0),
+                total_paid = total_paid - COALESCE(OLD.paid_amount, 0),
+                total_remaining = total_remaining - COALESCE(OLD.remaining_amount, 0)
+            WHERE day = OLD.distribution_date AND client_id = OLD.client_id;
+            DELETE FROM daily_client_totals
+            WHERE day = OLD.distribution_date AND client_id = OLD.client_id
+              AND distribution_count <= 0;
+        END
+        ''',
+    )
+
+    # إعادة بناء الإجماليات اليومية من جدول التوزيعات
+    REBUILD_DAILY_TOTALS = (
+        "DELETE FROM daily_client_totals",
+        '''
+        INSERT INTO daily_client_totals
+            (day, client_id, distribution_count, total_kg, total_amount, total_paid, total_remaining)
+        SELECT distribution_date, client_id, COUNT(*),
+               COALESCE(SUM(quantity_kg), 0), COALESCE(SUM(total_amount), 0),
+               COALESCE(SUM(paid_amount), 0), COALESCE(SUM(remaining_amount), 0)
+        FROM distributions
+        GROUP BY distribution_date, client_id
+        ''',
+    )
+
+    # ترحيلات المخطط: (رقم الإصدار، الاستعلامات) وتطبق حسب PRAGMA user_version
+    MIGRATIONS = (
+        # 1: دفتر أرصدة العملاء
+        (1, (
+            '''
+            CREATE TABLE IF NOT EXISTS client_balances (
+                client_id INTEGER PRIMARY KEY,
+                balance REAL NOT NULL DEFAULT 0,
+                FOREIGN KEY (client_id) REFERENCES clients(id)
+            )
+            ''',
+        ) + BALANCE_TRIGGERS + REBUILD_BALANCES),
+        # 2: فهارس مطابقة لاستعلامات النماذج
+        (2, (
+            # التوزيعات اليومية وتقارير الفترات
+            """CREATE INDEX IF NOT EXISTS idx_distributions_date_client
+               ON distributions (distribution_date, client_id)""",
+            # توزيعات عميل معين
+            """CREATE INDEX IF NOT EXISTS idx_distributions_client_date
+               ON distributions (client_id, distribution_date)""",
+            # التوزيعات غير المسددة فقط
+            """CREATE INDEX IF NOT EXISTS idx_distributions_open
+               ON distributions (client_id, remaining_amount)
+               WHERE remaining_amount > 0""",
+            """CREATE INDEX IF NOT EXISTS idx_payments_client_date
+               ON payments (client_id, payment_date)""",
+            """CREATE INDEX IF NOT EXISTS idx_payments_distribution
+               ON payments (distribution_id)""",
+            """CREATE INDEX IF NOT EXISTS idx_clients_active_name
+               ON clients (is_active, name)""",
+            # العملاء الذين لديهم مستحقات
+            """CREATE INDEX IF NOT EXISTS idx_client_balances_open
+               ON client_balances (client_id, balance)
+               WHERE balance > 0.005""",
+            "ANALYZE",
+        )),
+        # 3: ترقيم صفحات التوزيعات اليومية حسب المعرف
+        (3, (
+            """CREATE INDEX IF NOT EXISTS idx_distributions_date_id
+               ON distributions (distribution_date, id)""",
+        )),
+        # 4: الإجماليات اليومية لكل عميل لتقارير الفترات
+        (4, (
+            '''
+            CREATE TABLE IF NOT EXISTS daily_client_totals (
+                day DATE NOT NULL,
+                client_id INTEGER NOT NULL,
+                distribution_count INTEGER NOT NULL DEFAULT 0,
+                total_kg REAL NOT NULL DEFAULT 0,
+                total_amount REAL NOT NULL DEFAULT 0,
+                total_paid REAL NOT NULL DEFAULT 0,
+                total_remaining REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, client_id)
+            ) WITHOUT ROWID
+            ''',
+        ) + DAILY_TOTALS_TRIGGERS + REBUILD_DAILY_TOTALS),
+        # 5: توزيع الدفعات على التوزيعات غير المسددة (الأقدم أولاً)
+        (5, (
+            '''
+            CREATE TABLE IF NOT EXISTS payment_allocations (
+                payment_id INTEGER NOT NULL REFERENCES payments(id) ON DELETE CASCADE,
+                distribution_id INTEGER NOT NULL REFERENCES distributions(id) ON DELETE CASCADE,
+                amount REAL NOT NULL,
+                PRIMARY KEY (payment_id, distribution_id)
+            ) WITHOUT ROWID
+            ''',
+            """CREATE INDEX IF NOT EXISTS idx_payment_allocations_distribution
+               ON payment_allocations (distribution_id)""",
+            # التوزيعات المفتوحة لعميل بترتيب السداد
+            """CREATE INDEX IF NOT EXISTS idx_distributions_open_fifo
+               ON distributions (client_id, distribution_date, id)
+               WHERE remaining_amount > 0""",
+            # الدفعات القديمة المرتبطة بتوزيع واحد: كانت تنقص المتبقي فقط (حتى الصفر) دون
+            # المدفوع، فيوزع منها ما خصم فعلاً (الفرق بين المبلغ والمدفوع والمتبقي) ثم يضاف
+            # إلى المدفوع
+            """INSERT OR IGNORE INTO payment_allocations (payment_id, distribution_id, amount)
+               SELECT payment_id, distribution_id, amount FROM (
+                   SELECT p.id AS payment_id, p.distribution_id,
+                          ROUND(MIN(p.amount, MAX(
+                              COALESCE(d.total_amount, 0) - COALESCE(d.paid_amount, 0)
+                              - COALESCE(d.remaining_amount, 0)
+                              - (TOTAL(p.amount) OVER (PARTITION BY p.distribution_id ORDER BY p.id)
+                                 - p.amount),
+                          0)), 2) AS amount
+                   FROM payments p JOIN distributions d ON d.id = p.distribution_id
+               )
+               WHERE amount > 0.005""",
+            """UPDATE distributions SET paid_amount = ROUND(COALESCE(paid_amount, 0) + allocated, 2)
+               FROM (SELECT distribution_id, TOTAL(amount) AS allocated
+                     FROM payment_allocations GROUP BY distribution_id) a
+               WHERE a.distribution_id = distributions.id""",
+        )),
+        # 6: سجل التغييرات للمزامنة بين الأجهزة (انظر sync.py)
+        (6, (
+            '''
+            CREATE TABLE IF NOT EXISTS sync_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            ) WITHOUT ROWID
+            ''',
+            # معرف الجهاز: تبنى منه معرفات الصفوف الثابتة بين الأجهزة
+            "INSERT OR IGNORE INTO sync_meta VALUES ('device_id', lower(hex(randomblob(8))))",
+            # سجل إضافات فقط: صف لكل تغيير (origin = الجهاز الذي جاء منه التغيير عند المزامنة)
+            '''
+            CREATE TABLE IF NOT EXISTS sync_journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tbl TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                origin TEXT
+            )
+            ''',
+            # معرفات الصفوف القادمة من أجهزة أخرى
+            '''
+            CREATE TABLE IF NOT EXISTS sync_keys (
+                tbl TEXT NOT NULL,
+                uid TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                PRIMARY KEY (tbl, uid)
+            ) WITHOUT ROWID
+            ''',
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_keys_row ON sync_keys (tbl, row_id)",
+            # آخر تغيير استلم من كل جهاز وآخر تغيير أرسل إليه
+            '''
+            CREATE TABLE IF NOT EXISTS sync_peers (
+                peer TEXT PRIMARY KEY,
+                received_seq INTEGER NOT NULL DEFAULT 0,
+                sent_seq INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+            ''',
+        ) + tuple(
+            f"""CREATE TRIGGER IF NOT EXISTS trg_journal_{table}_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO sync_journal (tbl, row_id) VALUES ('{table}', {row}.id);
+                END"""
+            for table in ("clients", "product_prices", "distributions", "payments")
+            for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+        ) + tuple(
+            # الصفوف الموجودة ترسل كلها في أول مزامنة
+            f"INSERT INTO sync_journal (tbl, row_id) SELECT '{table}', id FROM {table}"
+            for table in ("clients", "product_prices", "distributions", "payments")
+        )),
+        # 7: حالة الأرشيف (آخر تاريخ نقل إلى distribution_archive.db، انظر archive.py)
+        (7, (
+            '''
+            CREATE TABLE IF NOT EXISTS archive_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            ) WITHOUT ROWID
+            ''',
+        )),
+        # 8: إعدادات البرنامج (مثل جدولة النسخ الاحتياطي)
+        (8, (
+            '''
+            CREATE TABLE IF NOT EXISTS app_settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            ) WITHOUT ROWID
+            ''',
+        )),
+        # 9: أعمار المستحقات من الفهرس وحده (بدون قراءة صفوف التوزيعات)
+        (9, (
+            """CREATE INDEX IF NOT EXISTS idx_distributions_open_aging
+               ON distributions (client_id, distribution_date, remaining_amount)
+               WHERE remaining_amount > 0""",
+        )),
+        # 10: إصلاح قواعد رحلت بالترحيل 5 قبل تصحيحه (أسطر الدفعات القديمة بكامل المبلغ
+        # دون إضافتها إلى المدفوع): المدفوع = المبلغ - المتبقي، ثم تقص الأسطر الزائدة عن
+        # المدفوع (الأحدث أولاً)
+        (10, (
+            """UPDATE distributions
+               SET paid_amount = ROUND(COALESCE(total_amount, 0) - COALESCE(remaining_amount, 0), 2)
+               WHERE COALESCE(total_amount, 0) - COALESCE(paid_amount, 0)
+                     - COALESCE(remaining_amount, 0) > 0.005
+                 AND id IN (SELECT distribution_id FROM payment_allocations)""",
+            """UPDATE payment_allocations SET amount = ROUND(amount - excess, 2)
+               FROM (
+                   SELECT payment_id AS pid, distribution_id AS did, MIN(amount, MAX(
+                       total - paid - (TOTAL(amount) OVER (
+                           PARTITION BY distribution_id ORDER BY payment_id DESC) - amount),
+                   0)) AS excess
+                   FROM (
+                       SELECT a.payment_id, a.distribution_id, a.amount,
+                              TOTAL(a.amount) OVER (PARTITION BY a.distribution_id) AS total,
+                              COALESCE(d.paid_amount, 0) AS paid
+                       FROM payment_allocations a JOIN distributions d ON d.id = a.distribution_id
+                   )
+               )
+               WHERE payment_id = pid AND distribution_id = did AND excess > 0.005""",
+            "DELETE FROM payment_allocations WHERE amount < 0.005",
+        )),
+    )
+
+    def __init__(self, db_name="distribution.db"):
+        self.db_name = db_name
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        # عداد تغييرات لكل جدول (تستخدمه الواجهة لمعرفة الشاشات التي تحتاج تحديثاً)
+        self._table_versions = {}
+        # تعديلات العمليات الأخرى على الملف (انظر external_version)
+        self._watch = None
+        self._watch_lock = threading.Lock()
+        self._seen_data_version = None
+        self._external_changes = 0
+        # إحصاءات الاستعلامات (معطلة افتراضياً، انظر enable_stats)
+        self.stats = None
+        if os.environ.get("DISTRIBUTION_DB_STATS"):
+            dump_to = os.environ["DISTRIBUTION_DB_STATS"]
+            self.enable_stats(float(os.environ.get("DISTRIBUTION_DB_SLOW_MS", 100)),
+                              dump_to=None if dump_to == "1" else dump_to)
+        self.init_database()
+        atexit.register(self.close)
+    
+    def enable_stats(self, slow_ms=100.0, dump_to=None, dump_at_exit=True):
+        """تفعيل قياس الاستعلامات. تفرغ الإحصاءات عند الخروج في dump_to (JSON) أو stderr"""
+        if self.stats is None:
+            self.stats = QueryStats(slow_ms)
+            if dump_at_exit:
+                atexit.register(lambda: self.stats and self.stats.dump(dump_to))
+        else:
+            self.stats.slow_ms = slow_ms
+        return self.stats
+    
+    def disable_stats(self):
+        self.stats = None
+    
+    def query_stats(self):
+        """إحصاءات الاستعلامات الحالية (قائمة فارغة إذا كان القياس معطلاً)"""
+        return self.stats.snapshot() if self.stats else []
+    
+    @contextlib.contextmanager
+    def tag(self, name):
+        """وسم استعلامات الخيط الحالي (مثل اسم الشاشة) داخل الكتلة"""
+        previous = getattr(self._local, "tag", None)
+        self._local.tag = name
+        try:
+            yield
+        finally:
+            self._local.tag = previous
+    
+    def _caller_tag(self):
+        """الدالة التي استدعت قاعدة البيانات (مثل ClientModel.add_client) مع وسم الخيط"""
+        frame = sys._getframe(2)
+        while frame is not None and isinstance(frame.f_locals.get("self"), (Database, Transaction)):
+            frame = frame.f_back
+        caller = getattr(frame.f_code, "co_qualname", frame.f_code.co_name) if frame else None
+        tag = getattr(self._local, "tag", None)
+        return f"{tag} > {caller}" if tag else caller
+    
+    def _record(self, query, params, seconds, rows=None):
+        stats = self.stats
+        if stats is None:
+            return
+        tag = self._caller_tag()
+        stats.record(query, seconds, rows, tag)
+        if stats.is_slow(seconds) and not query.startswith("<"):
+            try:
+                plan = self.explain(query, params) if params is not None else []
+            except sqlite3.Error:
+                plan = []
+            stats.record_slow(query, seconds, params, tag, plan)
+    
+    def _open_connection(self):
+        """فتح اتصال جديد وتطبيق الإعدادات"""
+        start = time.perf_counter()
+        conn = sqlite3.connect(
+            self.db_name,
+            cached_statements=self.STATEMENT_CACHE_SIZE,
+            check_same_thread=False,
+        )
+        for name, value in self.PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.stats is not None:
+            self.stats.record("<connect>", time.perf_counter() - start)
+        return conn
+    
+    def _commit(self, conn):
+        if self.stats is None:
+            conn.commit()
+            return
+        start = time.perf_counter()
+        conn.commit()
+        self.stats.record("<commit>", time.perf_counter() - start)
+    
+    def get_connection(self):
+        """جلب الاتصال الدائم الخاص بالخيط الحالي"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def close(self):
+        """إغلاق جميع الاتصالات المفتوحة"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        with self._watch_lock:
+            if self._watch is not None:
+                connections.append(self._watch)
+                self._watch = None
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+    
+    def release_connection(self):
+        """إغلاق اتصال الخيط الحالي (للخيوط المؤقتة مثل التصدير)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+    
+    def backup(self, target_path):
+        """نسخ قاعدة البيانات إلى ملف آخر بواجهة النسخ الاحتياطي في SQLite"""
+        target = sqlite3.connect(target_path)
+        try:
+            self.get_connection().backup(target)
+        finally:
+            target.close()
+    
+    @property
+    def archive_path(self):
+        """ملف الأرشيف بجانب القاعدة (distribution.db -> distribution_archive.db)"""
+        return os.path.splitext(self.db_name)[0] + "_archive.db"
+    
+    def attach_archive(self, create=False):
+        """ربط ملف الأرشيف باتصال الخيط الحالي باسم archive (False إذا لم يوجد)"""
+        conn = self.get_connection()
+        if getattr(self._local, "archive_conn", None) is conn:
+            return True
+        if not create and not os.path.exists(self.archive_path):
+            return False
+        conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        self._local.archive_conn = conn
+        return True
+    
+    def archived_through(self):
+        """آخر تاريخ نقلت صفوفه إلى الأرشيف (None إذا لم يؤرشف شيء)"""
+        row = self.fetch_one("SELECT value FROM archive_state WHERE key = 'archived_through'")
+        return row[0] if row else None
+    
+    def source(self, table, since=None, indexed_by=None, alias=None):
+        """مصدر جدول في استعلام: الجدول الحي وحده، أو مع نسخته المؤرشفة (UNION ALL)
+        إذا كانت الفترة المطلوبة (من since، أو كل السجل) تشمل تواريخ مؤرشفة.
+        alias يوضع قبل INDEXED BY كما تتطلب SQLite"""
+        named = f" AS {alias}" if alias else ""
+        through = self.archived_through()
+        if through is None or (since is not None and str(since) > through) or not self.attach_archive():
+            return f"{table}{named} INDEXED BY {indexed_by}" if indexed_by else f"{table}{named}"
+        return f"(SELECT * FROM main.{table} UNION ALL SELECT * FROM archive.{table}){named}"
+    
+    def init_database(self):
+        """تهيئة قاعدة البيانات والجداول"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # جدول العملاء
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS clients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                address TEXT,
+                phone TEXT,
+                created_date DATE,
+                is_active BOOLEAN DEFAULT TRUE
+            )
+        ''')
+        
+        # جدول أسعار المنتج
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_prices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                price_date DATE UNIQUE,
+                price_per_kg REAL NOT NULL
+            )
+        ''')
+        
+        # جدول التوزيعات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS distributions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER,
+                distribution_date DATE,
+                quantity_kg REAL,
+                price_per_kg REAL,
+                total_amount REAL,
+                paid_amount REAL,
+                remaining_amount REAL,
+                FOREIGN KEY (client_id) REFERENCES clients(id)
+            )
+        ''')
+        
+        # جدول المدفوعات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER,
+                payment_date DATE,
+                amount REAL,
+                payment_method TEXT,
+                description TEXT,
+                distribution_id INTEGER,
+                FOREIGN KEY (client_id) REFERENCES clients(id)
+            )
+        ''')
+        
+        # إضافة مستخدم افتراضي
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE,
+                password TEXT
+            )
+        ''')
+        
+        # إضافة المستخدم الافتراضي إذا لم يكن موجوداً
+        cursor.execute("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)", 
+                      ('admin', 'admin123'))
+        
+        conn.commit()
+        self.migrate()
+    
+    def migrate(self):
+        """ترقية مخطط قاعدة البيانات إلى آخر إصدار"""
+        conn = self.get_connection()
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, statements in self.MIGRATIONS:
+            if version <= current:
+                continue
+            try:
+                conn.execute("BEGIN")
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+    
+    def explain(self, query, params=()):
+        """خطة تنفيذ الاستعلام (EXPLAIN QUERY PLAN)"""
+        rows = self.get_connection().execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+        return [row[3] for row in rows]
+    
+    def _mark_changed(self, query):
+        match = self.WRITE_TARGET.match(query)
+        if match:
+            table = match.group(1).lower()
+            with self._lock:
+                self._table_versions[table] = self._table_versions.get(table, 0) + 1
+    
+    def table_versions(self):
+        """نسخة من عدادات التغيير لكل جدول"""
+        with self._lock:
+            return dict(self._table_versions)
+    
+    def mark_changed(self, *tables):
+        """اعتبار الجداول معدلة (بعد تغيير لم يمر عبر الاستعلامات، مثل الاستعادة)"""
+        with self._lock:
+            for table in tables:
+                self._table_versions[table] = self._table_versions.get(table, 0) + 1
+    
+    def get_settings(self, prefix=""):
+        """الإعدادات المحفوظة التي تبدأ بـ prefix: {المفتاح: القيمة}"""
+        rows = self.fetch_all("SELECT key, value FROM app_settings WHERE key >= ? AND key < ?",
+                              (prefix, prefix + "\uffff"))
+        return dict(rows)
+    
+    def set_settings(self, settings):
+        """حفظ عدة إعدادات في معاملة واحدة"""
+        self.execute_many("INSERT OR REPLACE INTO app_settings (key, value) VALUES (?, ?)",
+                          [(key, str(value)) for key, value in settings.items()])
+    
+    def data_version(self, *tables):
+        """رقم يتغير كلما تم تعديل أحد الجداول المحددة (أو عدلت عملية أخرى الملف)"""
+        return sum(self._table_versions.get(table, 0) for table in tables) + self.external_version()
+    
+    def external_version(self):
+        """عداد تعديلات العمليات الأخرى على الملف (سطر الأوامر، نسخة أخرى من البرنامج، الاستعادة):
+        يزيد عندما يتغير PRAGMA data_version لاتصال مراقبة دون حفظ من هذه العملية.
+        لا يعرف الجداول المعدلة فتعتبر كلها معدلة"""
+        with self._watch_lock:
+            if self._watch is None:
+                self._watch = self._open_connection()
+                self._seen_data_version = self._watch_data_version()
+            else:
+                current = self._watch_data_version()
+                if current != self._seen_data_version:
+                    self._seen_data_version = current
+                    self._external_changes += 1
+            return self._external_changes
+    
+    def _watch_data_version(self):
+        return self._watch.execute("PRAGMA data_version").fetchone()[0]
+    
+    @contextlib.contextmanager
+    def transaction(self):
+        """وحدة عمل: كل الكتابات داخل الكتلة تحفظ مرة واحدة عند نهايتها أو تلغى كلها عند الخطأ.
+        داخل معاملة مفتوحة تصبح نقطة حفظ (SAVEPOINT) تلغى وحدها دون المعاملة الخارجية"""
+        outer = getattr(self._local, "tx", None)
+        if outer is not None:
+            outer.depth += 1
+            name = f"sp_{outer.depth}"
+            pending = len(outer.on_commit)
+            outer.conn.execute(f"SAVEPOINT {name}")
+            try:
+                yield outer
+            except BaseException:
+                outer.conn.execute(f"ROLLBACK TO {name}")
+                outer.conn.execute(f"RELEASE {name}")
+                del outer.on_commit[pending:]
+                raise
+            else:
+                outer.conn.execute(f"RELEASE {name}")
+            finally:
+                outer.depth -= 1
+            return
+        
+        conn = self.get_connection()
+        tx = Transaction(self, conn)
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.tx = tx
+        try:
+            yield tx
+            if self._watch is None:
+                self._commit(conn)
+            else:
+                # حفظ هذه العملية لا يحسب تعديلاً خارجياً
+                with self._watch_lock:
+                    self._commit(conn)
+                    self._seen_data_version = self._watch_data_version()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._local.tx = None
+        for query in tx.writes:
+            self._mark_changed(query)
+        for callback in tx.on_commit:
+            callback()
+    
+    def after_commit(self, callback, *args):
+        """تنفيذ callback بعد حفظ المعاملة الحالية (أو فوراً إن لم توجد معاملة)؛
+        تستخدم لتحديث النسخ المحفوظة في الذاكرة فقط بعد نجاح الحفظ"""
+        tx = getattr(self._local, "tx", None)
+        if tx is None:
+            callback(*args)
+        else:
+            tx.on_commit.append(lambda: callback(*args))
+    
+    def in_transaction(self):
+        """هل توجد معاملة مفتوحة في الخيط الحالي"""
+        return getattr(self._local, "tx", None) is not None
+    
+    def execute_query(self, query, params=()):
+        """تنفيذ استعلام مع معاملات (يحفظ فوراً إلا داخل transaction)"""
+        with self.transaction() as tx:
+            return tx.execute(query, params).lastrowid
+    
+    def execute_many(self, query, seq_of_params):
+        """تنفيذ نفس الاستعلام لعدة صفوف في معاملة واحدة"""
+        with self.transaction() as tx:
+            return tx.execute_many(query, seq_of_params).rowcount
+    
+    def execute_transaction(self, queries):
+        """تنفيذ عدة استعلامات (استعلام، معاملات) في معاملة واحدة"""
+        with self.transaction() as tx:
+            for query, params in queries:
+                tx.execute(query, params)
+    
+    def fetch_all(self, query, params=()):
+        """جلب جميع النتائج"""
+        if self.stats is None:
+            return self.get_connection().execute(query, params).fetchall()
+        start = time.perf_counter()
+        rows = self.get_connection().execute(query, params).fetchall()
+        self._record(query, params, time.perf_counter() - start, len(rows))
+        return rows
+    
+    def fetch_one(self, query, params=()):
+        """جلب نتيجة واحدة"""
+        if self.stats is None:
+            return self.get_connection().execute(query, params).fetchone()
+        start = time.perf_counter()
+        row = self.get_connection().execute(query, params).fetchone()
+        self._record(query, params, time.perf_counter() - start, 1 if row else 0)
+        return row
+    
+    def iter_batches(self, query, params=(), batch_size=1000):
+        """قراءة النتائج على دفعات (fetchmany) دون تحميلها كلها في الذاكرة"""
+        start = time.perf_counter()
+        count = 0
+        cursor = self.get_connection().execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                count += len(rows)
+                yield rows
+        finally:
+            cursor.close()
+            if self.stats is not None:
+                self._record(query, params, time.perf_counter() - start, count)
+
+class Auth:
+    def __init__(self, db=None):
+        self.db = db or Database()
+        self.current_user = None
+    
+    def authenticate(self, username, password):
+        """بيانات المستخدم إذا كانت كلمة المرور صحيحة (بدون تغيير المستخدم الحالي)"""
+        query = "SELECT * FROM users WHERE username = ? AND password = ?"
+        return self.db.fetch_one(query, (username, password))
+    
+    def login(self, username, password):
+        """تسجيل الدخول"""
+        user = self.authenticate(username, password)
+        
+        if user:
+            self.current_user = user
+            return True
+        return False
+    
+    def change_password(self, new_password):
+        """تغيير كلمة المرور"""
+        if self.current_user:
+            query = "UPDATE users SET password = ? WHERE id = ?"
+            self.db.execute_query(query, (new_password, self.current_user[0]))
+            return True
+        return False
+    
+    def update_password(self, username, password, new_password):
+        """تغيير كلمة مرور مستخدم بعد التحقق من كلمة مروره الحالية (للاستخدام عبر الخادم)"""
+        user = self.authenticate(username, password)
+        if not user:
+            return False
+        self.db.execute_query("UPDATE users SET password = ? WHERE id = ?", (new_password, user[0]))
+        return True
+
+class ClientIndex:
+    """فهرس بحث في الذاكرة عن العملاء بالاسم والهاتف والعنوان
+    (قائمة كلمات مرتبة يبحث فيها بالبادئة بالبحث الثنائي)"""
+    
+    ARABIC_FOLD = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+                                 "ة": "ه", "ى": "ي", "ؤ": "و", "ئ": "ي", "ـ": None})
+    DIACRITICS = re.compile(r"[\u064B-\u0652]")
+    
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._clients = {}
+        self._names = {}
+    
+    @classmethod
+    def normalize(cls, text):
+        """توحيد أشكال الحروف وإزالة التشكيل قبل المقارنة"""
+        text = cls.DIACRITICS.sub("", str(text or "")).translate(cls.ARABIC_FOLD)
+        return text.casefold().strip()
+    
+    @classmethod
+    def tokens_of(cls, name, address, phone):
+        """الكلمات المفهرسة لعميل واحد"""
+        tokens = set(cls.normalize(f"{name} {address}").split())
+        digits = re.sub(r"\D", "", str(phone or ""))
+        if digits:
+            tokens.add(digits)
+        return tokens
+    
+    def load(self):
+        """بناء الفهرس من العملاء النشطين"""
+        rows = self.db.fetch_all(
+            "SELECT id, name, address, phone FROM clients WHERE is_active = TRUE"
+        )
+        clients = {row[0]: tuple(row) for row in rows}
+        names = {client_id: self.normalize(client[1]) for client_id, client in clients.items()}
+        tokens = sorted(
+            (token, client[0])
+            for client in clients.values()
+            for token in self.tokens_of(*client[1:])
+        )
+        with self._lock:
+            self._clients = clients
+            self._names = names
+            self._tokens = tokens
+    
+    @property
+    def loaded(self):
+        return self._tokens is not None
+    
+    def _insert(self, client):
+        self._clients[client[0]] = client
+        self._names[client[0]] = self.normalize(client[1])
+        for token in self.tokens_of(*client[1:]):
+            bisect.insort(self._tokens, (token, client[0]))
+    
+    def _discard(self, client_id):
+        client = self._clients.pop(client_id, None)
+        self._names.pop(client_id, None)
+        if client is None:
+            return
+        for token in self.tokens_of(*client[1:]):
+            index = bisect.bisect_left(self._tokens, (token, client_id))
+            if index < len(self._tokens) and self._tokens[index] == (token, client_id):
+                del self._tokens[index]
+    
+    def put(self, client_id, name, address, phone):
+        """إضافة عميل أو تحديث كلماته في الفهرس"""
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._discard(client_id)
+            self._insert((client_id, name, address, phone))
+    
+    def remove(self, client_id):
+        """حذف عميل من الفهرس"""
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._discard(client_id)
+    
+    def get(self, client_id):
+        """بيانات عميل مفهرس (id, name, address, phone) أو None"""
+        return self._clients.get(client_id)
+    
+    def _prefix_ids(self, prefix):
+        ids = set()
+        index = bisect.bisect_left(self._tokens, (prefix,))
+        while index < len(self._tokens) and self._tokens[index][0].startswith(prefix):
+            ids.add(self._tokens[index][1])
+            index += 1
+        return ids
+    
+    def search(self, text, limit=10):
+        """أفضل العملاء المطابقين لكل كلمات النص المدخل (بالبادئة)"""
+        words = set(self.normalize(text).split())
+        if not words:
+            return []
+        if self._tokens is None:
+            self.load()
+        with self._lock:
+            matches = None
+            for word in sorted(words, key=len, reverse=True):
+                ids = self._prefix_ids(word)
+                matches = ids if matches is None else matches & ids
+                if not matches:
+                    return []
+            query = self.normalize(text)
+            names = self._names
+            best = heapq.nsmallest(limit, matches, key=lambda client_id: (
+                not names[client_id].startswith(query), names[client_id], client_id
+            ))
+            return [self._clients[client_id] for client_id in best]
+
+class ClientModel:
+    def __init__(self, db=None):
+        self.db = db or Database()
+        self.index = ClientIndex(self.db)
+    
+    def add_client(self, name, address, phone):
+        """إضافة عميل جديد"""
+        query = """INSERT INTO clients (name, address, phone, created_date) 
+                   VALUES (?, ?, ?, ?)"""
+        client_id = self.db.execute_query(query, (name, address, phone, datetime.now().date()))
+        self.db.after_commit(self.index.put, client_id, name, address, phone)
+        return client_id
+    
+    def get_all_clients(self):
+        """جلب جميع العملاء"""
+        query = "SELECT * FROM clients WHERE is_active = TRUE ORDER BY name"
+        return self.db.fetch_all(query)
+    
+    def get_client_by_id(self, client_id):
+        """جلب عميل بواسطة المعرف"""
+        query = "SELECT * FROM clients WHERE id = ?"
+        return self.db.fetch_one(query, (client_id,))
+    
+    def update_client(self, client_id, name, address, phone):
+        """تحديث بيانات العميل (العميل المعطل يبقى خارج فهرس البحث)"""
+        query = """UPDATE clients SET name = ?, address = ?, phone = ? 
+                   WHERE id = ? RETURNING is_active"""
+        with self.db.transaction() as tx:
+            row = tx.fetch_one(query, (name, address, phone, client_id))
+        if row and row[0]:
+            self.db.after_commit(self.index.put, client_id, name, address, phone)
+        else:
+            self.db.after_commit(self.index.remove, client_id)
+    
+    def delete_client(self, client_id):
+        """حذف عميل (تعطيل)"""
+        query = "UPDATE clients SET is_active = FALSE WHERE id = ?"
+        self.db.execute_query(query, (client_id,))
+        self.db.after_commit(self.index.remove, client_id)
+    
+    def load_search_index(self):
+        """بناء فهرس البحث إن لم يكن محملاً"""
+        if not self.index.loaded:
+            self.index.load()
+    
+    def search_clients(self, text, limit=10):
+        """بحث سريع عن العملاء بالاسم أو الهاتف أو العنوان"""
+        return self.index.search(text, limit)
+    
+    def get_client_balance(self, client_id):
+        """حساب رصيد العميل"""
+        query = "SELECT balance FROM client_balances WHERE client_id = ?"
+        result = self.db.fetch_one(query, (client_id,))
+        return result[0] if result else 0
+    
+    def get_clients_with_balances(self):
+        """جلب جميع العملاء النشطين مع أرصدتهم في استعلام واحد"""
+        query = """
+            SELECT c.id, c.name, c.address, c.phone, c.created_date, c.is_active,
+                   COALESCE(b.balance, 0) as balance
+            FROM clients c
+            LEFT JOIN client_balances b ON b.client_id = c.id
+            WHERE c.is_active = TRUE
+            ORDER BY c.name
+        """
+        return self.db.fetch_all(query)
+    
+    def get_client_with_balance(self, client_id):
+        """جلب عميل مع رصيده (بنفس أعمدة get_clients_page)"""
+        query = """
+            SELECT c.id, c.name, c.address, c.phone, c.created_date, c.is_active,
+                   COALESCE(b.balance, 0) as balance
+            FROM clients c
+            LEFT JOIN client_balances b ON b.client_id = c.id
+            WHERE c.id = ?
+        """
+        return self.db.fetch_one(query, (client_id,))
+    
+    def get_clients_page(self, after=None, limit=100):
+        """صفحة من العملاء النشطين مع أرصدتهم مرتبة بالاسم
+        after: (الاسم، المعرف) لآخر عميل في الصفحة السابقة"""
+        query = """
+            SELECT c.id, c.name, c.address, c.phone, c.created_date, c.is_active,
+                   COALESCE(b.balance, 0) as balance
+            FROM clients c
+            LEFT JOIN client_balances b ON b.client_id = c.id
+            WHERE c.is_active = TRUE {keyset}
+            ORDER BY c.name, c.id
+            LIMIT ?
+        """
+        if after is None:
+            return self.db.fetch_all(query.format(keyset=""), (limit,))
+        return self.db.fetch_all(
+            query.format(keyset="AND (c.name, c.id) > (?, ?)"), (*after, limit)
+        )
+    
+    # كشف الحساب: التوزيعات (مدين: المبلغ، دائن: المدفوع عند التسليم) والدفعات (دائن)
+    # في سجل واحد مرتب بـ (التاريخ، النوع، المعرف)؛ النوع 0 للتوزيع و1 للدفعة
+    STATEMENT_ENTRIES = """
+        SELECT d.distribution_date AS entry_date, 0 AS kind, d.id, d.quantity_kg,
+               COALESCE(d.total_amount, 0) AS debit,
+               COALESCE(d.paid_amount, 0) - COALESCE((
+                   SELECT SUM(a.amount) FROM {allocations} a WHERE a.distribution_id = d.id
+               ), 0) AS credit,
+               d.price_per_kg AS detail
+        FROM {distributions} d
+        WHERE d.client_id = :client_id {distribution_range}
+        UNION ALL
+        SELECT p.payment_date, 1, p.id, NULL, 0, p.amount,
+               TRIM(COALESCE(p.payment_method, '') || ' ' || COALESCE(p.description, ''))
+        FROM {payments} p
+        WHERE p.client_id = :client_id {payment_range}
+    """
+    # الرصيد الجاري = رصيد بداية الصفحة + المجموع التراكمي داخلها
+    STATEMENT_PAGE = """
+        SELECT entry_date, kind, id, quantity_kg, debit, credit,
+               :opening + SUM(debit - credit) OVER (
+                   ORDER BY entry_date, kind, id ROWS UNBOUNDED PRECEDING
+               ) AS balance,
+               detail
+        FROM ({entries} ORDER BY entry_date, kind, id LIMIT :limit)
+        ORDER BY entry_date, kind, id
+    """
+    
+    def _statement_entries(self, since, distribution_range, payment_range):
+        return self.STATEMENT_ENTRIES.format(
+            allocations=self.db.source("payment_allocations", since),
+            distributions=self.db.source("distributions", since),
+            payments=self.db.source("payments", since),
+            distribution_range=distribution_range, payment_range=payment_range,
+        )
+    
+    def get_opening_balance(self, client_id, start=None):
+        """رصيد العميل قبل تاريخ start (صفر إذا لم يحدد)"""
+        if start is None:
+            return 0.0
+        entries = self._statement_entries(
+            None, "AND d.distribution_date < :start", "AND p.payment_date < :start"
+        )
+        return self.db.fetch_one(f"SELECT TOTAL(debit - credit) FROM ({entries})",
+                                 {"client_id": client_id, "start": str(start)})[0]
+    
+    def get_client_statement(self, client_id, start=None, after=None, limit=100):
+        """صفحة من كشف حساب العميل بالترتيب الزمني مع الرصيد الجاري.
+        الصف: (التاريخ، النوع 0 توزيع/1 دفعة، المعرف، الكمية، مدين، دائن، الرصيد، السعر أو الوصف).
+        الصفحة الأولى تبدأ من start برصيده الافتتاحي؛ after: (التاريخ، النوع، المعرف، الرصيد)
+        لآخر صف في الصفحة السابقة فيحمل رصيده إلى الصفحة التالية"""
+        params = {"client_id": client_id, "limit": limit}
+        if after is None:
+            params["opening"] = self.get_opening_balance(client_id, start)
+            since = start
+            if start is None:
+                distribution_range = payment_range = ""
+            else:
+                params["start"] = str(start)
+                distribution_range = "AND d.distribution_date >= :start"
+                payment_range = "AND p.payment_date >= :start"
+        else:
+            since, kind, params["after_id"], params["opening"] = after
+            params["after_date"] = since
+            # توزيعات اليوم تسبق دفعاته
+            if kind == 0:
+                distribution_range = "AND (d.distribution_date, d.id) > (:after_date, :after_id)"
+                payment_range = "AND p.payment_date >= :after_date"
+            else:
+                distribution_range = "AND d.distribution_date > :after_date"
+                payment_range = "AND (p.payment_date, p.id) > (:after_date, :after_id)"
+        entries = self._statement_entries(since, distribution_range, payment_range)
+        return self.db.fetch_all(self.STATEMENT_PAGE.format(entries=entries), params)
+    
+    # الرصيد الختامي لكشف الحساب (انظر STATEMENT_ENTRIES) مضافاً إليه ما لم يوزع من
+    # الدفعات (رصيد دائن لا يظهر في الدفتر): مبلغ التوزيع - المدفوع عند التسليم - أسطر
+    # الدفعات الموزعة عليه، فيساوي الدفتر ما دام المدفوع = المدفوع عند التسليم + أسطره
+    STATEMENT_BALANCES = """
+        SELECT client_id, TOTAL(amount) AS balance FROM (
+            SELECT client_id, COALESCE(total_amount, 0) - COALESCE(paid_amount, 0) AS amount
+            FROM distributions
+            UNION ALL
+            SELECT d.client_id, a.amount
+            FROM payment_allocations a JOIN distributions d ON d.id = a.distribution_id
+            UNION ALL
+            SELECT p.client_id, -a.amount
+            FROM payment_allocations a JOIN payments p ON p.id = a.payment_id
+        )
+        GROUP BY client_id
+    """
+    
+    def verify_balances(self, rebuild=False):
+        """مقارنة دفتر الأرصدة بالتوزيعات وبكشف الحساب وإرجاع الفروقات
+        (client_id, الدفتر، الفعلي) مع إعادة بناء الدفتر اختيارياً"""
+        query = """
+            WITH actual AS (
+                SELECT client_id, SUM(remaining_amount) as balance
+                FROM distributions
+                WHERE remaining_amount > 0
+                GROUP BY client_id
+            ),
+            ids AS (
+                SELECT client_id FROM actual
+                UNION
+                SELECT client_id FROM client_balances
+            )
+            SELECT ids.client_id,
+                   COALESCE(b.balance, 0) as stored,
+                   COALESCE(a.balance, 0) as actual
+            FROM ids
+            LEFT JOIN client_balances b ON b.client_id = ids.client_id
+            LEFT JOIN actual a ON a.client_id = ids.client_id
+            WHERE ABS(COALESCE(b.balance, 0) - COALESCE(a.balance, 0)) > 0.005
+            ORDER BY ids.client_id
+        """
+        drift = self.db.fetch_all(query)
+        if rebuild and drift:
+            self.db.execute_transaction([(q, ()) for q in Database.REBUILD_BALANCES])
+        # كشف الحساب لا يصلحه إعادة بناء الدفتر (المدفوع في التوزيعات نفسه خاطئ)
+        statement = self.db.fetch_all(f"""
+            SELECT s.client_id, COALESCE(b.balance, 0), s.balance
+            FROM ({self.STATEMENT_BALANCES}) s
+            LEFT JOIN client_balances b ON b.client_id = s.client_id
+            WHERE ABS(COALESCE(b.balance, 0) - s.balance) > 0.005
+        """)
+        return sorted(set(drift) | set(statement))
+
+class PriceCalendar:
+    """تقويم الأسعار: يحمل سجل الأسعار مرة واحدة في الذاكرة
+    ويجيب عن "السعر بتاريخ معين" بالبحث الثنائي"""
+    
+    def __init__(self, db):
+        self.db = db
+        self._dates = None
+        self._prices = None
+        self._version = None
+    
+    HISTORY = "SELECT price_date, price_per_kg FROM product_prices ORDER BY price_date"
+    
+    def load(self, rows=None):
+        """تحميل سجل الأسعار مرتباً حسب التاريخ (أو من صفوف جاهزة)"""
+        external_version = getattr(self.db, "external_version", None)
+        self._version = external_version() if external_version else None
+        if rows is None:
+            rows = self.db.fetch_all(self.HISTORY)
+        self._dates = [str(row[0]) for row in rows]
+        self._prices = [row[1] for row in rows]
+    
+    def invalidate(self):
+        """إلغاء النسخة المحملة (تعاد عند أول طلب)"""
+        self._dates = None
+        self._prices = None
+    
+    def refresh(self):
+        """إلغاء النسخة المحملة إذا عدلت عملية أخرى الملف بعد تحميلها (مثل cli set-price)"""
+        external_version = getattr(self.db, "external_version", None)
+        if self._dates is not None and external_version and external_version() != self._version:
+            self.invalidate()
+    
+    def price_on(self, date):
+        """آخر سعر معتمد في التاريخ المحدد أو قبله (0 إذا لم يوجد)"""
+        if self._dates is None:
+            self.load()
+        index = bisect.bisect_right(self._dates, str(date))
+        return self._prices[index - 1] if index else 0.0
+    
+    def set_price(self, date, price):
+        """تحديث سعر تاريخ معين في الذاكرة بعد حفظه في قاعدة البيانات"""
+        if self._dates is None:
+            return
+        key = str(date)
+        index = bisect.bisect_left(self._dates, key)
+        if index < len(self._dates) and self._dates[index] == key:
+            self._prices[index] = price
+        else:
+            self._dates.insert(index, key)
+            self._prices.insert(index, price)
+
+class DistributionModel:
+    # مدة صلاحية ملخص لوحة التحكم بالثواني (وتلغى فوراً عند أي كتابة على جداوله)
+    SUMMARY_TTL = 5.0
+    SUMMARY_TABLES = ("clients", "distributions", "product_prices", "payments")
+    
+    def __init__(self, db=None):
+        self.db = db or Database()
+        self.prices = PriceCalendar(self.db)
+        self._summary_cache = None
+    
+    def set_today_price(self, price):
+        """تعيين سعر اليوم"""
+        self.set_price(price)
+    
+    def set_price(self, price, price_date=None):
+        """تعيين سعر تاريخ معين (اليوم افتراضياً)"""
+        price_date = price_date or datetime.now().date()
+        query = """INSERT OR REPLACE INTO product_prices (price_date, price_per_kg) 
+                   VALUES (?, ?)"""
+        self.db.execute_query(query, (price_date, price))
+        self.db.after_commit(self.prices.set_price, price_date, price)
+    
+    def get_price_history(self):
+        """سجل الأسعار كاملاً: (التاريخ، السعر) مرتباً حسب التاريخ"""
+        return self.db.fetch_all(PriceCalendar.HISTORY)
+    
+    def load_prices(self):
+        """تحميل تقويم الأسعار (يعاد تحميله لالتقاط التعديلات الخارجية)"""
+        self.prices.load()
+    
+    def get_today_price(self):
+        """جلب سعر اليوم"""
+        self.prices.refresh()
+        return self.prices.price_on(datetime.now().date())
+    
+    def get_price_on(self, date):
+        """جلب السعر المعتمد بتاريخ معين"""
+        self.prices.refresh()
+        return self.prices.price_on(date)
+    
+    def add_distribution(self, client_id, quantity_kg, paid_amount=0, distribution_date=None):
+        """إضافة توزيع جديد"""
+        if distribution_date is None:
+            distribution_date = datetime.now().date()
+        self.prices.refresh()
+        price_per_kg = self.prices.price_on(distribution_date)
+        total_amount = quantity_kg * price_per_kg
+        remaining_amount = total_amount - paid_amount
+        
+        query = """INSERT INTO distributions 
+                   (client_id, distribution_date, quantity_kg, price_per_kg, 
+                    total_amount, paid_amount, remaining_amount) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?)"""
+        
+        return self.db.execute_query(query, (
+            client_id, distribution_date, quantity_kg, price_per_kg,
+            total_amount, paid_amount, remaining_amount
+        ))
+    
+    def delete_distribution(self, distribution_id):
+        """حذف توزيع (الأرصدة والإجماليات تحدث عبر المشغلات)"""
+        self.db.execute_transaction([
+            ("UPDATE payments SET distribution_id = NULL WHERE distribution_id = ?", (distribution_id,)),
+            ("DELETE FROM distributions WHERE id = ?", (distribution_id,)),
+        ])
+    
+    def get_distribution_with_client(self, distribution_id):
+        """جلب توزيع مع اسم العميل (بنفس أعمدة get_daily_distributions)"""
+        query = """
+            SELECT d.*, c.name as client_name 
+            FROM distributions d
+            JOIN clients c ON d.client_id = c.id
+            WHERE d.id = ?
+        """
+        return self.db.fetch_one(query, (distribution_id,))
+    
+    def import_distributions_csv(self, csv_file, distribution_date=None):
+        """استيراد توزيعات من ملف CSV (العميل: اسم أو معرف، الكمية، المدفوع، التاريخ اختياري)
+        في معاملة واحدة. يرجع (عدد المستورد، قائمة الصفوف المرفوضة)"""
+        if distribution_date is None:
+            distribution_date = datetime.now().date()
+        
+        # جلب العملاء والسعر مرة واحدة فقط
+        client_ids = set()
+        ids_by_name = {}
+        for client in self.db.fetch_all("SELECT id, name FROM clients WHERE is_active = TRUE"):
+            client_ids.add(client[0])
+            ids_by_name.setdefault(client[1].strip(), []).append(client[0])
+        distribution_date = str(distribution_date)
+        self.prices.refresh()
+        
+        rejected = []
+        
+        def valid_rows(reader):
+            for line_number, row in enumerate(reader, start=1):
+                if not row or not any(cell.strip() for cell in row):
+                    continue
+                if len(row) < 2:
+                    rejected.append((line_number, row, "عدد الأعمدة غير كاف"))
+                    continue
+                
+                client_ref = row[0].strip()
+                quantity = row[1].strip()
+                paid = row[2].strip() if len(row) > 2 and row[2].strip() else "0"
+                row_date = row[3].strip() if len(row) > 3 and row[3].strip() else distribution_date
+                
+                # تجاهل سطر العناوين
+                if line_number == 1 and not Validators.validate_number(quantity):
+                    continue
+                
+                if not Validators.validate_required(client_ref):
+                    rejected.append((line_number, row, "العميل مطلوب"))
+                    continue
+                if not Validators.validate_number(quantity) or float(quantity) <= 0:
+                    rejected.append((line_number, row, "كمية غير صحيحة"))
+                    continue
+                if not Validators.validate_number(paid) or float(paid) < 0:
+                    rejected.append((line_number, row, "مبلغ مدفوع غير صحيح"))
+                    continue
+                if not Validators.validate_date(row_date):
+                    rejected.append((line_number, row, "تاريخ غير صحيح (YYYY-MM-DD)"))
+                    continue
+                
+                if client_ref.isdigit() and int(client_ref) in client_ids:
+                    client_id = int(client_ref)
+                else:
+                    matches = ids_by_name.get(client_ref, [])
+                    if len(matches) != 1:
+                        reason = "عميل غير موجود" if not matches else "اسم العميل مكرر، استخدم المعرف"
+                        rejected.append((line_number, row, reason))
+                        continue
+                    client_id = matches[0]
+                
+                quantity_kg = float(quantity)
+                paid_amount = float(paid)
+                price_per_kg = self.prices.price_on(row_date)
+                total_amount = quantity_kg * price_per_kg
+                yield (
+                    client_id, row_date, quantity_kg, price_per_kg,
+                    total_amount, paid_amount, total_amount - paid_amount
+                )
+        
+        query = """INSERT INTO distributions 
+                   (client_id, distribution_date, quantity_kg, price_per_kg, 
+                    total_amount, paid_amount, remaining_amount) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?)"""
+        
+        if isinstance(csv_file, (str, os.PathLike)):
+            with open(csv_file, newline="", encoding="utf-8-sig") as f:
+                imported = self.db.execute_many(query, valid_rows(csv.reader(f)))
+        else:
+            imported = self.db.execute_many(query, valid_rows(csv.reader(csv_file)))
+        
+        return imported, rejected
+    
+    def import_distributions_lines(self, lines, distribution_date=None):
+        """استيراد من أسطر CSV (قائمة نصوص) كما ترسلها الواجهة البعيدة.
+        لا يقبل مسار ملف: الخادم لا يفتح ملفات باسم يرسله الطلب"""
+        if not isinstance(lines, list) or not all(isinstance(line, str) for line in lines):
+            raise TypeError("أسطر CSV يجب أن ترسل كقائمة نصوص")
+        return self.import_distributions_csv(lines, distribution_date)
+    
+    def get_daily_distributions(self, date=None):
+        """جلب التوزيعات اليومية"""
+        if date is None:
+            date = datetime.now().date()
+        
+        query = """
+            SELECT d.*, c.name as client_name 
+            FROM distributions d
+            JOIN clients c ON d.client_id = c.id
+            WHERE d.distribution_date = ?
+            ORDER BY d.id DESC
+        """
+        return self.db.fetch_all(query, (date,))
+    
+    def get_daily_distributions_page(self, date=None, before_id=None, limit=100):
+        """صفحة من التوزيعات اليومية (الأحدث أولاً) بعد المعرف before_id"""
+        if date is None:
+            date = datetime.now().date()
+        
+        query = """
+            SELECT d.*, c.name as client_name 
+            FROM distributions d
+            JOIN clients c ON d.client_id = c.id
+            WHERE d.distribution_date = ? {keyset}
+            ORDER BY d.id DESC
+            LIMIT ?
+        """
+        if before_id is None:
+            return self.db.fetch_all(query.format(keyset=""), (date, limit))
+        return self.db.fetch_all(
+            query.format(keyset="AND d.id < ?"), (date, before_id, limit)
+        )
+    
+    def get_client_distributions(self, client_id):
+        """جلب توزيعات عميل معين"""
+        query = f"""
+            SELECT * FROM {self.db.source("distributions")} 
+            WHERE client_id = ? 
+            ORDER BY distribution_date DESC
+        """
+        return self.db.fetch_all(query, (client_id,))
+    
+    def get_total_distributions(self, start_date, end_date):
+        """إجمالي التوزيعات في فترة محددة (من جدول الإجماليات اليومية)"""
+        query = f"""
+            SELECT 
+                c.name,
+                SUM(t.total_kg) as total_kg,
+                SUM(t.total_amount) as total_amount,
+                SUM(t.total_paid) as total_paid,
+                SUM(t.total_remaining) as total_remaining
+            FROM {self.db.source("daily_client_totals", start_date)} t
+            JOIN clients c ON t.client_id = c.id
+            WHERE t.day BETWEEN ? AND ?
+            GROUP BY t.client_id, c.name
+        """
+        return self.db.fetch_all(query, (start_date, end_date))
+    
+    def get_total_distributions_page(self, start_date, end_date, after=None, limit=100):
+        """صفحة من تقرير الفترة مرتبة باسم العميل
+        after: (الاسم، المعرف) لآخر عميل في الصفحة السابقة"""
+        query = """
+            SELECT 
+                c.id,
+                c.name,
+                SUM(t.total_kg) as total_kg,
+                SUM(t.total_amount) as total_amount,
+                SUM(t.total_paid) as total_paid,
+                SUM(t.total_remaining) as total_remaining
+            FROM {totals} t
+            JOIN clients c ON t.client_id = c.id
+            WHERE t.day BETWEEN ? AND ? {keyset}
+            GROUP BY t.client_id, c.name
+            ORDER BY c.name, c.id
+            LIMIT ?
+        """
+        totals = self.db.source("daily_client_totals", start_date)
+        if after is None:
+            return self.db.fetch_all(query.format(totals=totals, keyset=""),
+                                     (start_date, end_date, limit))
+        return self.db.fetch_all(
+            query.format(totals=totals, keyset="AND (c.name, c.id) > (?, ?)"),
+            (start_date, end_date, *after, limit)
+        )
+    
+    def dashboard_summary(self, date=None):
+        """ملخص لوحة التحكم باستعلام تجميعي واحد: عدد العملاء، إجماليات اليوم،
+        سعر اليوم والمستحقات. النتيجة محفوظة لمدة SUMMARY_TTL ما لم تتغير البيانات"""
+        day = str(date or datetime.now().date())
+        key = (day, self.db.data_version(*self.SUMMARY_TABLES))
+        cached = self._summary_cache
+        if cached and cached[0] == key and cached[1] > time.monotonic():
+            return cached[2]
+        
+        query = """
+            SELECT
+                (SELECT COUNT(*) FROM clients WHERE is_active = TRUE),
+                COALESCE(SUM(t.distribution_count), 0),
+                COALESCE(SUM(t.total_kg), 0),
+                COALESCE(SUM(t.total_amount), 0),
+                COALESCE(SUM(t.total_paid), 0),
+                COALESCE(SUM(t.total_remaining), 0),
+                (SELECT price_per_kg FROM product_prices
+                 WHERE price_date <= :day ORDER BY price_date DESC LIMIT 1),
+                (SELECT COALESCE(SUM(balance), 0)
+                 FROM client_balances INDEXED BY idx_client_balances_open
+                 WHERE balance > 0.005)
+            FROM daily_client_totals t
+            WHERE t.day = :day
+        """
+        row = self.db.fetch_one(query, {"day": day})
+        summary = {
+            "clients": row[0],
+            "distributions": row[1],
+            "total_kg": row[2],
+            "total_amount": row[3],
+            "total_paid": row[4],
+            "total_remaining": row[5],
+            "price": row[6] or 0.0,
+            "receivables": row[7],
+        }
+        self._summary_cache = (key, time.monotonic() + self.SUMMARY_TTL, summary)
+        return summary
+    
+    def get_distribution_totals(self, start_date, end_date):
+        """إجماليات الفترة: (الكمية، المبلغ، المدفوع، المتبقي)"""
+        query = f"""
+            SELECT 
+                COALESCE(SUM(total_kg), 0),
+                COALESCE(SUM(total_amount), 0),
+                COALESCE(SUM(total_paid), 0),
+                COALESCE(SUM(total_remaining), 0)
+            FROM {self.db.source("daily_client_totals", start_date)}
+            WHERE day BETWEEN ? AND ?
+        """
+        return self.db.fetch_one(query, (start_date, end_date))
+    
+    def verify_daily_totals(self, rebuild=False):
+        """مقارنة الإجماليات اليومية بالتوزيعات وإرجاع الأيام المختلفة (مع إعادة البناء اختيارياً)"""
+        query = """
+            WITH actual AS (
+                SELECT distribution_date as day, client_id,
+                       COUNT(*) as distribution_count,
+                       COALESCE(SUM(quantity_kg), 0) as total_kg,
+                       COALESCE(SUM(total_amount), 0) as total_amount,
+                       COALESCE(SUM(paid_amount), 0) as total_paid,
+                       COALESCE(SUM(remaining_amount), 0) as total_remaining
+                FROM distributions
+                GROUP BY distribution_date, client_id
+            ),
+            keys AS (
+                SELECT day, client_id FROM actual
+                UNION
+                SELECT day, client_id FROM daily_client_totals
+            )
+            SELECT k.day, k.client_id
+            FROM keys k
+            LEFT JOIN daily_client_totals t ON t.day = k.day AND t.client_id = k.client_id
+            LEFT JOIN actual a ON a.day = k.day AND a.client_id = k.client_id
+            WHERE COALESCE(t.distribution_count, 0) != COALESCE(a.distribution_count, 0)
+               OR ABS(COALESCE(t.total_kg, 0) - COALESCE(a.total_kg, 0)) > 0.005
+               OR ABS(COALESCE(t.total_amount, 0) - COALESCE(a.total_amount, 0)) > 0.005
+               OR ABS(COALESCE(t.total_paid, 0) - COALESCE(a.total_paid, 0)) > 0.005
+               OR ABS(COALESCE(t.total_remaining, 0) - COALESCE(a.total_remaining, 0)) > 0.005
+            ORDER BY k.day, k.client_id
+        """
+        drift = self.db.fetch_all(query)
+        if rebuild and drift:
+            self.db.execute_transaction([(q, ()) for q in Database.REBUILD_DAILY_TOTALS])
+        return drift
+
+class PaymentModel:
+    def __init__(self, db=None):
+        self.db = db or Database()
+    
+    # توزيع الدفعة على التوزيعات المفتوحة للعميل بترتيب الأقدم أولاً:
+    # المجموع التراكمي للمتبقي قبل كل توزيع يحدد الجزء الذي يغطيه المبلغ
+    ALLOCATE = """
+        INSERT INTO payment_allocations (payment_id, distribution_id, amount)
+        SELECT :payment_id, id, MIN(remaining_amount, :amount - covered_before)
+        FROM (
+            SELECT id, remaining_amount,
+                   SUM(remaining_amount) OVER (
+                       ORDER BY distribution_date, id ROWS UNBOUNDED PRECEDING
+                   ) - remaining_amount AS covered_before
+            FROM distributions INDEXED BY idx_distributions_open_fifo
+            WHERE client_id = :client_id AND remaining_amount > 0
+              AND (:distribution_id IS NULL OR id = :distribution_id)
+        )
+        WHERE covered_before < :amount - 0.005
+    """
+    APPLY_ALLOCATIONS = """
+        UPDATE distributions SET
+            paid_amount = COALESCE(paid_amount, 0) + a.amount,
+            remaining_amount = CASE WHEN remaining_amount - a.amount < 0.005
+                                    THEN 0 ELSE remaining_amount - a.amount END
+        FROM payment_allocations a
+        WHERE a.payment_id = ? AND distributions.id = a.distribution_id
+    """
+    ALLOCATIONS = """
+        SELECT a.distribution_id, d.distribution_date, a.amount, d.remaining_amount
+        FROM payment_allocations a JOIN distributions d ON d.id = a.distribution_id
+        WHERE a.payment_id = ?
+        ORDER BY d.distribution_date, d.id
+    """
+    
+    def add_payment(self, client_id, amount, payment_method, description, distribution_id=None):
+        """إضافة دفعة وتوزيعها على التوزيعات غير المسددة (الأقدم أولاً، أو على توزيع محدد)
+        في معاملة واحدة. يرجع {payment_id, allocations: [(التوزيع، التاريخ، المبلغ، المتبقي)], unallocated}"""
+        query = """INSERT INTO payments 
+                   (client_id, payment_date, amount, payment_method, description, distribution_id) 
+                   VALUES (?, ?, ?, ?, ?, ?)"""
+        
+        with self.db.transaction() as tx:
+            payment_id = tx.execute(query, (
+                client_id, datetime.now().date(), amount,
+                payment_method, description, distribution_id
+            )).lastrowid
+            tx.execute(self.ALLOCATE, {
+                "payment_id": payment_id, "client_id": client_id,
+                "amount": amount, "distribution_id": distribution_id,
+            })
+            tx.execute(self.APPLY_ALLOCATIONS, (payment_id,))
+            allocations = tx.fetch_all(self.ALLOCATIONS, (payment_id,))
+        
+        allocated = sum(row[2] for row in allocations)
+        return {
+            "payment_id": payment_id,
+            "allocations": allocations,
+            "unallocated": round(max(amount - allocated, 0), 2),
+        }
+    
+    def get_payment_allocations(self, payment_id):
+        """أسطر توزيع دفعة: (التوزيع، التاريخ، المبلغ، المتبقي حالياً)"""
+        return self.db.fetch_all(self.ALLOCATIONS, (payment_id,))
+    
+    def get_client_payments(self, client_id):
+        """جلب مدفوعات عميل معين"""
+        query = f"""
+            SELECT * FROM {self.db.source("payments")} 
+            WHERE client_id = ? 
+            ORDER BY payment_date DESC
+        """
+        return self.db.fetch_all(query, (client_id,))
+    
+    # أعمار المستحقات: المتبقي من كل توزيع مفتوح في شريحة حسب تاريخه مقارنة بحدود
+    # الشرائح (:d30, :d60, :d90)، في مرور واحد على فهرس مغطٍ للتوزيعات المفتوحة
+    # (المؤرشف مسدد بالكامل فلا يدخل)
+    AGING = """
+        WITH aging AS (
+            SELECT client_id,
+                   TOTAL(CASE WHEN distribution_date >= :d30 THEN remaining_amount END) AS days_0_30,
+                   TOTAL(CASE WHEN distribution_date < :d30 AND distribution_date >= :d60
+                              THEN remaining_amount END) AS days_31_60,
+                   TOTAL(CASE WHEN distribution_date < :d60 AND distribution_date >= :d90
+                              THEN remaining_amount END) AS days_61_90,
+                   TOTAL(CASE WHEN distribution_date < :d90 THEN remaining_amount END) AS days_over_90,
+                   TOTAL(remaining_amount) AS total,
+                   MIN(distribution_date) AS oldest_date
+            FROM distributions INDEXED BY idx_distributions_open_aging
+            WHERE remaining_amount > 0
+            GROUP BY client_id
+        )
+    """
+    
+    @staticmethod
+    def aging_params(as_of=None):
+        """حدود شرائح الأعمار (أول تاريخ في كل شريحة) بتاريخ as_of"""
+        as_of = as_of or datetime.now().date()
+        if isinstance(as_of, str):
+            as_of = datetime.strptime(as_of, "%Y-%m-%d").date()
+        return {f"d{days}": str(as_of - timedelta(days=days)) for days in (30, 60, 90)}
+    
+    # إجماليات الشرائح لكل العملاء مع كل صف (قبل تطبيق مؤشر الصفحة)
+    AGING_PAGE = AGING + """,
+        matrix AS (
+            SELECT aging.client_id, c.name, c.phone, days_0_30, days_31_60, days_61_90,
+                   days_over_90, total, oldest_date,
+                   COUNT(*) OVER () AS client_count,
+                   SUM(days_0_30) OVER () AS all_0_30,
+                   SUM(days_31_60) OVER () AS all_31_60,
+                   SUM(days_61_90) OVER () AS all_61_90,
+                   SUM(days_over_90) OVER () AS all_over_90,
+                   SUM(total) OVER () AS all_total
+            FROM aging JOIN clients c ON c.id = aging.client_id
+        )
+        SELECT * FROM matrix {keyset}
+        ORDER BY {column} {direction}, client_id {direction}
+        LIMIT :limit
+    """
+    # أعمدة الترتيب وموضعها في صف get_aging_page (لمؤشر الصفحة التالية)
+    AGING_SORTS = {"name": 1, "days_0_30": 3, "days_31_60": 4, "days_61_90": 5,
+                   "days_over_90": 6, "total": 7, "oldest_date": 8}
+    
+    def get_aging_page(self, sort="total", descending=True, after=None, limit=100, as_of=None):
+        """صفحة من تقرير أعمار المستحقات مرتبة حسب sort (أحد AGING_SORTS).
+        الصف: (العميل، الاسم، الهاتف، 0-30، 31-60، 61-90، أكثر من 90، الإجمالي، أقدم تاريخ،
+        عدد العملاء، ثم إجماليات الشرائح الخمس لكل العملاء).
+        after: (قيمة عمود الترتيب، المعرف) لآخر صف في الصفحة السابقة
+        (row[AGING_SORTS[sort]], row[0])"""
+        if sort not in self.AGING_SORTS:
+            raise ValueError(f"عمود ترتيب غير معروف: {sort}")
+        keyset = ""
+        params = dict(self.aging_params(as_of), limit=limit)
+        if after is not None:
+            keyset = f"WHERE ({sort}, client_id) {'<' if descending else '>'} (:after_value, :after_id)"
+            params["after_value"], params["after_id"] = after
+        query = self.AGING_PAGE.format(
+            keyset=keyset, column=sort, direction="DESC" if descending else "ASC"
+        )
+        return self.db.fetch_all(query, params)
+    
+    def get_pending_payments(self):
+        """جلب المدفوعات المستحقة"""
+        query = """
+            SELECT c.name, c.phone, b.balance as pending_amount
+            FROM client_balances b INDEXED BY idx_client_balances_open
+            JOIN clients c ON c.id = b.client_id
+            WHERE b.balance > 0.005
+        """
+        return self.db.fetch_all(query)
+
+class Validators:
+    @staticmethod
+    def validate_phone(phone):
+        """التحقق من صحة رقم الهاتف"""
+        if not phone:
+            return True
+        import re
+        pattern = r'^[\d\s\-\+\(\)]{8,}$'
+        return bool(re.match(pattern, phone))
+    
+    @staticmethod
+    def validate_number(value):
+        """التحقق من أن القيمة رقمية محدودة (بدون nan و inf)"""
+        try:
+            return math.isfinite(float(value))
+        except (TypeError, ValueError):
+            return False
+    
+    @staticmethod
+    def validate_required(value):
+        """التحقق من أن الحقل مطلوب"""
+        return bool(value and str(value).strip())
+    
+    @staticmethod
+    def validate_date(value):
+        """التحقق من صحة التاريخ بصيغة YYYY-MM-DD"""
+        try:
+            datetime.strptime(str(value), "%Y-%m-%d")
+            return True
+        except ValueError:
+            return False
@@ -0,0 +1,103 @@
+"""فحص خطط تنفيذ استعلامات النماذج (أداة تطوير، لا تستخدمها الواجهة)
+
+أمثلة:
+    python -m cli check-plans
+"""
+import contextlib
+import re
+from datetime import datetime, timedelta
+
+from models import Auth, ClientModel, DistributionModel, PaymentModel
+
+
+class QueryPlanError(Exception):
+    """استعلام يمسح جدولاً كاملاً بدون فهرس"""
+    pass
+
+
+@contextlib.contextmanager
+def capture_plans(db):
+    """تسجيل خطة تنفيذ كل استعلام قراءة يمر عبر db خلال الكتلة"""
+    plans = []
+    
+    def wrap(name):
+        method = getattr(db, name)
+        
+        def traced(query, params=(), *args, **kwargs):
+            plans.append((query, db.explain(query, params)))
+            return method(query, params, *args, **kwargs)
+        
+        return traced
+    
+    names = ("fetch_all", "fetch_one", "iter_batches")
+    for name in names:
+        setattr(db, name, wrap(name))
+    try:
+        yield plans
+    finally:
+        for name in names:
+            delattr(db, name)
+
+
+def full_scans(query, plan):
+    """خطوات SCAN بدون USING (مسح نتائج WITH والاستعلامات الفرعية مقبول)"""
+    derived = set(re.findall(r"(\w+) AS \(", query))
+    return [step for step in plan if step.startswith("SCAN ") and " USING " not in step
+            and not step.startswith("SCAN (subquery") and step.split()[1] not in derived]
+
+
+def check_query_plans(db):
+    """التأكد من أن كل استعلامات النماذج تستخدم فهرساً (بدون مسح كامل للجداول)"""
+    client_model = ClientModel(db)
+    distribution_model = DistributionModel(db)
+    payment_model = PaymentModel(db)
+    today = datetime.now().date()
+    
+    calls = [
+        ("Auth.login", lambda: Auth(db).login("admin", "")),
+        ("ClientModel.get_all_clients", client_model.get_all_clients),
+        ("ClientModel.get_client_by_id", lambda: client_model.get_client_by_id(1)),
+        ("ClientModel.get_client_balance", lambda: client_model.get_client_balance(1)),
+        ("ClientModel.get_clients_with_balances", client_model.get_clients_with_balances),
+        ("ClientModel.get_clients_page", lambda: client_model.get_clients_page(("", 0))),
+        ("ClientModel.get_client_with_balance", lambda: client_model.get_client_with_balance(1)),
+        ("ClientModel.get_client_statement",
+         lambda: client_model.get_client_statement(1, today - timedelta(days=90))),
+        ("ClientModel.get_client_statement (next page)",
+         lambda: client_model.get_client_statement(1, after=(str(today), 0, 1, 0.0))),
+        ("PriceCalendar.load", distribution_model.prices.load),
+        ("DistributionModel.get_daily_distributions", distribution_model.get_daily_distributions),
+        ("DistributionModel.get_daily_distributions_page",
+         lambda: distribution_model.get_daily_distributions_page(before_id=1000)),
+        ("DistributionModel.get_distribution_with_client",
+         lambda: distribution_model.get_distribution_with_client(1)),
+        ("DistributionModel.get_client_distributions",
+         lambda: distribution_model.get_client_distributions(1)),
+        ("DistributionModel.get_total_distributions",
+         lambda: distribution_model.get_total_distributions(today - timedelta(days=30), today)),
+        ("DistributionModel.get_total_distributions_page",
+         lambda: distribution_model.get_total_distributions_page(today - timedelta(days=30), today)),
+        ("DistributionModel.dashboard_summary", distribution_model.dashboard_summary),
+        ("DistributionModel.get_distribution_totals",
+         lambda: distribution_model.get_distribution_totals(today - timedelta(days=30), today)),
+        ("PaymentModel.get_client_payments", lambda: payment_model.get_client_payments(1)),
+        ("PaymentModel.get_payment_allocations", lambda: payment_model.get_payment_allocations(1)),
+        ("PaymentModel.get_pending_payments", payment_model.get_pending_payments),
+        ("PaymentModel.get_aging_page", lambda: payment_model.get_aging_page(after=(100.0, 1))),
+    ]
+    
+    failures = []
+    for name, call in calls:
+        with capture_plans(db) as plans:
+            call()
+        if not plans:
+            raise QueryPlanError(f"{name}: no query plan captured")
+        for query, plan in plans:
+            scans = full_scans(query, plan)
+            if scans:
+                failures.append((name, " ".join(query.split()), scans))
+    
+    if failures:
+        raise QueryPlanError("Full table scans:\n" + "\n".join(
+            f"  {name}: {scans} <- {query}" for name, query, scans in failures
+        ))
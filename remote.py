@@ -0,0 +1,240 @@
+"""الاتصال بخادم قاعدة البيانات (server.py) بنفس واجهة النماذج المحلية
+حتى تعمل الواجهة مع ملف محلي أو مع الخادم دون تغيير"""
+import contextlib
+import http.client
+import json
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit, urlencode
+
+from models import PriceCalendar
+
+
+class RemoteError(Exception):
+    """خطأ أرجعه الخادم أو تعذر الاتصال به"""
+
+    def __init__(self, message, kind=None):
+        super().__init__(message)
+        self.kind = kind
+
+
+def as_rows(value):
+    """JSON يعيد الصفوف قوائم؛ تحول إلى tuples كما ترجعها sqlite3"""
+    if isinstance(value, list):
+        if value and not isinstance(value[0], list):
+            return tuple(value)
+        return [as_rows(item) for item in value]
+    if isinstance(value, dict):
+        return {key: as_rows(item) for key, item in value.items()}
+    return value
+
+
+class RemoteConnection:
+    """اتصال HTTP دائم لكل خيط مع إعادة المحاولة مرة عند انقطاعه"""
+
+    def __init__(self, url, token=None, timeout=30):
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 8765
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["X-Auth-Token"] = token
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def open(self, method, path, payload=None):
+        """إرسال طلب وإرجاع الاستجابة (يعاد الطلب مرة إذا أغلق الخادم الاتصال الخامل)"""
+        body = json.dumps(payload, default=str).encode("utf-8") if payload is not None else None
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body, self.headers)
+                return conn.getresponse()
+            except (ConnectionError, http.client.HTTPException) as e:
+                self.close()
+                if attempt == 2:
+                    raise RemoteError(f"تعذر الاتصال بالخادم {self.host}:{self.port}: {e}") from e
+            except OSError as e:
+                self.close()
+                raise RemoteError(f"تعذر الاتصال بالخادم {self.host}:{self.port}: {e}") from e
+
+    def request(self, method, path, payload=None):
+        response = self.open(method, path, payload)
+        data = json.loads(response.read() or b"{}")
+        if response.status != 200:
+            raise RemoteError(data.get("error", response.reason), data.get("type"))
+        return data
+
+
+class RemoteDatabase:
+    """بديل Database يتصل بالخادم: يوفر ما تحتاجه الواجهة فقط
+    (أرقام تغير الجداول وتصدير التقارير)، والاستعلامات نفسها تنفذ على الخادم"""
+    is_remote = True
+    stats = None
+
+    def __init__(self, url, token=None):
+        self.url = url
+        self.connection = RemoteConnection(url, token)
+
+    def table_versions(self):
+        return self.connection.request("GET", "/versions")["versions"]
+
+    def data_version(self, *tables):
+        """رقم يتغير كلما عدل أي جهاز أحد الجداول المحددة
+        (None إذا تعذر الاتصال فتعاد قراءة الشاشة وتظهر الخطأ)"""
+        try:
+            versions = self.table_versions()
+        except RemoteError:
+            return None
+        return sum(versions.get(table, 0) for table in tables)
+
+    def login(self, username, password):
+        """تسجيل الدخول في الخادم؛ الجلسة ترسل مع كل طلب بعده. يرجع بيانات المستخدم أو None"""
+        data = self.connection.request("POST", "/login", {"username": username, "password": password})
+        if data.get("session"):
+            self.connection.headers["X-Session"] = data["session"]
+        return as_rows(data.get("user"))
+
+    def call(self, model, method, *args, **kwargs):
+        payload = {"model": model, "method": method, "args": args, "kwargs": kwargs}
+        return as_rows(self.connection.request("POST", "/call", payload)["result"])
+
+    def report_batches(self, kind, start=None, end=None, client_id=None):
+        """(العناوين، عدد الصفوف، مولد الدفعات) لتقرير يقرأ من الخادم كتدفق"""
+        query = {key: value for key, value in
+                 (("kind", kind), ("start", start), ("end", end), ("client_id", client_id))
+                 if value is not None}
+        # اتصال مستقل حتى لا يشغل التدفق اتصال الخيط
+        connection = RemoteConnection(self.url)
+        connection.headers = self.connection.headers
+        response = connection.open("GET", "/export?" + urlencode(query))
+        if response.status != 200:
+            data = json.loads(response.read() or b"{}")
+            connection.close()
+            raise ValueError(data.get("error", response.reason))
+        first = json.loads(response.readline())
+
+        def batches():
+            try:
+                for line in response:
+                    batch = json.loads(line)
+                    if isinstance(batch, dict):
+                        raise RemoteError(batch.get("error"))
+                    yield [tuple(row) for row in batch]
+            finally:
+                connection.close()
+
+        return first["header"], first["total"], batches()
+
+    @contextlib.contextmanager
+    def tag(self, name):
+        yield
+
+    def release_connection(self):
+        self.connection.close()
+
+    def close(self):
+        self.connection.close()
+
+
+class RemoteModel:
+    """يحول استدعاءات النموذج إلى طلبات للخادم"""
+    name = None
+
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            return self.db.call(self.name, method, *args, **kwargs)
+        call.__name__ = method
+        return call
+
+
+class RemoteClientModel(RemoteModel):
+    name = "ClientModel"
+
+
+class RemotePaymentModel(RemoteModel):
+    name = "PaymentModel"
+
+
+class RemoteDistributionModel(RemoteModel):
+    """الأسعار تحمل مرة واحدة في تقويم محلي فتحسب إجماليات النماذج دون طلب للخادم"""
+    name = "DistributionModel"
+
+    def __init__(self, db):
+        super().__init__(db)
+        self.prices = PriceCalendar(db)
+
+    def load_prices(self):
+        self.prices.load(self.get_price_history())
+
+    def get_today_price(self):
+        return self.get_price_on(datetime.now().date())
+
+    def get_price_on(self, date):
+        if self.prices._dates is None:
+            self.load_prices()
+        return self.prices.price_on(date)
+
+    def set_price(self, price, price_date=None):
+        price_date = str(price_date or datetime.now().date())
+        self.db.call(self.name, "set_price", price, price_date)
+        self.prices.set_price(price_date, price)
+
+    def set_today_price(self, price):
+        self.set_price(price)
+
+    def import_distributions_csv(self, csv_file, distribution_date=None):
+        """الملف يقرأ هنا ويرسل محتواه؛ التحقق والإدخال على الخادم"""
+        if hasattr(csv_file, "read"):
+            lines = csv_file.read().splitlines()
+        else:
+            with open(csv_file, newline="", encoding="utf-8-sig") as f:
+                lines = f.read().splitlines()
+        imported, rejected = self.db.call(self.name, "import_distributions_lines", lines,
+                                          distribution_date and str(distribution_date))
+        return imported, [tuple(item) for item in rejected]
+
+
+class RemoteAuth:
+    """تسجيل الدخول عبر الخادم؛ تحفظ بيانات الدخول لتغيير كلمة المرور لاحقاً"""
+
+    def __init__(self, db):
+        self.db = db
+        self.current_user = None
+        self._credentials = None
+
+    def login(self, username, password):
+        user = self.db.login(username, password)
+        if user:
+            self.current_user = user
+            self._credentials = (username, password)
+            return True
+        return False
+
+    def change_password(self, new_password):
+        if not self.current_user:
+            return False
+        username, password = self._credentials
+        if self.db.call("Auth", "update_password", username, password, new_password):
+            self._credentials = (username, new_password)
+            return True
+        return False
@@ -0,0 +1,371 @@
+"""خادم HTTP/JSON محلي حتى تتشارك عدة محطات إدخال قاعدة بيانات واحدة
+
+الخادم وحده يفتح distribution.db:
+- كل الكتابات تمر عبر مهمة كتابة واحدة تجمع الطلبات المنتظرة في معاملة واحدة
+- القراءات تنفذ بالتوازي في مجموعة خيوط، لكل خيط اتصاله (لقطة WAL مستقلة)
+
+    python -m server --db distribution.db --host 0.0.0.0 --port 8765
+    python khalid.py --server http://192.168.1.10:8765
+
+الواجهة (كل الطلبات عدا /login و /health تحتاج جلسة X-Session من /login):
+    POST /login     {"username": ..., "password": ...} -> {"user": ..., "session": ...}
+    POST /call      {"model": "ClientModel", "method": "add_client", "args": [...], "kwargs": {...}}
+    GET  /versions  عدادات التغيير لكل جدول (لتحديث الشاشات)
+    GET  /export?kind=period&start=...&end=...&client_id=...   صفوف التقرير كتدفق JSON
+    GET  /health
+"""
+import argparse
+import asyncio
+import json
+import queue
+import secrets
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+from models import Database, Auth, ClientModel, DistributionModel, PaymentModel
+
+# العمليات المتاحة عبر الخادم: {النموذج: {الدالة: هل تكتب}}
+API = {
+    # التحقق من كلمة المرور عبر /login (يصدر الجلسة)
+    "Auth": {
+        "update_password": True,
+    },
+    "ClientModel": {
+        "add_client": True,
+        "update_client": True,
+        "delete_client": True,
+        "get_all_clients": False,
+        "get_client_by_id": False,
+        "load_search_index": False,
+        "search_clients": False,
+        "get_client_balance": False,
+        "get_clients_with_balances": False,
+        "get_client_with_balance": False,
+        "get_clients_page": False,
+        "get_opening_balance": False,
+        "get_client_statement": False,
+        "verify_balances": True,
+    },
+    "DistributionModel": {
+        "set_today_price": True,
+        "set_price": True,
+        "get_price_history": False,
+        "load_prices": False,
+        "get_today_price": False,
+        "get_price_on": False,
+        "add_distribution": True,
+        "delete_distribution": True,
+        # أسطر CSV فقط (import_distributions_csv يقبل مسار ملف على الخادم)
+        "import_distributions_lines": True,
+        "get_distribution_with_client": False,
+        "get_daily_distributions": False,
+        "get_daily_distributions_page": False,
+        "get_client_distributions": False,
+        "dashboard_summary": False,
+        "get_total_distributions": False,
+        "get_total_distributions_page": False,
+        "get_distribution_totals": False,
+        "verify_daily_totals": True,
+    },
+    "PaymentModel": {
+        "add_payment": True,
+        "get_payment_allocations": False,
+        "get_client_payments": False,
+        "get_pending_payments": False,
+        "get_aging_page": False,
+    },
+}
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+           413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error"}
+MAX_BODY = 10 * 1024 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class WriteRequest:
+    """طلب كتابة ينتظر دوره في مهمة الكتابة"""
+
+    def __init__(self, fn, args, kwargs, future):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.result = None
+        self.error = None
+
+
+class ModelServer:
+    def __init__(self, db_path="distribution.db", host="127.0.0.1", port=8765,
+                 readers=4, max_batch=100, token=None):
+        self.db = Database(db_path)
+        self.host = host
+        self.port = port
+        self.token = token
+        self.max_batch = max_batch
+        self.models = {
+            "Auth": Auth(self.db),
+            "ClientModel": ClientModel(self.db),
+            "DistributionModel": DistributionModel(self.db),
+            "PaymentModel": PaymentModel(self.db),
+        }
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix="db-reader")
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="db-writer")
+        # جلسات المستخدمين الذين سجلوا الدخول (تنتهي بإيقاف الخادم)
+        self._sessions = set()
+        self._writes = None
+        self._server = None
+        self._writer_task = None
+
+    async def start(self):
+        self._writes = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._write_loop())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # المنفذ الفعلي (عند استخدام المنفذ 0 في الاختبارات)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        self.db.close()
+
+    # ---- الكتابة: مهمة واحدة تجمع الطلبات المنتظرة ----
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._writes.get()]
+            while len(batch) < self.max_batch and not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+            await loop.run_in_executor(self._writer, self._run_writes, batch)
+            for request in batch:
+                if request.future.cancelled():
+                    continue
+                if request.error is not None:
+                    request.future.set_exception(request.error)
+                else:
+                    request.future.set_result(request.result)
+
+    def _run_writes(self, batch):
+        """تنفيذ دفعة كتابات في معاملة واحدة، كل طلب في نقطة حفظ خاصة به"""
+        try:
+            with self.db.transaction():
+                for request in batch:
+                    try:
+                        with self.db.transaction():
+                            request.result = request.fn(*request.args, **request.kwargs)
+                    except Exception as e:
+                        request.error = e
+        except Exception as e:
+            for request in batch:
+                request.error = request.error or e
+
+    async def call(self, model, method, args=(), kwargs=None):
+        """تنفيذ عملية من API: الكتابات عبر مهمة الكتابة والقراءات في خيوط القراءة"""
+        writes = API.get(model, {}).get(method)
+        if writes is None:
+            raise HttpError(404, f"unknown operation {model}.{method}")
+        fn = getattr(self.models[model], method)
+        kwargs = kwargs or {}
+        loop = asyncio.get_running_loop()
+        if writes:
+            future = loop.create_future()
+            await self._writes.put(WriteRequest(fn, args, kwargs, future))
+            return await future
+        return await loop.run_in_executor(self._readers, lambda: fn(*args, **kwargs))
+
+    # ---- HTTP ----
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    # بقية الطلب غير مقروءة فيغلق الاتصال بعد الرد
+                    self._send_json(writer, e.status, {"error": str(e), "type": "HttpError"}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    if self.token and headers.get("x-auth-token") != self.token:
+                        raise HttpError(401, "invalid token")
+                    path = urlsplit(target).path
+                    if path not in ("/login", "/health") and headers.get("x-session") not in self._sessions:
+                        raise HttpError(401, "login required")
+                    if method == "GET" and path == "/export":
+                        await self._stream_export(writer, dict(parse_qsl(urlsplit(target).query)))
+                        continue
+                    status, payload = 200, await self._dispatch(method, path, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e), "type": "HttpError"}
+                except Exception as e:
+                    status, payload = 422, {"error": str(e), "type": type(e).__name__}
+                self._send_json(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise ConnectionError("bad request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            # يقرأ الجسم ويهمل على أجزاء حتى يصل الرد إلى العميل (لا يقطع الاتصال أثناء إرساله)
+            while length > 0:
+                length -= len(await reader.readexactly(min(length, 64 * 1024)))
+            raise HttpError(413, "body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    def _json(body):
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            raise HttpError(400, "invalid JSON")
+
+    async def login(self, username, password):
+        """التحقق من المستخدم وإصدار جلسة ترسل مع الطلبات التالية"""
+        loop = asyncio.get_running_loop()
+        user = await loop.run_in_executor(self._readers, self.models["Auth"].authenticate,
+                                          username, password)
+        if not user:
+            return {"user": None}
+        session = secrets.token_urlsafe(24)
+        self._sessions.add(session)
+        return {"user": user, "session": session}
+
+    async def _dispatch(self, method, path, body):
+        if method == "POST" and path == "/login":
+            request = self._json(body)
+            return await self.login(request.get("username"), request.get("password"))
+        if method == "POST" and path == "/call":
+            request = self._json(body)
+            result = await self.call(request.get("model"), request.get("method"),
+                                     request.get("args") or (), request.get("kwargs"))
+            return {"result": result}
+        if method == "GET" and path == "/versions":
+            return {"versions": self.db.table_versions()}
+        if method == "GET" and path == "/health":
+            return {"status": "ok"}
+        raise HttpError(404, f"no route {method} {path}")
+
+    @staticmethod
+    def _send_json(writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+        )
+
+    async def _stream_export(self, writer, params):
+        """صفوف تقرير كتدفق: السطر الأول {header, total} ثم دفعة JSON في كل سطر"""
+        from export import report_batches
+
+        batches = queue.Queue(maxsize=4)
+        done = object()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                header, total, rows = report_batches(
+                    self.db, params.get("kind"), params.get("start"), params.get("end"),
+                    int(params["client_id"]) if params.get("client_id") else None
+                )
+                batches.put({"header": header, "total": total})
+                for batch in rows:
+                    if cancelled.is_set():
+                        break
+                    batches.put(batch)
+            except Exception as e:
+                batches.put(e)
+            finally:
+                self.db.release_connection()
+                batches.put(done)
+
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=produce, name="db-export", daemon=True).start()
+        first = await loop.run_in_executor(None, batches.get)
+        if isinstance(first, Exception) or first is done:
+            self._send_json(writer, 422, {"error": str(first), "type": type(first).__name__})
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson; charset=utf-8\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n")
+        item = first
+        try:
+            while item is not done:
+                if isinstance(item, Exception):
+                    item = {"error": str(item)}
+                chunk = (json.dumps(item, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+                writer.write(f"{len(chunk):X}\r\n".encode("latin-1") + chunk + b"\r\n")
+                await writer.drain()
+                item = await loop.run_in_executor(None, batches.get)
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            cancelled.set()
+            # تفريغ الطابور حتى ينتهي خيط القراءة
+            while item is not done:
+                item = await loop.run_in_executor(None, batches.get)
+            raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m server", description="خادم قاعدة بيانات التوزيع")
+    parser.add_argument("--db", default="distribution.db")
+    parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 للسماح لأجهزة الشبكة المحلية")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--readers", type=int, default=4, help="عدد خيوط القراءة")
+    parser.add_argument("--token", help="رمز مشترك يجب إرساله في X-Auth-Token")
+    args = parser.parse_args(argv)
+
+    server = ModelServer(args.db, args.host, args.port, args.readers, token=args.token)
+    print(f"serving {args.db} on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,349 @@
+"""مزامنة التغييرات بين قاعدتي بيانات (جهاز ميداني يعمل دون اتصال وقاعدة المستودع)
+
+كل تعديل على الجداول المتزامنة يسجل في sync_journal عبر المشغلات، فترسل المزامنة
+الصفوف التي تغيرت منذ آخر مزامنة مع الجهاز الآخر فقط (لا الملف كاملاً).
+
+- لكل صف معرف ثابت بين الأجهزة: "معرف الجهاز:المعرف المحلي" للصفوف المنشأة محلياً،
+  والصفوف القادمة من جهاز آخر تحفظ معرفاتها في sync_keys وتأخذ معرفاً محلياً جديداً
+  (فلا تتصادم المعرفات بين الأجهزة)
+- المفاتيح الأجنبية ترسل كمعرفات ثابتة وتترجم عند الاستقبال
+- كل دفعة تطبق في معاملة واحدة مع حفظ العلامة (آخر تغيير مستلم من الجهاز)
+- عند تعديل نفس الصف على الجهازين يعتمد الجهاز الذي يرسل أولاً ويسجل التعارض
+- بعد كل إرسال تحذف من السجل القيود التي وصلت إلى كل الأجهزة المعروفة؛ الجهاز الجديد
+  (أو المتأخر عن آخر تقليم) يستلم كل الصفوف الحالية
+- المدفوع والمتبقي في التوزيعات لا يرسلان كقيم مطلقة: يرسل المدفوع عند التسليم فقط،
+  ويعاد الحساب عند الاستقبال من أسطر توزيع الدفعات المدمجة (فلا تضيع دفعتان على
+  نفس التوزيع سجلتا على جهازين دون اتصال)
+
+    python -m cli --db driver.db sync depot.db
+"""
+import gzip
+import json
+
+# الجداول بترتيب التطبيق (المرجع قبل من يشير إليه):
+# (الجدول، الأعمدة، المفاتيح الأجنبية {العمود: الجدول}، المفتاح الطبيعي)
+TABLES = (
+    ("clients", ("name", "address", "phone", "created_date", "is_active"), {}, None),
+    ("product_prices", ("price_date", "price_per_kg"), {}, "price_date"),
+    ("distributions",
+     ("client_id", "distribution_date", "quantity_kg", "price_per_kg",
+      "total_amount", "paid_amount"),
+     {"client_id": "clients"}, None),
+    ("payments",
+     ("client_id", "payment_date", "amount", "payment_method", "description", "distribution_id"),
+     {"client_id": "clients", "distribution_id": "distributions"}, None),
+)
+
+
+# أعمدة ترسل بقيمة مشتقة: paid_amount للتوزيع هو المدفوع عند التسليم (بدون الدفعات)
+SENT_AS = {
+    ("distributions", "paid_amount"):
+        "ROUND(COALESCE({t}.paid_amount, 0) - (SELECT TOTAL(amount) FROM payment_allocations"
+        " WHERE distribution_id = {t}.id), 2)",
+}
+
+# المدفوع والمتبقي لتوزيع = المدفوع عند التسليم + أسطر الدفعات الموزعة عليه
+RECOMPUTE_PAID = """
+    UPDATE distributions SET
+        paid_amount = ROUND(:paid + allocated, 2),
+        remaining_amount = CASE WHEN COALESCE(total_amount, 0) - :paid - allocated < 0.005 THEN 0
+                                ELSE ROUND(COALESCE(total_amount, 0) - :paid - allocated, 2) END
+    FROM (SELECT TOTAL(amount) AS allocated FROM payment_allocations WHERE distribution_id = :id)
+    WHERE id = :id
+    RETURNING COALESCE(total_amount, 0) - paid_amount
+"""
+
+
+def column_sql(table, column, alias):
+    """قيمة العمود كما ترسل في المزامنة"""
+    return SENT_AS.get((table, column), "{t}." + column).format(t=alias)
+
+
+def uid_sql(alias, row_id):
+    """تعبير SQL للمعرف الثابت لصف (alias: ربط sync_keys الخاص به)"""
+    return f"COALESCE({alias}.uid, :device || ':' || {row_id})"
+
+
+def changes_query(table, columns, foreign_keys, full=False):
+    """أحدث حالة لكل صف تغير في النطاق (الصفوف المحذوفة تظهر بأعمدة NULL)؛
+    full: كل صفوف الجدول أيضاً (لجهاز لم يستلم ما حذف من السجل)"""
+    selected = ", ".join(
+        uid_sql(f"k_{column}", f"t.{column}") if column in foreign_keys else column_sql(table, column, "t")
+        for column in columns
+    )
+    joins = "".join(
+        f" LEFT JOIN sync_keys k_{column} ON k_{column}.tbl = '{target}'"
+        f" AND k_{column}.row_id = t.{column}"
+        for column, target in foreign_keys.items()
+    )
+    journal = f"""
+        SELECT row_id, seq FROM sync_journal
+        WHERE seq > :since AND seq <= :until AND tbl = '{table}'
+          AND (origin IS NULL OR origin != :peer)
+    """
+    if full:
+        journal = f"SELECT id AS row_id, 0 AS seq FROM {table} UNION ALL {journal}"
+    return f"""
+        SELECT {uid_sql("k", "j.row_id")}, t.id IS NOT NULL, {selected}
+        FROM (SELECT row_id, MAX(seq) AS seq FROM ({journal}) GROUP BY row_id) j
+        LEFT JOIN {table} t ON t.id = j.row_id
+        LEFT JOIN sync_keys k ON k.tbl = '{table}' AND k.row_id = j.row_id{joins}
+        ORDER BY j.seq, j.row_id
+    """
+
+
+ALLOCATIONS = f"""
+    SELECT {uid_sql("k", "a.distribution_id")}, a.amount
+    FROM payment_allocations a
+    LEFT JOIN sync_keys k ON k.tbl = 'distributions' AND k.row_id = a.distribution_id
+    WHERE a.payment_id = :payment_id
+"""
+
+
+class DeltaSync:
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def device_id(self):
+        return self.db.fetch_one("SELECT value FROM sync_meta WHERE key = 'device_id'")[0]
+
+    def reset_device_id(self):
+        """معرف جهاز جديد لنسخة منسوخة من قاعدة أخرى؛ معرفات الصفوف الحالية تثبت أولاً
+        حتى لا تعتبر صفوفاً جديدة"""
+        old = self.device_id
+        with self.db.transaction() as tx:
+            for table, _, _, _ in TABLES:
+                tx.execute(f"""
+                    INSERT OR IGNORE INTO sync_keys (tbl, uid, row_id)
+                    SELECT '{table}', ? || ':' || id, id FROM {table}
+                """, (old,))
+            tx.execute("UPDATE sync_meta SET value = lower(hex(randomblob(8))) WHERE key = 'device_id'")
+        return self.device_id
+
+    def watermark(self, peer):
+        """آخر تغيير استلم من الجهاز peer (ترسل التغييرات بعده فقط)"""
+        row = self.db.fetch_one("SELECT received_seq FROM sync_peers WHERE peer = ?", (peer,))
+        return row[0] if row else 0
+
+    def changes(self, peer, since=0):
+        """التغييرات منذ since لإرسالها إلى الجهاز peer (قاموس قابل للتحويل إلى JSON)"""
+        device = self.device_id
+        until = self.db.fetch_one("SELECT COALESCE(MAX(seq), 0) FROM sync_journal")[0]
+        params = {"device": device, "peer": peer, "since": since, "until": until}
+        # جهاز جديد (أو متأخر عن آخر تقليم للسجل): ترسل كل الصفوف الحالية
+        full = since < self.pruned_seq()
+        tables = {}
+        for table, columns, foreign_keys, _ in TABLES:
+            rows, deleted = [], []
+            for row in self.db.fetch_all(changes_query(table, columns, foreign_keys, full), params):
+                if row[1]:
+                    rows.append([row[0]] + list(row[2:]))
+                else:
+                    deleted.append(row[0])
+            if rows or deleted:
+                tables[table] = {"rows": rows, "deleted": deleted}
+        if tables.get("payments"):
+            self._attach_allocations(tables["payments"], device)
+        return {"origin": device, "seq": until, "tables": tables}
+
+    def _attach_allocations(self, payments, device):
+        """أسطر توزيع كل دفعة (بمعرفات التوزيعات الثابتة) في آخر عمود"""
+        for row in payments["rows"]:
+            payment_id = self._local_id("payments", row[0], device)
+            row.append(self.db.fetch_all(ALLOCATIONS, {"device": device, "payment_id": payment_id}))
+
+    def _local_id(self, table, uid, device, tx=None):
+        """المعرف المحلي لمعرف ثابت (None إذا لم يصل الصف بعد)"""
+        origin, _, row_id = uid.rpartition(":")
+        if origin == device:
+            return int(row_id)
+        row = (tx or self.db).fetch_one(
+            "SELECT row_id FROM sync_keys WHERE tbl = ? AND uid = ?", (table, uid)
+        )
+        return row[0] if row else None
+
+    def apply(self, changes):
+        """تطبيق دفعة تغييرات من جهاز آخر في معاملة واحدة.
+        يرجع {applied, deleted, conflicts: [(الجدول، المعرف الثابت)], seq}"""
+        peer, device = changes["origin"], self.device_id
+        if peer == device:
+            raise ValueError("للقاعدتين نفس معرف الجهاز (نسخة منسوخة)؛ "
+                             "يلزم معرف جهاز جديد (reset_device_id أو sync --new-device)")
+        applied = deleted = 0
+        conflicts = []
+        # المدفوع عند التسليم لكل توزيع تغيرت دفعاته أو وصل من الجهاز الآخر
+        delivery_paid = {}
+        with self.db.transaction() as tx:
+            before = tx.fetch_one("SELECT COALESCE(MAX(seq), 0) FROM sync_journal")[0]
+            sent = tx.fetch_one("SELECT sent_seq FROM sync_peers WHERE peer = ?", (peer,))
+            sent = sent[0] if sent else 0
+
+            for table, columns, foreign_keys, natural_key in TABLES:
+                for row in changes["tables"].get(table, {}).get("rows", ()):
+                    uid, values = row[0], dict(zip(columns, row[1:]))
+                    for column, target in foreign_keys.items():
+                        if values[column] is not None:
+                            values[column] = self._resolve(target, values[column], device, tx)
+                    row_id = self._local_id(table, uid, device, tx)
+                    if row_id is None and natural_key:
+                        existing = tx.fetch_one(f"SELECT id FROM {table} WHERE {natural_key} = ?",
+                                                (values[natural_key],))
+                        row_id = existing and existing[0]
+                    current = row_id is not None and tx.fetch_one(
+                        f"SELECT {', '.join(column_sql(table, column, table) for column in columns)} "
+                        f"FROM {table} WHERE id = ?", (row_id,))
+                    if current and list(current) == [values[column] for column in columns]:
+                        pass  # وصل الصف نفسه (مثل أول مزامنة لنسخة منسوخة)
+                    else:
+                        if current and self._changed_since(tx, table, row_id, sent, peer):
+                            conflicts.append((table, uid))
+                        row_id = self._upsert(tx, table, columns, row_id, values)
+                    if uid.rpartition(":")[0] != device:
+                        tx.execute("INSERT OR IGNORE INTO sync_keys (tbl, uid, row_id) VALUES (?, ?, ?)",
+                                   (table, uid, row_id))
+                    if table == "distributions":
+                        delivery_paid[row_id] = values["paid_amount"] or 0
+                    if table == "payments":
+                        self._apply_allocations(tx, row_id, row[len(columns) + 1], device, delivery_paid)
+                    applied += 1
+
+            for table, _, _, _ in reversed(TABLES):
+                for uid in changes["tables"].get(table, {}).get("deleted", ()):
+                    row_id = self._local_id(table, uid, device, tx)
+                    if row_id is None:
+                        continue
+                    if table == "distributions":
+                        tx.execute("UPDATE payments SET distribution_id = NULL WHERE distribution_id = ?",
+                                   (row_id,))
+                    if table == "payments":
+                        # أسطر توزيع الدفعة تحذف معها (ON DELETE CASCADE)
+                        self._keep_delivery_paid(tx, self._allocated_distributions(tx, row_id), delivery_paid)
+                    deleted += tx.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,)).rowcount
+
+            for row_id, paid in delivery_paid.items():
+                unpaid = tx.fetch_one(RECOMPUTE_PAID, {"id": row_id, "paid": paid})
+                if unpaid and unpaid[0] < -0.005:
+                    # دفعات الجهازين معاً تتجاوز مبلغ التوزيع
+                    conflicts.append(("distributions", self._uid(tx, "distributions", row_id, device)))
+
+            # التغييرات المطبقة لا تعاد إلى الجهاز الذي أرسلها
+            tx.execute("UPDATE sync_journal SET origin = ? WHERE seq > ?", (peer, before))
+            tx.execute("""
+                INSERT INTO sync_peers (peer, received_seq) VALUES (?, ?)
+                ON CONFLICT(peer) DO UPDATE SET received_seq = MAX(received_seq, excluded.received_seq)
+            """, (peer, changes["seq"]))
+        return {"applied": applied, "deleted": deleted, "conflicts": conflicts, "seq": changes["seq"]}
+
+    def _resolve(self, table, uid, device, tx):
+        row_id = self._local_id(table, uid, device, tx)
+        if row_id is None:
+            raise ValueError(f"مرجع غير معروف في المزامنة: {table} {uid}")
+        return row_id
+
+    @staticmethod
+    def _changed_since(tx, table, row_id, sent, peer):
+        """هل عدل الصف محلياً بعد آخر إرسال إلى الجهاز peer"""
+        return tx.fetch_one("""
+            SELECT 1 FROM sync_journal
+            WHERE seq > ? AND tbl = ? AND row_id = ? AND (origin IS NULL OR origin != ?)
+            LIMIT 1
+        """, (sent, table, row_id, peer)) is not None
+
+    @staticmethod
+    def _upsert(tx, table, columns, row_id, values):
+        names = ", ".join(columns)
+        placeholders = ", ".join("?" * len(columns))
+        params = [values[column] for column in columns]
+        if row_id is None:
+            return tx.execute(f"INSERT INTO {table} ({names}) VALUES ({placeholders})", params).lastrowid
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns)
+        tx.execute(f"""
+            INSERT INTO {table} (id, {names}) VALUES (?, {placeholders})
+            ON CONFLICT(id) DO UPDATE SET {updates}
+        """, [row_id] + params)
+        return row_id
+
+    def _apply_allocations(self, tx, payment_id, allocations, device, delivery_paid):
+        """استبدال أسطر توزيع الدفعة بأسطر الجهاز الآخر؛ المدفوع في التوزيعات المتأثرة
+        يعاد حسابه في آخر apply"""
+        lines = [(payment_id, amount, self._local_id("distributions", uid, device, tx))
+                 for uid, amount in allocations]
+        touched = self._allocated_distributions(tx, payment_id) + [line[2] for line in lines if line[2]]
+        self._keep_delivery_paid(tx, touched, delivery_paid)
+        tx.execute("DELETE FROM payment_allocations WHERE payment_id = ?", (payment_id,))
+        # التوزيعات المحذوفة هنا تتجاهل أسطرها
+        tx.execute_many(
+            """INSERT INTO payment_allocations (payment_id, distribution_id, amount)
+               SELECT ?, id, ? FROM distributions WHERE id = ?""",
+            lines
+        )
+
+    @staticmethod
+    def _allocated_distributions(tx, payment_id):
+        return [row[0] for row in tx.fetch_all(
+            "SELECT distribution_id FROM payment_allocations WHERE payment_id = ?", (payment_id,))]
+
+    @staticmethod
+    def _keep_delivery_paid(tx, distribution_ids, delivery_paid):
+        """حفظ المدفوع عند التسليم قبل أول تعديل على أسطر الدفعات لكل توزيع"""
+        for distribution_id in distribution_ids:
+            if distribution_id not in delivery_paid:
+                row = tx.fetch_one(
+                    f"SELECT {column_sql('distributions', 'paid_amount', 'distributions')} "
+                    "FROM distributions WHERE id = ?", (distribution_id,))
+                if row:
+                    delivery_paid[distribution_id] = row[0]
+
+    @staticmethod
+    def _uid(tx, table, row_id, device):
+        row = tx.fetch_one("SELECT uid FROM sync_keys WHERE tbl = ? AND row_id = ?", (table, row_id))
+        return row[0] if row else f"{device}:{row_id}"
+
+    def mark_sent(self, peer, seq):
+        """تسجيل آخر تغيير وصل إلى الجهاز peer (لاكتشاف التعارضات)"""
+        self.db.execute_query("""
+            INSERT INTO sync_peers (peer, sent_seq) VALUES (?, ?)
+            ON CONFLICT(peer) DO UPDATE SET sent_seq = MAX(sent_seq, excluded.sent_seq)
+        """, (peer, seq))
+
+    def pruned_seq(self):
+        """آخر تغيير حذف من السجل (0: لم يقلم)"""
+        row = self.db.fetch_one("SELECT value FROM sync_meta WHERE key = 'pruned_seq'")
+        return int(row[0]) if row else 0
+
+    def prune_journal(self):
+        """حذف قيود السجل التي وصلت إلى كل الأجهزة المعروفة (لا تلزم للإرسال ولا لاكتشاف
+        التعارضات). يرجع عدد القيود المحذوفة"""
+        with self.db.transaction() as tx:
+            seq = tx.fetch_one("SELECT MIN(sent_seq) FROM sync_peers")[0]
+            if not seq or seq <= self.pruned_seq():
+                return 0
+            tx.execute("INSERT OR REPLACE INTO sync_meta VALUES ('pruned_seq', ?)", (str(seq),))
+            return tx.execute("DELETE FROM sync_journal WHERE seq <= ?", (seq,)).rowcount
+
+
+def pack(changes):
+    """دفعة التغييرات كـ JSON مضغوط للنقل"""
+    return gzip.compress(json.dumps(changes, ensure_ascii=False, separators=(",", ":"),
+                                    default=str).encode("utf-8"))
+
+
+def unpack(data):
+    return json.loads(gzip.decompress(data))
+
+
+def push(source, target):
+    """إرسال تغييرات source التي لم تصل إلى target. يرجع (نتيجة التطبيق، حجم الدفعة بالبايت)"""
+    sender, receiver = DeltaSync(source), DeltaSync(target)
+    changes = sender.changes(receiver.device_id, receiver.watermark(sender.device_id))
+    size = len(pack(changes))
+    result = receiver.apply(changes)
+    sender.mark_sent(receiver.device_id, changes["seq"])
+    sender.prune_journal()
+    return result, size
+
+
+def sync_databases(local, remote):
+    """مزامنة في الاتجاهين: تغييرات local أولاً (تعتمد عند التعارض) ثم تغييرات remote"""
+    return push(local, remote), push(remote, local)
@@ -0,0 +1,39 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generate  # noqa: E402
+from models import ClientModel, Database, DistributionModel  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """قاعدة بيانات فارغة بالمخطط الحالي"""
+    database = Database(str(tmp_path / "distribution.db"))
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def client_id(db):
+    """عميل بتوزيع مسدد قديم (2020-01-02) وتوزيع غير مسدد (2024-01-02)"""
+    client_id = ClientModel(db).add_client("عميل", "حي النصر", "0500000000")
+    model = DistributionModel(db)
+    model.set_price(100.0, "2020-01-01")
+    model.add_distribution(client_id, 1.0, 100.0, "2020-01-02")
+    model.add_distribution(client_id, 2.0, 0, "2024-01-02")
+    return client_id
+
+
+@pytest.fixture(scope="session")
+def generated_db(tmp_path_factory):
+    """قاعدة بيانات مولدة (ثابتة بين التشغيلات) للاختبارات التي تحتاج حجماً واقعياً"""
+    database = Database(str(tmp_path_factory.mktemp("generated") / "distribution.db"))
+    generate(database, clients=200, days=400, distributions=20000, payments=2000,
+             end_date=date(2024, 12, 31))
+    yield database
+    database.close()
@@ -0,0 +1,44 @@
+import sqlite3
+
+import pytest
+
+import archive
+from archive import archive_settled
+from models import ClientModel
+
+
+def counts(db):
+    db.attach_archive()
+    return db.fetch_one("""
+        SELECT (SELECT COUNT(*) FROM main.distributions), (SELECT COUNT(*) FROM archive.distributions)
+    """)
+
+
+def test_interrupted_move_keeps_rows_and_is_completed_by_rerun(db, client_id, monkeypatch):
+    monkeypatch.setattr(archive, "DELETE_MOVED", ("SELECT missing FROM nowhere",))
+    with pytest.raises(sqlite3.Error):
+        archive_settled(db, 30)
+    # النسخ حفظ في الأرشيف والملف الحي لم يتغير
+    assert counts(db) == (2, 1)
+    assert db.archived_through() is None
+
+    monkeypatch.undo()
+    assert archive_settled(db, 30) == (1, 0)
+    assert counts(db) == (1, 1)
+    assert db.archived_through() == "2020-01-02"
+    assert ClientModel(db).verify_balances() == []
+
+
+def test_rows_not_sent_to_a_peer_are_not_archived(db, client_id):
+    journal = "SELECT COUNT(*) FROM sync_journal WHERE tbl = 'distributions'"
+    synced = db.fetch_one("SELECT MAX(seq) FROM sync_journal")[0]
+    db.execute_query("INSERT INTO sync_peers (peer, sent_seq) VALUES ('driver', ?)", (synced,))
+    db.execute_query("UPDATE distributions SET quantity_kg = 1.0 WHERE distribution_date = '2020-01-02'")
+    before = db.fetch_one(journal)[0]
+
+    assert archive_settled(db, 30) == (0, 0)
+    assert db.fetch_one(journal)[0] == before
+
+    db.execute_query("UPDATE sync_peers SET sent_seq = (SELECT MAX(seq) FROM sync_journal)")
+    assert archive_settled(db, 30) == (1, 0)
+    assert db.fetch_one(journal)[0] == before - 2
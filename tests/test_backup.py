@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from archive import archive_settled
+from backup import BackupError, BackupManager, archive_companion
+from models import ClientModel, DistributionModel
+
+
+def counts(db):
+    """(توزيعات الملف الحي، توزيعات الأرشيف)"""
+    archived = 0
+    if db.attach_archive():
+        archived = db.fetch_one("SELECT COUNT(*) FROM archive.distributions")[0]
+    return db.fetch_one("SELECT COUNT(*) FROM main.distributions")[0], archived
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_archive_is_backed_up_and_restored_with_the_database(db, client_id, tmp_path, compress):
+    archive_settled(db, 30)
+    manager = BackupManager(db, str(tmp_path / "backups"), keep=1, compress=compress)
+    path = manager.run()
+    assert os.path.exists(archive_companion(path))
+    assert manager.backups() == [path]
+
+    DistributionModel(db).add_distribution(client_id, 3.0, 300.0, "2024-02-01")
+    archive_settled(db, 30)
+    assert counts(db) == (1, 2)
+
+    steps = []
+    manager.restore(path, lambda copied, total: steps.append((copied, total)))
+    assert counts(db) == (1, 1)
+    assert steps and steps[-1][0] == steps[-1][1]
+    assert ClientModel(db).verify_balances() == []
+
+
+def test_backup_without_archive_empties_the_current_archive(db, client_id, tmp_path):
+    manager = BackupManager(db, str(tmp_path / "backups"))
+    path = manager.run()
+    assert not os.path.exists(archive_companion(path))
+
+    archive_settled(db, 30)
+    safety = manager.restore(path)
+    assert counts(db) == (2, 0)
+    # نسخة الأمان تحمل الأرشيف الذي استبدل
+    assert os.path.exists(archive_companion(safety))
+
+
+def test_damaged_archive_stops_the_restore(db, client_id, tmp_path):
+    archive_settled(db, 30)
+    manager = BackupManager(db, str(tmp_path / "backups"))
+    path = manager.run()
+    with open(archive_companion(path), "r+b") as f:
+        f.write(b"not a database")
+
+    DistributionModel(db).add_distribution(client_id, 3.0, 0, "2024-02-01")
+    for chosen in (path, archive_companion(path)):
+        with pytest.raises(BackupError):
+            manager.restore(chosen)
+    assert counts(db) == (2, 1)
+
+
+def test_prune_removes_the_archive_with_its_backup(db, client_id, tmp_path):
+    archive_settled(db, 30)
+    manager = BackupManager(db, str(tmp_path / "backups"), keep=1)
+    old = manager.run()
+    older = os.path.join(manager.directory, "distribution-20000101-000000.db")
+    os.rename(old, older)
+    os.rename(archive_companion(old), archive_companion(older))
+    path = manager.run()
+    assert sorted(os.listdir(manager.directory)) == sorted(
+        os.path.basename(name) for name in (path, archive_companion(path)))
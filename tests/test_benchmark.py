@@ -0,0 +1,35 @@
+def test_generated_payments_are_allocated(generated_db):
+    """الدفعات المولدة موزعة على التوزيعات فتنقص الأرصدة كما في PaymentModel.add_payment"""
+    allocated, applied = generated_db.fetch_one("""
+        SELECT (SELECT TOTAL(amount) FROM payment_allocations),
+               (SELECT TOTAL(amount) FROM payments)
+    """)
+    assert allocated > 0
+    assert allocated <= applied + 0.01
+    assert generated_db.fetch_one("""
+        SELECT COUNT(*) FROM payment_allocations a JOIN payments p ON p.id = a.payment_id
+        JOIN distributions d ON d.id = a.distribution_id WHERE d.client_id != p.client_id
+    """)[0] == 0
+    assert generated_db.fetch_one(
+        "SELECT COUNT(*) FROM distributions WHERE remaining_amount < 0 OR remaining_amount > total_amount + 0.005"
+    )[0] == 0
+    assert not generated_db.fetch_one("SELECT 1 FROM client_balances WHERE balance < -0.005")
+
+
+def test_generated_balances_match_ledger(generated_db):
+    from models import ClientModel, DistributionModel
+    assert ClientModel(generated_db).verify_balances() == []
+    assert DistributionModel(generated_db).verify_daily_totals() == []
+
+
+def test_every_public_method_is_benchmarked(generated_db, tmp_path):
+    from benchmark import benchmark_calls, public_methods
+    from models import Database
+    # benchmark_calls يضيف بيانات، فيعمل على نسخة
+    generated_db.backup(str(tmp_path / "copy.db"))
+    db = Database(str(tmp_path / "copy.db"))
+    try:
+        calls = benchmark_calls(db, str(tmp_path))
+        assert sorted(set(public_methods()) - set(calls)) == []
+    finally:
+        db.close()
@@ -0,0 +1,17 @@
+from models import ClientModel
+
+
+def test_updating_a_deactivated_client_keeps_it_out_of_search(db):
+    clients = ClientModel(db)
+    clients.load_search_index()
+    client_id = clients.add_client("سالم", "حي النصر", "0500000000")
+    assert [row[0] for row in clients.search_clients("سالم")] == [client_id]
+
+    clients.delete_client(client_id)
+    clients.update_client(client_id, "سالم العتيبي", "حي النصر", "0500000001")
+    assert clients.search_clients("سالم") == []
+    assert clients.get_client_by_id(client_id)[1] == "سالم العتيبي"
+
+    active = clients.add_client("سالم", "حي الملز", "0500000002")
+    clients.update_client(active, "سالم الجديد", "حي الملز", "0500000002")
+    assert [row[0] for row in clients.search_clients("سالم الجديد")] == [active]
@@ -0,0 +1,28 @@
+import csv
+
+import pytest
+
+from archive import archive_settled
+from export import EXPORTS, export_report
+
+
+def read_csv(path):
+    with open(path, encoding="utf-8-sig") as f:
+        return list(csv.reader(f))
+
+
+@pytest.mark.parametrize("archived", [False, True])
+@pytest.mark.parametrize("kind", sorted(EXPORTS))
+def test_every_export_kind_runs(db, client_id, tmp_path, kind, archived):
+    if archived:
+        assert archive_settled(db, 30) == (1, 0)
+    path = str(tmp_path / f"{kind}.csv")
+    written = export_report(db, kind, path, start="2019-01-01", end="2024-12-31", client_id=client_id)
+    assert len(read_csv(path)) == written + 1
+
+
+def test_distributions_export_includes_archive(db, client_id, tmp_path):
+    archive_settled(db, 30)
+    path = str(tmp_path / "all.csv")
+    assert export_report(db, "distributions", path, start="2019-01-01", end="2024-12-31") == 2
+    assert [row[1] for row in read_csv(path)[1:]] == ["2020-01-02", "2024-01-02"]
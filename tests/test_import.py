@@ -0,0 +1,21 @@
+from models import ClientModel, DistributionModel, Validators
+
+
+def test_validate_number_rejects_non_finite():
+    assert Validators.validate_number("12.5")
+    for value in ("nan", "NaN", "inf", "-inf", "Infinity", "abc", ""):
+        assert not Validators.validate_number(value)
+
+
+def test_import_rejects_nan_and_inf(db, tmp_path):
+    client_id = ClientModel(db).add_client("عميل", "حي", "0500000000")
+    model = DistributionModel(db)
+    model.set_price(100.0, "2024-01-01")
+    path = tmp_path / "import.csv"
+    path.write_text(f"client,quantity\n{client_id},nan\n{client_id},10,inf\n{client_id},10,0,2024-01-01\n", encoding="utf-8")
+
+    imported, rejected = model.import_distributions_csv(str(path))
+
+    assert imported == 1
+    assert [line for line, _, _ in rejected] == [2, 3]
+    assert db.fetch_one("SELECT TOTAL(quantity_kg), TOTAL(total_amount) FROM distributions") == (10.0, 1000.0)
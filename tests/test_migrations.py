@@ -0,0 +1,89 @@
+import sqlite3
+
+from models import ClientModel, Database
+
+# مخطط الإصدار الأول (قبل الترحيلات)
+LEGACY_SCHEMA = """
+    CREATE TABLE clients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, address TEXT, phone TEXT,
+        created_date DATE, is_active BOOLEAN DEFAULT TRUE
+    );
+    CREATE TABLE product_prices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, price_date DATE UNIQUE, price_per_kg REAL NOT NULL
+    );
+    CREATE TABLE distributions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, distribution_date DATE,
+        quantity_kg REAL, price_per_kg REAL, total_amount REAL, paid_amount REAL,
+        remaining_amount REAL, FOREIGN KEY (client_id) REFERENCES clients(id)
+    );
+    CREATE TABLE payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, payment_date DATE, amount REAL,
+        payment_method TEXT, description TEXT, distribution_id INTEGER,
+        FOREIGN KEY (client_id) REFERENCES clients(id)
+    );
+    INSERT INTO clients (name, created_date) VALUES ('عميل', '2024-01-01');
+    -- توزيع بمبلغ 100 دفع منه 20 عند التسليم
+    INSERT INTO distributions
+        (client_id, distribution_date, quantity_kg, price_per_kg, total_amount, paid_amount,
+         remaining_amount)
+    VALUES (1, '2024-01-02', 1, 100, 100, 20, 80),
+           (1, '2024-01-03', 1, 100, 100, 0, 100);
+"""
+
+# الدفعات القديمة تنقص المتبقي فقط (حتى الصفر)
+LEGACY_PAYMENTS = """
+    INSERT INTO payments (client_id, payment_date, amount, distribution_id)
+    VALUES (1, '2024-01-05', 50, 1), (1, '2024-01-06', 150, 2), (1, '2024-01-07', 40, NULL);
+    UPDATE distributions SET remaining_amount = 30 WHERE id = 1;
+    UPDATE distributions SET remaining_amount = 0 WHERE id = 2;
+"""
+
+
+def legacy_db(path, script):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA + LEGACY_PAYMENTS + script)
+    conn.close()
+    return Database(path)
+
+
+def distributions(db):
+    return db.fetch_all("""
+        SELECT d.id, d.paid_amount, d.remaining_amount,
+               (SELECT TOTAL(amount) FROM payment_allocations WHERE distribution_id = d.id)
+        FROM distributions d ORDER BY d.id
+    """)
+
+
+def assert_statement_matches_ledger(db):
+    clients = ClientModel(db)
+    assert clients.verify_balances() == []
+    # الدفعة غير المرتبطة (40) والزيادة في الدفعة الثانية (50) رصيد دائن خارج الدفتر
+    closing = clients.get_client_statement(1)[-1][6]
+    assert (clients.get_client_balance(1), closing) == (30.0, -60.0)
+
+
+def test_legacy_payments_are_allocated_as_applied(tmp_path):
+    db = legacy_db(str(tmp_path / "distribution.db"), "")
+    assert distributions(db) == [(1, 70.0, 30.0, 50.0), (2, 100.0, 0.0, 100.0)]
+    assert_statement_matches_ledger(db)
+    db.close()
+
+
+def test_databases_migrated_before_the_fix_are_repaired(tmp_path):
+    path = str(tmp_path / "distribution.db")
+    db = legacy_db(path, "")
+    db.close()
+    # حالة قاعدة رحلت بالترحيل 5 القديم: الدفعات بكامل مبلغها والمدفوع دون تغيير
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        DELETE FROM payment_allocations;
+        INSERT INTO payment_allocations VALUES (1, 1, 50), (2, 2, 150);
+        UPDATE distributions SET paid_amount = 20 WHERE id = 1;
+        UPDATE distributions SET paid_amount = 0 WHERE id = 2;
+        PRAGMA user_version = 9;
+    """)
+    conn.close()
+    db = Database(path)
+    assert distributions(db) == [(1, 70.0, 30.0, 50.0), (2, 100.0, 0.0, 100.0)]
+    assert_statement_matches_ledger(db)
+    db.close()
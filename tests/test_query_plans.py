@@ -0,0 +1,20 @@
+import pytest
+
+from query_plans import QueryPlanError, capture_plans, check_query_plans, full_scans
+
+
+def test_model_queries_use_indexes(generated_db):
+    """كل استعلامات النماذج تستخدم فهرساً (EXPLAIN QUERY PLAN بدون مسح كامل)"""
+    check_query_plans(generated_db)
+
+
+def test_full_scan_raises(generated_db, monkeypatch):
+    """المسح الكامل يرفع QueryPlanError ولا يعتمد على assert (يعمل مع python -O)"""
+    with capture_plans(generated_db) as plans:
+        generated_db.fetch_all("SELECT id FROM clients WHERE phone LIKE '%5'")
+    assert full_scans(*plans[0])
+    assert "fetch_all" not in vars(generated_db)
+
+    monkeypatch.setattr("query_plans.full_scans", lambda query, plan: ["SCAN clients"])
+    with pytest.raises(QueryPlanError, match="Full table scans"):
+        check_query_plans(generated_db)
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+
+import pytest
+
+import server as server_module
+
+from export import export_report
+from models import ClientModel, Database, DistributionModel
+from remote import RemoteClientModel, RemoteDatabase, RemoteDistributionModel, RemoteError
+from server import ModelServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    """خادم على منفذ عشوائي في localhost يعمل في حلقة asyncio بخيط مستقل"""
+    path = str(tmp_path / "server.db")
+    seed = Database(path)
+    client_id = ClientModel(seed).add_client("عميل الخادم", "حي النصر", "0500000000")
+    model = DistributionModel(seed)
+    model.set_price(100.0, "2024-01-01")
+    for day in range(1, 6):
+        model.add_distribution(client_id, 10.0, 0, f"2024-01-0{day}")
+    seed.close()
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    instance = ModelServer(path, port=0, token="secret")
+    asyncio.run_coroutine_threadsafe(instance.start(), loop).result(10)
+    instance.client_id = client_id
+    yield instance
+    asyncio.run_coroutine_threadsafe(instance.stop(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    loop.close()
+
+
+@pytest.fixture
+def remote(server):
+    db = RemoteDatabase(f"http://127.0.0.1:{server.port}", token="secret")
+    assert db.login("admin", "admin123")
+    yield db
+    db.close()
+
+
+def test_read_and_write(server, remote):
+    clients = RemoteClientModel(remote)
+    client = clients.get_client_by_id(server.client_id)
+    assert client[1] == "عميل الخادم"
+
+    before = remote.data_version("distributions")
+    distribution_id = RemoteDistributionModel(remote).add_distribution(server.client_id, 2.5, 0, "2024-01-06")
+    assert isinstance(distribution_id, int)
+    assert remote.data_version("distributions") != before
+    assert clients.get_client_balance(server.client_id) == pytest.approx(5 * 1000.0 + 250.0)
+
+
+def test_export_stream(server, remote, tmp_path):
+    path = str(tmp_path / "export.csv")
+    written = export_report(remote, "distributions", path, start="2024-01-01", end="2024-01-31")
+    assert written == 5
+    with open(path, encoding="utf-8-sig") as f:
+        assert len(f.read().splitlines()) == 6
+
+
+def test_rejects_calls_outside_the_whitelist(remote):
+    with pytest.raises(RemoteError, match="unknown operation"):
+        remote.call("ClientModel", "_insert", 1)
+    with pytest.raises(RemoteError, match="unknown operation"):
+        remote.call("Database", "execute_query", "DELETE FROM clients")
+    with pytest.raises(RemoteError, match="unknown operation"):
+        remote.call("ClientModel", "index")
+
+
+def test_import_sends_lines_and_never_a_server_path(server, remote, tmp_path):
+    path = tmp_path / "import.csv"
+    path.write_text(f"{server.client_id},3,0,2024-01-07\nعميل مجهول,1,0\n", encoding="utf-8")
+    imported, rejected = RemoteDistributionModel(remote).import_distributions_csv(str(path))
+    assert (imported, [line for line, _, _ in rejected]) == (1, [2])
+
+    with pytest.raises(RemoteError, match="unknown operation"):
+        remote.call("DistributionModel", "import_distributions_csv", str(path))
+    with pytest.raises(RemoteError, match="قائمة نصوص"):
+        remote.call("DistributionModel", "import_distributions_lines", str(path))
+
+
+def test_rejects_missing_token(server):
+    db = RemoteDatabase(f"http://127.0.0.1:{server.port}")
+    try:
+        with pytest.raises(RemoteError):
+            db.call("ClientModel", "get_all_clients")
+    finally:
+        db.close()
+
+
+def test_calls_need_a_login_session(server):
+    db = RemoteDatabase(f"http://127.0.0.1:{server.port}", token="secret")
+    try:
+        assert db.connection.request("GET", "/health") == {"status": "ok"}
+        with pytest.raises(RemoteError, match="login required"):
+            db.call("PaymentModel", "add_payment", server.client_id, 10.0, "نقدي", "")
+        with pytest.raises(RemoteError, match="login required"):
+            db.table_versions()
+        assert db.login("admin", "wrong") is None
+        with pytest.raises(RemoteError, match="login required"):
+            db.call("ClientModel", "get_all_clients")
+        assert db.login("admin", "admin123")[1] == "admin"
+        assert db.call("ClientModel", "get_all_clients")
+    finally:
+        db.close()
+
+
+def test_too_large_body_gets_413(server, remote, monkeypatch):
+    monkeypatch.setattr(server_module, "MAX_BODY", 1000)
+    with pytest.raises(RemoteError, match="body too large"):
+        remote.call("ClientModel", "search_clients", "x" * 5000)
+    # اتصال جديد بعد إغلاق الخادم للاتصال السابق
+    assert remote.call("ClientModel", "get_client_by_id", server.client_id)
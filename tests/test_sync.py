@@ -0,0 +1,98 @@
+import pytest
+
+from models import ClientModel, Database, DistributionModel, PaymentModel
+from sync import sync_databases
+
+
+@pytest.fixture
+def driver(tmp_path):
+    """نسخة السائق (قاعدة منفصلة بجهاز مختلف)"""
+    database = Database(str(tmp_path / "driver.db"))
+    yield database
+    database.close()
+
+
+def distribution_row(db, client_name):
+    return db.fetch_one("""
+        SELECT d.id, d.paid_amount, d.remaining_amount,
+               (SELECT TOTAL(amount) FROM payment_allocations WHERE distribution_id = d.id)
+        FROM distributions d JOIN clients c ON c.id = d.client_id
+        WHERE c.name = ?
+    """, (client_name,))
+
+
+def client_id(db, name):
+    return db.fetch_one("SELECT id FROM clients WHERE name = ?", (name,))[0]
+
+
+def test_offline_payments_on_both_devices_are_merged(db, driver):
+    client = ClientModel(db).add_client("عميل", "حي النصر", "0500000000")
+    model = DistributionModel(db)
+    model.set_price(100.0, "2020-01-01")
+    model.add_distribution(client, 1.0, 10.0, "2024-01-02")
+    sync_databases(db, driver)
+
+    for database, amount in ((driver, 50.0), (db, 30.0)):
+        distribution_id = distribution_row(database, "عميل")[0]
+        PaymentModel(database).add_payment(client_id(database, "عميل"), amount, "نقدي", "",
+                                           distribution_id)
+    sync_databases(driver, db)
+
+    for database in (db, driver):
+        _, paid, remaining, allocated = distribution_row(database, "عميل")
+        assert (paid, remaining, allocated) == (90.0, 10.0, 80.0)
+        payments = database.fetch_one("SELECT TOTAL(amount) FROM payments")[0]
+        assert payments == 80.0
+        assert ClientModel(database).verify_balances() == []
+
+
+def test_overpaid_distribution_is_reported_as_conflict(db, driver):
+    client = ClientModel(db).add_client("عميل", "حي النصر", "0500000000")
+    model = DistributionModel(db)
+    model.set_price(100.0, "2020-01-01")
+    model.add_distribution(client, 1.0, 0, "2024-01-02")
+    sync_databases(db, driver)
+
+    for database, amount in ((driver, 60.0), (db, 70.0)):
+        distribution_id = distribution_row(database, "عميل")[0]
+        PaymentModel(database).add_payment(client_id(database, "عميل"), amount, "نقدي", "",
+                                           distribution_id)
+    (sent, _), (received, _) = sync_databases(driver, db)
+
+    assert [table for table, _ in sent["conflicts"]] == ["distributions"]
+    assert [table for table, _ in received["conflicts"]] == ["distributions"]
+    for database in (db, driver):
+        _, paid, remaining, allocated = distribution_row(database, "عميل")
+        assert (paid, remaining, allocated) == (130.0, 0, 130.0)
+        # الزيادة رصيد دائن في كشف الحساب لا يظهر في الدفتر
+        assert ClientModel(database).verify_balances() == [(client_id(database, "عميل"), 0, -30.0)]
+
+
+def test_journal_is_pruned_and_new_device_gets_all_rows(db, driver, tmp_path):
+    client = ClientModel(db).add_client("عميل", "حي النصر", "0500000000")
+    model = DistributionModel(db)
+    model.set_price(100.0, "2020-01-01")
+    model.add_distribution(client, 1.0, 10.0, "2024-01-02")
+    sync_databases(db, driver)
+    PaymentModel(driver).add_payment(client_id(driver, "عميل"), 50.0, "نقدي", "",
+                                     distribution_row(driver, "عميل")[0])
+    sync_databases(driver, db)
+
+    # كل التغييرات وصلت إلى الجهاز الوحيد المعروف
+    for database in (db, driver):
+        assert database.fetch_one("SELECT COUNT(*) FROM sync_journal")[0] == 0
+
+    depot = Database(str(tmp_path / "depot.db"))
+    try:
+        sync_databases(db, depot)
+        _, paid, remaining, allocated = distribution_row(depot, "عميل")
+        assert (paid, remaining, allocated) == (60.0, 40.0, 50.0)
+        assert ClientModel(depot).verify_balances() == []
+        # الجهاز driver لم يستلم بعد ما أرسل إلى depot فلا يحذف من السجل
+        ClientModel(db).add_client("عميل ٢", "حي النصر", "0500000001")
+        sync_databases(db, depot)
+        assert db.fetch_one("SELECT COUNT(*) FROM sync_journal")[0] > 0
+        sync_databases(db, driver)
+        assert db.fetch_one("SELECT COUNT(*) FROM sync_journal")[0] == 0
+    finally:
+        depot.close()
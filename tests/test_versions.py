@@ -0,0 +1,23 @@
+from models import ClientModel, Database, DistributionModel
+
+
+def test_writes_from_another_process_are_seen(db):
+    model = DistributionModel(db)
+    model.set_price(100.0, "2024-01-01")
+    assert model.get_price_on("2024-02-01") == 100.0
+    before = db.data_version("product_prices")
+
+    # اتصال مستقل بنفس الملف (مثل cli set-price أثناء عمل البرنامج)
+    other = Database(db.db_name)
+    DistributionModel(other).set_price(120.0, "2024-02-01")
+    other.close()
+
+    assert db.data_version("product_prices") != before
+    assert model.get_price_on("2024-02-01") == 120.0
+
+
+def test_own_writes_are_not_counted_as_external(db):
+    external = db.external_version()
+    ClientModel(db).add_client("عميل", "حي النصر", "0500000000")
+    DistributionModel(db).set_price(100.0, "2024-01-01")
+    assert db.external_version() == external